@@ -143,3 +143,19 @@ def admin_stats(db: Session = Depends(get_db), _admin = Depends(get_current_acti
         "total_payments_amount": float(total_payments),
         "recent_credential_history": recent_activities,
     }
+
+
+# ----------------
+# Tick-to-signal latency
+# ----------------
+@router.get("/latency")
+def admin_latency(_admin = Depends(get_current_active_superuser)):
+    from app import latency
+    return {"unit": "microseconds", "stages": latency.snapshot()}
+
+
+@router.post("/latency/reset")
+def admin_latency_reset(_admin = Depends(get_current_active_superuser)):
+    from app import latency
+    latency.reset()
+    return {"ok": True}
@@ -1673,7 +1673,9 @@ from fastapi.responses import RedirectResponse
 from pathlib import Path
 import logging
 import os
+import time
 import asyncio
+import threading
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 from datetime import datetime, timedelta
@@ -1708,6 +1710,12 @@ except Exception:
     get_latest_ticks = None
     kite_ticker = None
 
+try:
+    from ..candle_engine import CandleEngine, interval_seconds
+except Exception:
+    CandleEngine = None
+    interval_seconds = None
+
 # other internal imports (defensive)
 try:
     from ..strategy import StrategyEngine
@@ -1903,6 +1911,14 @@ def last_signals():
     return om.get_signals() if om and hasattr(om, "get_signals") else {}
 
 
+@router.get("/signal_pipeline/metrics")
+def signal_pipeline_metrics():
+    om = OrderManager.instance() if OrderManager else None
+    if not om or not hasattr(om, "pipeline_metrics"):
+        raise HTTPException(status_code=500, detail="Order manager not available")
+    return om.pipeline_metrics()
+
+
 def _ensure_strategy_engine():
     """
     Try to dynamically import StrategyEngine if module-level import failed earlier.
@@ -2029,19 +2045,50 @@ def instruments_list(q: Optional[str] = None):
 
 @router.post("/models/activate")
 def activate_model(payload: Dict[str, Any]):
+    """
+    Load a model version in the background and swap it in once validated and warmed up.
+    payload: {"model_id": <ml_models id>} | {"filename": "<file under app/storage>"} | {"latest": true}
+    "wait": false returns immediately (the current model keeps serving until the swap).
+    """
+    if ml_model is None or not hasattr(ml_model, "load_version"):
+        raise HTTPException(status_code=500, detail="ML loader not available")
+
+    wait = bool(payload.get("wait", True))
     fn = payload.get("filename")
-    latest = payload.get("latest", False)
-    if latest or not fn:
-        if hasattr(ml_model, "load_latest"):
-            m = ml_model.load_latest()
-            return {"status": "ok", "loaded": getattr(ml_model, "model_path", None)}
+    model_id = payload.get("model_id")
+    try:
+        if model_id is not None:
+            fut = ml_model.load_version(int(model_id), wait=False)
+        elif fn and not payload.get("latest", False):
+            fut = ml_model.load(str((STORAGE_DIR / fn).resolve()), wait=False)
         else:
-            raise HTTPException(status_code=500, detail="ML loader not available")
-    candidate = (STORAGE_DIR / fn).resolve()
-    if hasattr(ml_model, "load"):
-        ml_model.load(str(candidate))
-        return {"status": "ok", "loaded": getattr(ml_model, "model_path", None)}
-    raise HTTPException(status_code=500, detail="ML loader not available")
+            fut = ml_model.load_latest(wait=False)
+        if not wait:
+            return {"status": "loading", "active": getattr(ml_model, "model_path", None)}
+        v = fut.result()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"model rejected: {e}")
+    return {"status": "ok", "loaded": getattr(ml_model, "model_path", None), "version": v.info()}
+
+
+@router.post("/models/rollback")
+def rollback_model():
+    if ml_model is None or not hasattr(ml_model, "rollback"):
+        raise HTTPException(status_code=500, detail="ML loader not available")
+    try:
+        return {"status": "ok", "version": ml_model.rollback()}
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/models/registry")
+def model_registry_versions():
+    """Versions held in memory: schema, load / warm-up time, live inference latency."""
+    if ml_model is None or not hasattr(ml_model, "versions"):
+        raise HTTPException(status_code=500, detail="ML loader not available")
+    return {"versions": ml_model.versions()}
 
 
 @router.post("/retrain_manual")
@@ -2065,9 +2112,52 @@ def get_sentiment(ticker: str):
     return {"ticker": s.ticker, "score": s.score, "fetched_at": s.fetched_at.isoformat()}
 
 
+@router.get("/sentiment_cache/stats")
+def sentiment_cache_stats():
+    from ..sentiment_cache import SentimentCache
+    return SentimentCache.instance().stats()
+
+
 # -------------------------
 # Candles (historical endpoint used by frontend)
 # -------------------------
+# (instrument_token, interval seconds) backfilled into CandleEngine; the sync route runs in the
+# threadpool, so these are guarded by _candles_seed_lock
+_candles_seeded = set()
+_candles_seeding = set()
+_candles_seed_retry_at: Dict[Any, float] = {}  # failed / empty backfill -> monotonic retry time
+_candles_seed_lock = threading.Lock()
+CANDLES_SEED_RETRY_SECS = 60.0
+
+
+def _seed_candles(engine, instrument_token: int, sec: int, symbol) -> bool:
+    """Backfill the engine from kite historical once per (token, interval); True once seeded."""
+    key = (instrument_token, sec)
+    with _candles_seed_lock:
+        if key in _candles_seeded:
+            return True
+        if key in _candles_seeding or time.monotonic() < _candles_seed_retry_at.get(key, 0.0):
+            return False
+        _candles_seeding.add(key)
+    added = 0
+    try:
+        kite_interval = "minute" if sec == 60 else f"{sec // 60}minute"
+        hist = kite_client.kite.historical_data(instrument_token, datetime.utcnow() - timedelta(days=7), datetime.utcnow(), interval=kite_interval) or []
+        added = engine.seed(instrument_token, sec, hist)
+        log.info("Seeded %d %ss candles for %s from kite historical", added, sec, symbol)
+    except Exception as e:
+        log.warning("Failed to seed candles for %s: %s", symbol, e)
+    finally:
+        with _candles_seed_lock:
+            _candles_seeding.discard(key)
+            if added:
+                _candles_seeded.add(key)
+                _candles_seed_retry_at.pop(key, None)
+            else:
+                _candles_seed_retry_at[key] = time.monotonic() + CANDLES_SEED_RETRY_SECS
+    return bool(added)
+
+
 @router.get("/candles")
 def get_candles(symbol: str = Query(..., description="tradingsymbol or instrument token"),
                 interval: str = Query("1minute", description="interval like 1minute, 5minute, day"),
@@ -2083,6 +2173,22 @@ def get_candles(symbol: str = Query(..., description="tradingsymbol or instrumen
         except Exception:
             instrument_token = None
 
+        # live candles from the streamer's CandleEngine (backfilled once from kite historical)
+        engine = CandleEngine.instance() if CandleEngine and instrument_token else None
+        if engine is not None and engine.supports(interval):
+            sec = interval_seconds(interval)
+            have_kite = bool(getattr(kite_client, "kite", None))
+            seeded = False
+            if have_kite and engine.bar_count(instrument_token, sec) < limit:
+                seeded = _seed_candles(engine, instrument_token, sec, symbol)
+            bars = engine.history(instrument_token, sec, limit)
+            # not backfilled yet (kite failed / empty): only a full window is served from memory,
+            # a partial one falls through to the kite historical path below
+            if bars and (seeded or len(bars) >= limit or not have_kite):
+                out = [{"t": b["time"] * 1000, "o": b["open"], "h": b["high"], "l": b["low"], "c": b["close"], "v": b["volume"]}
+                       for b in bars]
+                return {"ok": True, "candles": out, "source": "memory"}
+
         candles = []
         if instrument_token and getattr(kite_client, "kite", None):
             try:
@@ -28,3 +28,26 @@ async def ws_signals(websocket: WebSocket):
         print("Signals WS disconnected")
     except Exception as e:
         print("Signals WS error:", e)
+
+
+@router.websocket("/ws/stream")
+async def ws_stream(websocket: WebSocket):
+    """
+    Live Kite ticks/candles via the streamer broadcast hub (snapshot first, then deltas).
+    Send {"op":"subscribe","tokens":[...],"channels":["tick","candle"]} to narrow the stream.
+    ?format=struct|msgpack switches tick/candle frames to a binary encoding (see app/wire.py).
+    """
+    from app import streamer
+    from app.wire import negotiate
+    await websocket.accept()
+    streamer.add_frontend_client(websocket, negotiate(websocket.query_params))
+    try:
+        while True:
+            text = await websocket.receive_text()
+            streamer.handle_frontend_message(websocket, text)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print("Stream WS error:", e)
+    finally:
+        streamer.remove_frontend_client(websocket)
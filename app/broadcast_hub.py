@@ -0,0 +1,548 @@
+# app/broadcast_hub.py
+"""
+Broadcast hub for streamer frontend clients (runs on the FastAPI event loop).
+
+streamer.on_tick used to call run_coroutine_threadsafe once per client per tick. Now:
+ - the Kite thread serializes each payload once and calls publish_threadsafe(frames) once
+   per tick frame (a single call_soon_threadsafe handoff)
+ - on the loop, _fanout puts the prebuilt frames on the Outbox of every client interested in
+   the frame's (token, channel); each client is sent the frame in its negotiated wire format
+   (see wire.py: json by default, struct / msgpack binary opt-in)
+ - each client has its own sender task, so sockets are written concurrently and one slow
+   socket never delays the others
+ - new clients first get a snapshot frame (full candle history); ticks afterwards carry only
+   the current candle (delta)
+
+Subscriptions (same protocol for the streamer socket and ws_broadcast.ws_handler):
+  {"op": "subscribe",   "tokens": [...], "channels": ["tick", "candle", "signal"]}
+  {"op": "unsubscribe", "tokens": [...]}            (no tokens = everything)
+  {"op": "snapshot",    "tokens": [...]}            (candle history again)
+ - a client that never subscribes gets every token (legacy behaviour); the first subscribe
+   with tokens switches it to the tokens it asked for (a channels-only subscribe just narrows
+   the channels of the firehose)
+ - channels: tick (live tick + building candle), candle (closed candles + history snapshot),
+   signal (strategy signals from ws_broadcast)
+ - TokenDemand reference-counts tokens across all clients and calls streamer.subscribe /
+   streamer.unsubscribe so Kite subscriptions follow demand (tokens subscribed through the
+   REST API are pinned and never removed by it, also when the REST subscribe came after a
+   client asked for the token)
+
+Slow consumers (Outbox):
+ - conflation: a tick / signal frame for a token replaces the one still pending for the same
+   (channel, token), keeping its place in the queue, so a lagging client gets the latest value
+   instead of a growing backlog
+ - everything else (closed candles, snapshots, orders, wallet updates) is never conflated and
+   is delivered in order
+ - a client whose non-conflated backlog exceeds WS_CLIENT_QUEUE_MAX frames, or whose oldest
+   unsent frame is older than WS_SLOW_CLIENT_SECS, is disconnected (close code 1013, "try again
+   later"). The check runs in a periodic reaper task (at most every second), never inside a
+   fan-out, so a full-universe tick frame cannot evict a client before its sender has run
+
+Config via .env:
+  WS_CLIENT_QUEUE_MAX (default 256) - pending non-conflated frames per client before it is disconnected
+  WS_SLOW_CLIENT_SECS (default 10) - max age of the oldest pending frame
+  WS_CONFLATE (default true) - conflate tick / signal frames per token
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import latency
+from .wire import DEFAULT_FORMAT, WireFrame
+
+log = logging.getLogger("app.broadcast_hub")
+
+CLIENT_QUEUE_MAX = int(os.getenv("WS_CLIENT_QUEUE_MAX", "256"))
+SLOW_CLIENT_SECS = float(os.getenv("WS_SLOW_CLIENT_SECS", "10"))
+CONFLATE = os.getenv("WS_CONFLATE", "true").lower() in ("1", "true", "yes")
+
+CHANNELS = ("tick", "candle", "signal")
+CONFLATABLE_CHANNELS = ("tick", "signal")
+
+# (token or None, channel or None, frame); None token/channel = deliver to everyone
+Frame = Tuple[Optional[int], Optional[str], WireFrame]
+
+
+def norm_token(token) -> Optional[int]:
+    try:
+        return int(token)
+    except Exception:
+        return None
+
+
+# ---------------------------
+# Subscriptions
+# ---------------------------
+class Subscription:
+    """What one socket wants to receive."""
+    __slots__ = ("tokens", "channels", "all_tokens")
+
+    def __init__(self):
+        self.tokens: Set[int] = set()
+        self.channels: Set[str] = set(CHANNELS)
+        self.all_tokens = True  # until the first subscribe op
+
+    def wants(self, token: Optional[int], channel: Optional[str]) -> bool:
+        if channel is not None and channel not in self.channels:
+            return False
+        return token is None or self.all_tokens or token in self.tokens
+
+    def apply(self, msg: Dict[str, Any]) -> Tuple[List[int], List[int]]:
+        """Apply a subscribe/unsubscribe op; returns (added_tokens, removed_tokens)."""
+        op = (msg.get("op") or "").lower()
+        tokens = [t for t in (norm_token(x) for x in (msg.get("tokens") or [])) if t is not None]
+        if op == "subscribe":
+            channels = msg.get("channels")
+            if channels:
+                self.channels = {c for c in channels if c in CHANNELS}
+            if tokens:
+                self.all_tokens = False  # channels-only subscribe keeps the firehose on those channels
+            added = [t for t in dict.fromkeys(tokens) if t not in self.tokens]
+            self.tokens.update(added)
+            return added, []
+        if op == "unsubscribe":
+            self.all_tokens = False
+            removed = [t for t in dict.fromkeys(tokens) if t in self.tokens] if tokens else list(self.tokens)
+            self.tokens.difference_update(removed)
+            return [], removed
+        return [], []
+
+
+def parse_op(text: str) -> Optional[Dict[str, Any]]:
+    """Client control message -> dict with an "op" key, or None for anything else (pings etc.)."""
+    try:
+        msg = json.loads(text)
+    except Exception:
+        return None
+    if isinstance(msg, dict) and msg.get("op") in ("subscribe", "unsubscribe", "snapshot"):
+        return msg
+    return None
+
+
+def _default_kite_subscribe(tokens: List[int]):
+    from .streamer import subscribe
+    subscribe(tokens, pin=False)
+
+
+def _default_kite_unsubscribe(tokens: List[int]):
+    from .streamer import unsubscribe
+    unsubscribe(tokens)
+
+
+def _default_kite_subscribed() -> Set[int]:
+    from .streamer import pinned_tokens
+    return pinned_tokens()
+
+
+class TokenDemand:
+    """Reference counts of tokens across all frontend sockets -> Kite subscribe/unsubscribe."""
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, on_first: Callable = _default_kite_subscribe, on_last: Callable = _default_kite_unsubscribe,
+                 already_subscribed: Callable = _default_kite_subscribed):
+        self.on_first = on_first
+        self.on_last = on_last
+        self.already_subscribed = already_subscribed
+        self._counts: Dict[int, int] = {}
+        self._owned: Set[int] = set()  # tokens we subscribed on Kite (and may unsubscribe)
+
+    def acquire(self, tokens: Iterable[int]):
+        new = []
+        for t in tokens:
+            c = self._counts.get(t, 0)
+            self._counts[t] = c + 1
+            if c == 0:
+                new.append(t)
+        if not new:
+            return
+        try:
+            external = self.already_subscribed()
+        except Exception:
+            external = set()
+        owned = [t for t in new if t not in external]
+        if owned:
+            self._owned.update(owned)
+            try:
+                self.on_first(owned)
+            except Exception:
+                log.exception("TokenDemand: subscribe failed for %s", owned)
+
+    def release(self, tokens: Iterable[int]):
+        gone = []
+        for t in tokens:
+            c = self._counts.get(t, 0)
+            if c <= 1:
+                self._counts.pop(t, None)
+                if t in self._owned:
+                    self._owned.discard(t)
+                    gone.append(t)
+            else:
+                self._counts[t] = c - 1
+        if gone:
+            # re-check: a REST subscribe after our acquire pins the token on Kite
+            try:
+                external = self.already_subscribed()
+            except Exception:
+                external = set()
+            gone = [t for t in gone if t not in external]
+        if gone:
+            try:
+                self.on_last(gone)
+            except Exception:
+                log.exception("TokenDemand: unsubscribe failed for %s", gone)
+
+    def counts(self) -> Dict[int, int]:
+        return dict(self._counts)
+
+
+# ---------------------------
+# Per-client outbound queue
+# ---------------------------
+class Outbox:
+    """
+    FIFO of pending frames for one socket (loop thread only). Frames with a conflation key
+    overwrite the pending frame with the same key in place; keyless frames are always appended.
+    """
+    __slots__ = ("conflate", "conflated", "_items", "_pending", "_event", "_backlog")
+
+    def __init__(self, conflate: bool = CONFLATE):
+        self.conflate = conflate
+        self.conflated = 0
+        self._items: deque = deque()  # [key, frame, stamp, enqueued_at]
+        self._pending: Dict[Any, list] = {}
+        self._event = asyncio.Event()
+        self._backlog = 0  # pending frames that can never be conflated away
+
+    def put(self, frame: WireFrame, key=None, stamp: Optional[int] = None):
+        if key is not None and self.conflate:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = frame
+                entry[2] = stamp
+                self.conflated += 1
+                return
+        entry = [key, frame, stamp, time.monotonic()]
+        self._items.append(entry)
+        if key is not None and self.conflate:
+            self._pending[key] = entry
+        else:
+            self._backlog += 1
+        self._event.set()
+
+    async def get(self) -> Tuple[WireFrame, Optional[int]]:
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        entry = self._items.popleft()
+        key = entry[0]
+        if key is not None and self._pending.get(key) is entry:
+            del self._pending[key]
+        else:
+            self._backlog -= 1
+        return entry[1], entry[2]
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def backlog(self) -> int:
+        """Pending frames that are not conflated (conflated ones are bounded by tokens x channels)."""
+        return self._backlog
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest unsent frame (0 when empty)."""
+        return (time.monotonic() - self._items[0][3]) if self._items else 0.0
+
+
+# ---------------------------
+# Hub
+# ---------------------------
+class _Client:
+    __slots__ = ("ws", "outbox", "task", "on_disconnect", "sub", "fmt")
+
+    def __init__(self, ws, conflate: bool, on_disconnect: Optional[Callable] = None, fmt: str = DEFAULT_FORMAT):
+        self.ws = ws
+        self.fmt = fmt
+        self.on_disconnect = on_disconnect
+        self.outbox = Outbox(conflate)
+        self.task: Optional[asyncio.Task] = None
+        self.sub = Subscription()
+
+
+class BroadcastHub:
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, client_queue_max: int = CLIENT_QUEUE_MAX, slow_client_secs: float = SLOW_CLIENT_SECS,
+                 conflate: bool = CONFLATE, demand: Optional[TokenDemand] = None,
+                 latency_stage: str = "frontend_send", name: str = "streamer"):
+        self.client_queue_max = max(int(client_queue_max), 1)
+        self.slow_client_secs = float(slow_client_secs)
+        self.conflate = conflate
+        self.latency_stage = latency_stage
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.demand = demand
+        self.snapshot_provider: Optional[Callable[[Optional[List[int]]], Dict[str, Any]]] = None
+        # only touched on the loop thread
+        self._clients: Dict[Any, _Client] = {}
+        self._firehose: Set[_Client] = set()        # clients without a token filter
+        self._by_token: Dict[int, Set[_Client]] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._formats: Dict[str, int] = {}  # wire format -> connected clients
+        self._stats = {"handoffs": 0, "frames": 0, "sends": 0, "send_errors": 0, "conflated": 0,
+                       "slow_disconnects": 0}
+
+    def set_loop(self, loop: "asyncio.AbstractEventLoop"):
+        self.loop = loop
+
+    def set_snapshot_provider(self, fn: Callable[[Optional[List[int]]], Dict[str, Any]]):
+        """fn(tokens or None) -> snapshot payload (streamer candle history)."""
+        self.snapshot_provider = fn
+
+    def _demand(self) -> TokenDemand:
+        if self.demand is None:
+            self.demand = TokenDemand.instance()
+        return self.demand
+
+    def _call_soon(self, fn: Callable, *args) -> bool:
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            log.debug("BroadcastHub: no event loop set; dropping call")
+            return False
+        loop.call_soon_threadsafe(fn, *args)
+        return True
+
+    # ---------------------------
+    # Client lifecycle (any thread)
+    # ---------------------------
+    def add_client(self, ws, snapshot: Optional[Dict[str, Any]] = None, on_disconnect: Optional[Callable] = None,
+                   fmt: str = DEFAULT_FORMAT) -> bool:
+        """
+        Attach an (accepted) websocket; the snapshot payload is queued before any tick frame.
+        on_disconnect(ws) is called on the loop if a send fails. fmt: negotiated wire format.
+        """
+        return self._call_soon(self._attach, ws, snapshot, on_disconnect, fmt)
+
+    def remove_client(self, ws) -> bool:
+        return self._call_soon(self._detach, ws)
+
+    # loop-thread versions, for handlers and producers already running on the hub's loop
+    def attach(self, ws, snapshot: Optional[Dict[str, Any]] = None, on_disconnect: Optional[Callable] = None,
+               fmt: str = DEFAULT_FORMAT):
+        self._attach(ws, snapshot, on_disconnect, fmt)
+
+    def detach(self, ws):
+        self._detach(ws)
+
+    def is_connected(self, ws) -> bool:
+        """False once ws was detached (e.g. dropped as a slow consumer)."""
+        return ws in self._clients
+
+    def publish_frames(self, frames: List[Frame], recv_ns: Optional[int] = None):
+        """Fan frames out to the interested clients (loop thread; see publish_threadsafe)."""
+        if frames and self._clients:
+            self._fanout(frames, recv_ns)
+
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def formats_in_use(self) -> List[str]:
+        """Wire formats of connected clients (producers pre-encode these off the loop)."""
+        return [f for f, n in list(self._formats.items()) if n > 0]
+
+    # ---------------------------
+    # Publish (Kite thread)
+    # ---------------------------
+    def publish_threadsafe(self, frames: List[Frame], recv_ns: Optional[int] = None) -> bool:
+        """One handoff per tick frame: frames are (token, channel, WireFrame)."""
+        if not frames or not self._clients:
+            return False
+        self._stats["handoffs"] += 1
+        return self._call_soon(self._fanout, frames, recv_ns)
+
+    # ---------------------------
+    # Client control messages (loop)
+    # ---------------------------
+    def handle_message(self, ws, text: str) -> bool:
+        """Apply a subscribe/unsubscribe/snapshot op from ws. Returns True if text was an op."""
+        msg = parse_op(text)
+        if msg is None:
+            return False
+        client = self._clients.get(ws) or self._attach(ws, None)
+        op = msg["op"]
+        if op == "snapshot":
+            tokens = [t for t in (norm_token(x) for x in (msg.get("tokens") or [])) if t is not None]
+            self._send_snapshot(client, tokens or (None if client.sub.all_tokens else sorted(client.sub.tokens)))
+            return True
+
+        was_firehose = client.sub.all_tokens
+        added, removed = client.sub.apply(msg)
+        if was_firehose and not client.sub.all_tokens:
+            self._firehose.discard(client)
+        for t in added:
+            self._by_token.setdefault(t, set()).add(client)
+        for t in removed:
+            self._unindex(client, t)
+        if added:
+            self._demand().acquire(added)
+            if "candle" in client.sub.channels:
+                self._send_snapshot(client, added)
+        if removed:
+            self._demand().release(removed)
+        return True
+
+    # ---------------------------
+    # Loop side
+    # ---------------------------
+    def _attach(self, ws, snapshot: Optional[Dict[str, Any]], on_disconnect: Optional[Callable] = None,
+                fmt: str = DEFAULT_FORMAT) -> _Client:
+        client = self._clients.get(ws)
+        if client is not None:
+            if on_disconnect and client.on_disconnect is None:
+                client.on_disconnect = on_disconnect
+            return client
+        client = _Client(ws, self.conflate, on_disconnect, fmt)
+        self._formats[fmt] = self._formats.get(fmt, 0) + 1
+        if snapshot:
+            client.outbox.put(WireFrame(snapshot))
+        client.task = asyncio.ensure_future(self._sender(client))
+        self._clients[ws] = client
+        self._firehose.add(client)
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap_slow_clients())
+        log.info("BroadcastHub[%s]: client attached (count=%d)", self.name, len(self._clients))
+        return client
+
+    def _detach(self, ws):
+        client = self._clients.pop(ws, None)
+        if client is None:
+            return
+        self._firehose.discard(client)
+        self._formats[client.fmt] = max(self._formats.get(client.fmt, 0) - 1, 0)
+        tokens = list(client.sub.tokens)
+        for t in tokens:
+            self._unindex(client, t)
+        if tokens:
+            self._demand().release(tokens)
+        if client.task and not client.task.done() and client.task is not asyncio.current_task():
+            client.task.cancel()
+        self._stats["conflated"] += client.outbox.conflated
+        log.info("BroadcastHub[%s]: client detached (count=%d)", self.name, len(self._clients))
+
+    def _drop_client(self, client: _Client, close_code: Optional[int] = None):
+        """Detach and notify the owner; optionally close the socket (slow consumer)."""
+        ws = client.ws
+        if self._clients.get(ws) is not client:
+            return
+        self._detach(ws)
+        if close_code is not None:
+            try:
+                asyncio.ensure_future(ws.close(code=close_code))
+            except Exception:
+                log.debug("BroadcastHub: close failed", exc_info=True)
+        if client.on_disconnect:
+            try:
+                client.on_disconnect(ws)
+            except Exception:
+                log.exception("BroadcastHub: on_disconnect failed")
+
+    def _unindex(self, client: _Client, token: int):
+        subs = self._by_token.get(token)
+        if subs is not None:
+            subs.discard(client)
+            if not subs:
+                del self._by_token[token]
+
+    def _send_snapshot(self, client: _Client, tokens: Optional[List[int]]):
+        if self.snapshot_provider is None:
+            return
+        try:
+            self._offer(client, WireFrame(self.snapshot_provider(tokens)))
+        except Exception:
+            log.exception("BroadcastHub: snapshot failed")
+
+    def _recipients(self, token: Optional[int], channel: Optional[str]):
+        if token is None:
+            clients = self._clients.values()
+        else:
+            clients = list(self._firehose)
+            clients.extend(self._by_token.get(token, ()))
+        return [c for c in clients if channel is None or channel in c.sub.channels]
+
+    def _fanout(self, frames: List[Frame], recv_ns: Optional[int]):
+        self._stats["frames"] += len(frames)
+        for token, channel, frame in frames:
+            key = (channel, token) if token is not None and channel in CONFLATABLE_CHANNELS else None
+            for client in self._recipients(token, channel):
+                self._offer(client, frame, recv_ns, key)
+
+    def _offer(self, client: _Client, frame: WireFrame, recv_ns: Optional[int] = None, key=None):
+        # no slow-client check here: one fan-out queues a whole frame before any sender runs
+        client.outbox.put(frame, key, recv_ns)
+
+    def _check_slow(self, client: _Client):
+        box = client.outbox
+        if box.backlog() > self.client_queue_max or box.lag_seconds() > self.slow_client_secs:
+            self._stats["slow_disconnects"] += 1
+            log.warning("BroadcastHub[%s]: disconnecting slow client (backlog=%d, pending=%d, lag=%.1fs)",
+                        self.name, box.backlog(), box.qsize(), box.lag_seconds())
+            self._drop_client(client, close_code=1013)
+
+    async def _reap_slow_clients(self):
+        """
+        Slow-client eviction, across loop turns: by the time it runs the senders have had their
+        turns to drain whatever the last fan-outs queued.
+        """
+        interval = min(max(self.slow_client_secs / 2.0, 0.05), 1.0)
+        while self._clients:
+            await asyncio.sleep(interval)
+            for client in list(self._clients.values()):
+                self._check_slow(client)
+
+    async def _sender(self, client: _Client):
+        ws = client.ws
+        try:
+            while True:
+                frame, recv_ns = await client.outbox.get()
+                data = frame.encode(client.fmt)
+                if isinstance(data, bytes):
+                    await ws.send_bytes(data)
+                else:
+                    await ws.send_text(data)
+                self._stats["sends"] += 1
+                latency.record_since(self.latency_stage, recv_ns)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._stats["send_errors"] += 1
+            log.debug("BroadcastHub[%s]: send failed; dropping client. err=%s", self.name, e)
+            self._drop_client(client)
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        out["clients"] = len(self._clients)
+        out["firehose_clients"] = len(self._firehose)
+        for fmt, n in list(self._formats.items()):
+            out[f"clients_{fmt}"] = n
+        out["indexed_tokens"] = len(self._by_token)
+        clients = list(self._clients.values())
+        out["conflated"] += sum(c.outbox.conflated for c in clients)
+        out["queued"] = sum(c.outbox.qsize() for c in clients)
+        out["max_client_lag_seconds"] = max((c.outbox.lag_seconds() for c in clients), default=0.0)
+        return out
@@ -0,0 +1,359 @@
+# app/candle_engine.py
+"""
+Multi-interval live candle engine (used by streamer.on_tick).
+
+- Base bars are 1 minute (streamer.CANDLE_INTERVAL_SECONDS); higher timeframes (3m/5m/15m/1h by
+  default) are rolled up from *finalized* base bars, so every tick only touches the open 1m bar.
+- Volume comes from tick-to-tick deltas of Kite's cumulative day volume (`volume_traded`);
+  the first tick of a token only sets the baseline, a drop (new session) restarts it.
+- Finalized bars are kept per (token, interval) in fixed-size NumPy rings (time, o, h, l, c, v),
+  written twice like indicators._TokenRing so the last n bars are always one contiguous view.
+- history(token, interval, limit) returns closed bars + the building bar (a higher-timeframe
+  building bar includes the open 1m bar), so /candles and strategy code can read 5m/15m bars
+  from memory; seed() backfills a ring from kite.historical_data once.
+- Higher-timeframe buckets start on the exchange session grid (bucket_start), like Kite's
+  historical bars: 1h bars are 09:15, 10:15, ... IST, not hh:30 IST as UTC-epoch buckets would be.
+  Intervals that divide 09:15 IST evenly (1m/3m/5m/15m) are unchanged by this.
+
+Config via .env:
+  CANDLE_INTERVALS (default "1m,3m,5m,15m,1h")
+  CANDLE_RING_CAPACITY (default 1000 bars per token per interval)
+  CANDLE_SESSION_START (default "09:15", session open in exchange local time)
+  CANDLE_TZ_OFFSET_MIN (default 330, exchange UTC offset in minutes: IST)
+"""
+
+import os
+import collections
+import logging
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+BASE_INTERVAL_SECONDS = 60
+RING_CAPACITY = int(os.getenv("CANDLE_RING_CAPACITY", "1000"))
+
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600}
+
+
+def _session_anchor() -> int:
+    """Session open as seconds after UTC midnight (09:15 IST -> 03:45 UTC)."""
+    try:
+        hh, mm = (int(x) for x in os.getenv("CANDLE_SESSION_START", "09:15").split(":"))
+        offset = int(os.getenv("CANDLE_TZ_OFFSET_MIN", "330"))
+        return ((hh * 60 + mm - offset) * 60) % 86400
+    except Exception:
+        return (3 * 60 + 45) * 60
+
+
+SESSION_ANCHOR = _session_anchor()
+
+CandleView = collections.namedtuple("CandleView", ["time", "open", "high", "low", "close", "volume"])
+
+
+def interval_seconds(name) -> Optional[int]:
+    """'5m' / '5minute' / 'minute' / '60minute' / '1h' / 300 -> seconds (None if unsupported)."""
+    if name is None:
+        return None
+    if isinstance(name, (int, float)):
+        return int(name)
+    s = str(name).strip().lower()
+    if s in ("minute", "1minute"):
+        return 60
+    if s.endswith("minute"):
+        s = s[:-len("minute")] + "m"
+    elif s.endswith("hour"):
+        s = s[:-len("hour")] + "h"
+    try:
+        if s[-1] in _UNIT_SECONDS:
+            return int(s[:-1] or 1) * _UNIT_SECONDS[s[-1]]
+        return int(s)
+    except Exception:
+        return None
+
+
+def bucket_start(t: int, sec: int) -> int:
+    """Start of the `sec`-second bar holding epoch second t, counted from the day's session open."""
+    return t - ((t - SESSION_ANCHOR) % 86400) % sec
+
+
+def _parse_intervals(spec: str) -> List[int]:
+    out = {BASE_INTERVAL_SECONDS}
+    for part in (spec or "").split(","):
+        sec = interval_seconds(part) if part.strip() else None
+        if sec and sec % BASE_INTERVAL_SECONDS == 0:
+            out.add(sec)
+        elif part.strip():
+            log.warning("CandleEngine: ignoring interval %r (must be a multiple of %ds)", part, BASE_INTERVAL_SECONDS)
+    return sorted(out)
+
+
+INTERVALS = _parse_intervals(os.getenv("CANDLE_INTERVALS", "1m,3m,5m,15m,1h"))
+
+
+class _CandleRing:
+    """Fixed-capacity ring of finalized bars for one (token, interval)."""
+    __slots__ = ("capacity", "time", "open", "high", "low", "close", "volume", "head", "count")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.time = np.zeros(2 * capacity, dtype=np.int64)
+        self.open = np.zeros(2 * capacity, dtype=np.float64)
+        self.high = np.zeros(2 * capacity, dtype=np.float64)
+        self.low = np.zeros(2 * capacity, dtype=np.float64)
+        self.close = np.zeros(2 * capacity, dtype=np.float64)
+        self.volume = np.zeros(2 * capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+
+    def append(self, t, o, h, l, c, v):
+        i = self.head
+        j = i + self.capacity
+        self.time[i] = self.time[j] = t
+        self.open[i] = self.open[j] = o
+        self.high[i] = self.high[j] = h
+        self.low[i] = self.low[j] = l
+        self.close[i] = self.close[j] = c
+        self.volume[i] = self.volume[j] = v
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def view(self, n=None) -> CandleView:
+        n = self.count if n is None else max(0, min(int(n), self.count))
+        end = self.head + self.capacity
+        return CandleView(self.time[end - n:end], self.open[end - n:end], self.high[end - n:end],
+                          self.low[end - n:end], self.close[end - n:end], self.volume[end - n:end])
+
+    def last_time(self) -> Optional[int]:
+        if not self.count:
+            return None
+        return int(self.time[self.head + self.capacity - 1])
+
+
+def _bar(t, o, h, l, c, v) -> List:
+    return [int(t), float(o), float(h), float(l), float(c), float(v)]
+
+
+def _merge(bar: List, o, h, l, c, v):
+    if h > bar[2]:
+        bar[2] = h
+    if l < bar[3]:
+        bar[3] = l
+    bar[4] = c
+    bar[5] += v
+
+
+def _as_dict(bar: List) -> Dict[str, Any]:
+    return {"time": bar[0], "open": bar[1], "high": bar[2], "low": bar[3], "close": bar[4], "volume": bar[5]}
+
+
+class _TokenCandles:
+    __slots__ = ("rings", "building", "last_cum_volume")
+
+    def __init__(self, intervals: Iterable[int], capacity: int):
+        self.rings = {sec: _CandleRing(capacity) for sec in intervals}
+        self.building: Dict[int, List] = {}  # interval -> [t, o, h, l, c, v] (open bar)
+        self.last_cum_volume: Optional[float] = None
+
+
+class CandleEngine:
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, intervals: Iterable[int] = INTERVALS, capacity: int = RING_CAPACITY):
+        self.intervals = sorted(set(int(s) for s in intervals) | {BASE_INTERVAL_SECONDS})
+        self.higher = [s for s in self.intervals if s != BASE_INTERVAL_SECONDS]
+        self.capacity = max(int(capacity), 1)
+        self.lock = Lock()
+        self._tokens: Dict[int, _TokenCandles] = {}
+
+    def _state(self, token) -> _TokenCandles:
+        st = self._tokens.get(token)
+        if st is None:
+            st = self._tokens[token] = _TokenCandles(self.intervals, self.capacity)
+        return st
+
+    # ---------------------------
+    # Tick ingestion
+    # ---------------------------
+    def on_tick(self, token: int, price: float, ts_seconds: int,
+                cum_volume: Optional[float] = None) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Fold one tick into the open 1m bar.
+        Returns (building 1m bar, 1m bar finalized by this tick or None).
+        """
+        price = float(price)
+        ts_seconds = int(ts_seconds)
+        with self.lock:
+            st = self._state(token)
+
+            vol = 0.0
+            if cum_volume is not None:
+                try:
+                    cum = float(cum_volume)
+                    last = st.last_cum_volume
+                    if last is not None:
+                        vol = cum - last if cum >= last else cum  # drop => new session counter
+                    st.last_cum_volume = cum
+                except Exception:
+                    vol = 0.0
+
+            bucket = ts_seconds - (ts_seconds % BASE_INTERVAL_SECONDS)
+            cur = st.building.get(BASE_INTERVAL_SECONDS)
+            closed = None
+            if cur is None or bucket > cur[0]:
+                if cur is not None:
+                    closed = _as_dict(cur)
+                    self._finalize(st, cur)
+                cur = st.building[BASE_INTERVAL_SECONDS] = _bar(bucket, price, price, price, price, vol)
+            elif bucket == cur[0]:
+                _merge(cur, price, price, price, price, vol)
+            else:
+                cur[5] += vol  # late tick for an already closed minute: keep its volume only
+            return _as_dict(cur), closed
+
+    def _finalize(self, st: _TokenCandles, base: List):
+        st.rings[BASE_INTERVAL_SECONDS].append(*base)
+        t, o, h, l, c, v = base
+        for sec in self.higher:
+            hb = bucket_start(t, sec)
+            b = st.building.get(sec)
+            if b is None or hb > b[0]:
+                if b is not None:
+                    st.rings[sec].append(*b)
+                st.building[sec] = _bar(hb, o, h, l, c, v)
+            else:
+                _merge(b, o, h, l, c, v)
+
+    # ---------------------------
+    # Backfill
+    # ---------------------------
+    def seed(self, token: int, interval, bars: Iterable[Dict[str, Any]]) -> int:
+        """
+        Prepend historical bars (dicts with time|date + open/high/low/close/volume) older than
+        anything already in the ring. Returns the number of bars added.
+        """
+        sec = interval_seconds(interval)
+        if sec not in self.intervals:
+            return 0
+        rows = []
+        for b in bars:
+            t = _bar_time(b)
+            if t is None:
+                continue
+            rows.append(_bar(t, b.get("open", 0), b.get("high", 0), b.get("low", 0), b.get("close", 0),
+                             b.get("volume") or 0))
+        with self.lock:
+            st = self._state(token)
+            ring = st.rings[sec]
+            existing = ring.view()
+            first_live = int(existing.time[0]) if ring.count else None
+            building = st.building.get(sec)
+            cutoff = first_live if first_live is not None else (building[0] if building else None)
+            rows = sorted((r for r in rows if cutoff is None or r[0] < cutoff), key=lambda r: r[0])
+            if not rows:
+                return 0
+            kept = [list(x) for x in zip(*(a.tolist() for a in existing))] if ring.count else []
+            fresh = _CandleRing(self.capacity)
+            for r in rows + kept:
+                fresh.append(*r)
+            st.rings[sec] = fresh
+            return len(rows)
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+    def view(self, token: int, interval, n=None) -> Optional[CandleView]:
+        """Zero-copy arrays of finalized bars (do not keep across ticks; copy if needed)."""
+        sec = interval_seconds(interval)
+        st = self._tokens.get(token)
+        if st is None or sec not in st.rings:
+            return None
+        with self.lock:
+            return st.rings[sec].view(n)
+
+    def current(self, token: int, interval) -> Optional[Dict[str, Any]]:
+        """Building bar for interval, including the open 1m bar."""
+        sec = interval_seconds(interval)
+        with self.lock:
+            st = self._tokens.get(token)
+            if st is None or sec not in st.rings:
+                return None
+            return self._current_locked(st, sec)
+
+    def _current_locked(self, st: _TokenCandles, sec: int) -> Optional[Dict[str, Any]]:
+        base = st.building.get(BASE_INTERVAL_SECONDS)
+        if sec == BASE_INTERVAL_SECONDS:
+            return _as_dict(base) if base else None
+        b = st.building.get(sec)
+        if base is None:
+            return _as_dict(b) if b else None
+        hb = bucket_start(base[0], sec)
+        if b is None or b[0] != hb:
+            return _as_dict([hb] + base[1:])
+        merged = list(b)
+        _merge(merged, *base[1:])
+        return _as_dict(merged)
+
+    def history(self, token: int, interval, limit: int = 100, include_current: bool = True) -> List[Dict[str, Any]]:
+        sec = interval_seconds(interval)
+        with self.lock:
+            st = self._tokens.get(token)
+            if st is None or sec not in st.rings:
+                return []
+            cur = self._current_locked(st, sec) if include_current else None
+            n = max(int(limit) - (1 if cur else 0), 0)
+            v = st.rings[sec].view(n)
+            out = [{"time": int(t), "open": float(o), "high": float(h), "low": float(l), "close": float(c),
+                    "volume": float(vol)}
+                   for t, o, h, l, c, vol in zip(v.time.tolist(), v.open.tolist(), v.high.tolist(),
+                                                 v.low.tolist(), v.close.tolist(), v.volume.tolist())]
+        if cur:
+            out.append(cur)
+        return out
+
+    def bar_count(self, token: int, interval) -> int:
+        """Finalized bars + the building bar (what history() can return at most)."""
+        sec = interval_seconds(interval)
+        with self.lock:
+            st = self._tokens.get(token)
+            if st is None or sec not in st.rings:
+                return 0
+            return st.rings[sec].count + (1 if self._current_locked(st, sec) else 0)
+
+    def tokens(self) -> List[int]:
+        with self.lock:
+            return list(self._tokens.keys())
+
+    def supports(self, interval) -> bool:
+        return interval_seconds(interval) in self.intervals
+
+
+def _bar_time(b: Dict[str, Any]) -> Optional[int]:
+    """Epoch seconds from a bar dict ('time' seconds/ms, or kite 'date' datetime/str)."""
+    t = b.get("time", b.get("timestamp"))
+    if t is not None:
+        try:
+            t = int(t)
+            return t // 1000 if t > 1_000_000_000_000 else t
+        except Exception:
+            pass
+    d = b.get("date")
+    if d is None:
+        return None
+    try:
+        import pandas as pd
+        ts = pd.Timestamp(d)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize("UTC")
+        return int(ts.timestamp())
+    except Exception:
+        return None
@@ -1743,7 +1743,7 @@
 
 # app/crud.py
 """
-Unified CRUD for subscriptions, rewards, referrals, leaderboard, and help module.
+Unified CRUD for subscriptions, rewards, referrals, leaderboard, help module and ML model versions.
 """
 
 from typing import Optional, Dict, Any, List
@@ -2027,3 +2027,96 @@ def get_help_article(db: Session, article_id: int):
         .filter(models.HelpArticle.id == article_id)
         .first()
     )
+
+
+# =================================================
+# ML MODEL VERSIONS CRUD (ml_models table)
+# =================================================
+def save_model_metadata(
+    filename: str,
+    rows: Optional[int] = None,
+    metrics: Optional[Dict[str, Any]] = None,
+    notes: Optional[str] = None,
+    active: bool = True,
+    db: Optional[Session] = None,
+):
+    own = db is None
+    session = db or SessionLocal()
+    try:
+        if active:
+            session.query(models.MLModelFile).filter(models.MLModelFile.active == True).update(
+                {models.MLModelFile.active: False}, synchronize_session=False
+            )
+        m = models.MLModelFile(
+            filename=filename,
+            rows=rows,
+            metrics=metrics or {},
+            notes=notes,
+            active=active,
+        )
+        session.add(m)
+        session.commit()
+        session.refresh(m)
+        return m
+    finally:
+        if own:
+            session.close()
+
+
+def get_model(model_id: int, db: Optional[Session] = None):
+    own = db is None
+    session = db or SessionLocal()
+    try:
+        return session.query(models.MLModelFile).filter(models.MLModelFile.id == model_id).first()
+    finally:
+        if own:
+            session.close()
+
+
+def get_latest_model(active_only: bool = False, db: Optional[Session] = None):
+    own = db is None
+    session = db or SessionLocal()
+    try:
+        q = session.query(models.MLModelFile)
+        if active_only:
+            q = q.filter(models.MLModelFile.active == True)
+        return q.order_by(desc(models.MLModelFile.created_at), desc(models.MLModelFile.id)).first()
+    finally:
+        if own:
+            session.close()
+
+
+def list_model_versions(limit: int = 50, offset: int = 0, db: Optional[Session] = None):
+    own = db is None
+    session = db or SessionLocal()
+    try:
+        return (
+            session.query(models.MLModelFile)
+            .order_by(desc(models.MLModelFile.created_at), desc(models.MLModelFile.id))
+            .limit(limit)
+            .offset(offset)
+            .all()
+        )
+    finally:
+        if own:
+            session.close()
+
+
+def set_active_model(model_id: int, db: Optional[Session] = None):
+    """Mark one ml_models row active (all others inactive); returns it, or None if missing."""
+    own = db is None
+    session = db or SessionLocal()
+    try:
+        m = session.query(models.MLModelFile).filter(models.MLModelFile.id == model_id).first()
+        if not m:
+            return None
+        session.query(models.MLModelFile).filter(
+            models.MLModelFile.active == True, models.MLModelFile.id != model_id
+        ).update({models.MLModelFile.active: False}, synchronize_session=False)
+        m.active = True
+        session.commit()
+        session.refresh(m)
+        return m
+    finally:
+        if own:
+            session.close()
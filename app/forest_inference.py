@@ -0,0 +1,165 @@
+# app/forest_inference.py
+"""
+Flattened tree-ensemble inference for the RandomForest next-bar model (also ExtraTrees /
+single DecisionTree classifiers).
+
+FlatForest.from_sklearn(model) copies every tree into contiguous NumPy node arrays (feature,
+threshold, children, per-node class probabilities) with the trees laid out back to back;
+predict_proba(X) then scores a whole batch with vectorized, level-synchronous traversal: every
+(tree, row) pair advances one level per step with a few gathers, and leaves point at themselves,
+so no per-tree or per-row Python loop is needed. Nodes are addressed by slot (2 * node) with the
+feature / threshold duplicated on both slots, so one level is gather feature, gather x, gather
+threshold, compare, add, gather child. For larger batches the (tree, row) pairs that reached a
+leaf are dropped every few levels, so deep outlier trees do not keep the whole batch in the loop;
+small inputs (one row) just stop once every tree sits on a leaf.
+
+Results are identical to sklearn's predict_proba:
+- X is cast to float32 first (sklearn validates tree input as float32) and compared with the
+  float64 thresholds: left when x <= threshold; NaN goes where the tree's missing_go_to_left
+  says (sklearn >= 1.3), otherwise right
+- each node holds value / value.sum() (DecisionTreeClassifier.predict_proba normalisation)
+- per-tree probabilities are summed in estimator order (np.add.accumulate, sequential by
+  definition) and divided by n_estimators, as RandomForest does with one job. With n_jobs > 1
+  sklearn adds the trees in thread completion order, so its own output can move in the last bit
+  between calls; compare against n_jobs=1
+
+Multi-output models are not supported (from_sklearn raises ValueError).
+"""
+
+from typing import Optional
+
+import numpy as np
+
+_LEAF = -1  # sklearn.tree._tree.TREE_LEAF
+_COMPACT_MIN = 2048  # (tree, row) pairs; below this dropping finished pairs costs more than it saves
+
+
+class FlatForest:
+    __slots__ = ("feature", "threshold", "children", "proba", "missing_left", "roots", "depth",
+                 "classes_", "n_features_in_", "n_estimators")
+
+    def __init__(self, feature, threshold, children, proba, missing_left, roots, depth, classes,
+                 n_features, n_estimators):
+        self.feature = feature              # (2 * nodes,) int64 per slot, 0 at leaves
+        self.threshold = threshold          # (2 * nodes,) float64 per slot
+        self.children = children            # (2 * nodes,) int64: slot 2i -> left slot, 2i + 1 -> right; leaves -> 2i
+        self.proba = proba                  # (nodes, n_classes) float64, normalised node values
+        self.missing_left = missing_left    # (2 * nodes,) bool per slot or None
+        self.roots = roots                  # (trees,) int64 root slots
+        self.depth = depth                  # deepest leaf
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        self.n_estimators = n_estimators    # None for a single tree (no averaging)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        estimators = getattr(model, "estimators_", None)
+        trees = list(estimators) if estimators is not None else [model]
+        if not trees or not all(hasattr(t, "tree_") for t in trees):
+            raise ValueError(f"not a fitted tree classifier: {type(model).__name__}")
+        n_classes = np.atleast_1d(getattr(model, "n_classes_", 0))
+        if len(n_classes) != 1 or getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("multi-output trees are not supported")
+        n_classes = int(n_classes[0])
+
+        feature, threshold, children, proba, missing, roots = [], [], [], [], [], []
+        offset, depth = 0, 0
+        has_missing = all(hasattr(t.tree_, "missing_go_to_left") for t in trees)
+        for t in trees:
+            tr = t.tree_
+            n = tr.node_count
+            left = tr.children_left.astype(np.int64)
+            right = tr.children_right.astype(np.int64)
+            leaf = left == _LEAF
+            own = np.arange(n, dtype=np.int64)
+            ch = np.empty(2 * n, dtype=np.int64)
+            ch[0::2] = 2 * (np.where(leaf, own, left) + offset)
+            ch[1::2] = 2 * (np.where(leaf, own, right) + offset)
+            value = tr.value[:, 0, :n_classes]
+            norm = value.sum(axis=1)[:, np.newaxis]
+            norm[norm == 0.0] = 1.0
+            roots.append(2 * offset)
+            feature.append(np.repeat(np.where(leaf, 0, tr.feature).astype(np.int64), 2))
+            threshold.append(np.repeat(tr.threshold.astype(np.float64), 2))
+            children.append(ch)
+            proba.append(value / norm)
+            if has_missing:
+                missing.append(np.repeat(np.asarray(tr.missing_go_to_left, dtype=bool), 2))
+            depth = max(depth, int(tr.max_depth))
+            offset += n
+
+        return cls(
+            feature=np.concatenate(feature),
+            threshold=np.concatenate(threshold),
+            children=np.concatenate(children),
+            proba=np.ascontiguousarray(np.concatenate(proba)),
+            missing_left=np.concatenate(missing) if has_missing else None,
+            roots=np.asarray(roots, dtype=np.int64),
+            depth=depth,
+            classes=np.asarray(getattr(model, "classes_", np.arange(n_classes))),
+            n_features=int(getattr(model, "n_features_in_", 0)) or None,
+            n_estimators=len(trees) if estimators is not None else None,
+        )
+
+    def apply(self, X) -> np.ndarray:
+        """(trees, rows) global leaf node index for every tree and row."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if self.n_features_in_ is not None and X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, model expects {self.n_features_in_}")
+        n_rows, n_cols = X.shape
+        n_trees = len(self.roots)
+        flat = X.ravel()
+        has_nan = bool(np.isnan(flat).any())
+
+        # (tree, row) pairs, tree-major; finished pairs are dropped every few levels
+        out = np.repeat(self.roots, n_rows)
+        pos = np.arange(n_trees * n_rows)
+        idx = out.copy()
+        base = 0 if n_rows == 1 else np.tile(np.arange(n_rows, dtype=np.int64) * n_cols, n_trees)
+
+        compact = len(idx) >= _COMPACT_MIN
+        feature, threshold, children = self.feature, self.threshold, self.children
+        for level in range(self.depth):
+            x = flat.take(feature.take(idx) + base)
+            if has_nan:
+                right = ~(x <= threshold.take(idx))
+                if self.missing_left is not None:
+                    right &= ~(np.isnan(x) & self.missing_left.take(idx))
+            else:
+                right = x > threshold.take(idx)
+            idx = children.take(idx + right)
+            if compact and level % 4 == 3:
+                live = children.take(idx) != idx  # leaves point at themselves
+                if not live.all():
+                    done = ~live
+                    out[pos[done]] = idx[done]
+                    pos, idx = pos[live], idx[live]
+                    if n_rows > 1:
+                        base = base[live]
+                    if not len(idx):
+                        break
+            elif level % 8 == 7 and np.array_equal(children.take(idx), idx):
+                break
+        out[pos] = idx
+        return (out >> 1).reshape(n_trees, n_rows)
+
+    def predict_proba(self, X) -> np.ndarray:
+        leaves = self.apply(X)
+        if self.n_estimators is None:
+            return self.proba[leaves[0]].copy()
+        total = np.add.accumulate(self.proba[leaves], axis=0)[-1]
+        total /= self.n_estimators
+        return total
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def try_flatten(model) -> Optional[FlatForest]:
+    """FlatForest for model, or None if it is not a supported tree classifier."""
+    try:
+        return FlatForest.from_sklearn(model)
+    except Exception:
+        return None
@@ -2,26 +2,44 @@
 """
 Fetch historical OHLC data using yfinance primary and AlphaVantage as fallback.
 Return pandas.DataFrame with columns: open, high, low, close, volume
+
+fetch_ohlc / fetch_recent_ohlc go through the on-disk bar cache (ohlc_cache.OhlcCache, keyed by
+provider / symbol / interval): a repeat request inside the freshness window reads the cached
+files, a stale one downloads only the bars after the last cached bar (yfinance start=...; Alpha
+Vantage compact, or full when the gap is longer than a compact response). OHLC_CACHE=false
+downloads every time as before.
 """
 import os
+import logging
 import pandas as pd
 from alpha_vantage.timeseries import TimeSeries
 import yfinance as yf
 
-ALPHAVANTAGE_KEY = os.getenv("ALPHAVANTAGE_KEY", "")
+from .ohlc_cache import USE_CACHE, OhlcCache, interval_key, interval_seconds
+
+log = logging.getLogger(__name__)
+
+AV_COMPACT_BARS = 100  # rows in an Alpha Vantage outputsize=compact response
 
-def fetch_yfinance_ohlc(symbol: str, period: str = "1mo", interval: str = "5m") -> pd.DataFrame:
+def fetch_yfinance_ohlc(symbol: str, period: str = "1mo", interval: str = "5m", start=None) -> pd.DataFrame:
     """
     symbol example: 'RELIANCE.NS' for NSE Reliance on Yahoo Finance.
     period e.g. '1mo','3mo','1y'
     interval e.g. '1m','5m','15m','1h','1d'
+    start: datetime / Timestamp -> bars from start to now instead of period
     """
     try:
-        df = yf.download(tickers=symbol, period=period, interval=interval, progress=False, threads=False)
+        if start is not None:
+            df = yf.download(tickers=symbol, start=start.to_pydatetime() if hasattr(start, "to_pydatetime") else start,
+                             interval=interval, progress=False, threads=False)
+        else:
+            df = yf.download(tickers=symbol, period=period, interval=interval, progress=False, threads=False)
     except Exception:
         return pd.DataFrame()
     if df is None or df.empty:
         return pd.DataFrame()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
     df = df.rename(columns={"Open":"open","High":"high","Low":"low","Close":"close","Volume":"volume"})
     df = df[["open","high","low","close","volume"]]
     return df
@@ -30,11 +48,13 @@ def fetch_alphavantage_intraday(symbol: str, interval: str = "5min", outputsize:
     """
     AlphaVantage intraday fetch. symbol should be AlphaVantage-compatible (e.g., 'RELIANCE.BSE' or global tickers).
     Note: AlphaVantage free tier has rate limits. Use as fallback.
+    ALPHAVANTAGE_KEY is read per call, so a load_dotenv() after import still takes effect.
     """
-    if not ALPHAVANTAGE_KEY:
+    key = os.getenv("ALPHAVANTAGE_KEY", "").strip()
+    if not key:
         return pd.DataFrame()
     try:
-        ts = TimeSeries(key=ALPHAVANTAGE_KEY, output_format='pandas')
+        ts = TimeSeries(key=key, output_format='pandas')
         data, meta = ts.get_intraday(symbol=symbol, interval=interval, outputsize=outputsize)
         # rename columns if they are numbered
         cols = []
@@ -52,24 +72,55 @@ def fetch_alphavantage_intraday(symbol: str, interval: str = "5min", outputsize:
     except Exception:
         return pd.DataFrame()
 
+def _av_interval(interval: str) -> str:
+    # pick alpha interval mapping
+    if interval.endswith("min"):
+        return interval
+    if interval.endswith("m"):
+        return interval.replace("m", "min")
+    return "5min"
+
+def fetch_ohlc(symbol: str, provider: str = "yfinance", period: str = "7d", interval: str = "5m",
+               use_cache: bool = USE_CACHE) -> pd.DataFrame:
+    """
+    One provider ('yfinance' | 'alphavantage'), through the OHLC cache unless use_cache=False.
+    Alpha Vantage has no period: without the cache it returns its latest compact response.
+    """
+    if provider == "yfinance":
+        fetch = lambda start: fetch_yfinance_ohlc(symbol, period=period, interval=interval, start=start)
+        backfill = True
+    elif provider == "alphavantage":
+        def fetch(start):
+            size = "compact"
+            if start is not None:
+                gap = (pd.Timestamp.now(tz="UTC") - start).total_seconds() / interval_seconds(interval)
+                size = "compact" if gap < AV_COMPACT_BARS else "full"
+            return fetch_alphavantage_intraday(symbol, interval=_av_interval(interval), outputsize=size)
+        backfill = False
+        if interval_key(_av_interval(interval)) != interval_key(interval):
+            use_cache = False  # no Alpha Vantage intraday series for this interval: 5min fallback, not cached
+    else:
+        raise ValueError(f"unknown provider: {provider}")
+    if not use_cache:
+        return fetch(None)
+    try:
+        return OhlcCache.instance().get(provider, symbol, interval, period, fetch, backfill=backfill)
+    except Exception:
+        log.warning("OHLC cache failed for %s %s %s, downloading directly", provider, symbol, interval, exc_info=True)
+        return fetch(None)
+
 def fetch_recent_ohlc(symbol: str, provider_preference: str = "yfinance", period: str = "7d", interval: str = "5m") -> pd.DataFrame:
     """
-    High-level: try yfinance first, then AlphaVantage fallback.
+    High-level: try yfinance first, then AlphaVantage fallback (both cached, see fetch_ohlc).
     For NSE tickers use Yahoo symbol like 'RELIANCE.NS'
     """
     if provider_preference == "yfinance":
-        df = fetch_yfinance_ohlc(symbol, period=period, interval=interval)
+        df = fetch_ohlc(symbol, provider="yfinance", period=period, interval=interval)
         if df is not None and not df.empty:
             return df
 
-    # fallback: pick alpha interval mapping
-    av_interval = "5min"
-    if interval.endswith("m"):
-        av_interval = interval.replace("m", "min")
-    elif interval.endswith("min"):
-        av_interval = interval
     try:
-        df = fetch_alphavantage_intraday(symbol, interval=av_interval, outputsize="compact")
+        df = fetch_ohlc(symbol, provider="alphavantage", period=period, interval=interval)
         if df is not None and not df.empty:
             return df
     except Exception:
@@ -0,0 +1,339 @@
+# app/indicator_engine.py
+"""
+Incremental (streaming) indicator state per instrument token.
+
+compute_signals() in app/indicators.py rebuilds a DataFrame, resamples to 1s and recomputes
+every indicator on each call. IndicatorEngine keeps the same 1-second bar view of the stream
+but updates running state in O(1) per tick:
+ - SMA 5/15/50/200, ATR14, RSI14 (rolling mean of gains/losses, same as indicators.rsi)
+   -> running window sums
+ - EMA 5/15/20/50, MACD(12,26,9) -> recursive EMA state (adjust=False, seeded with the first bar)
+ - Bollinger(20, 2) -> sliding-window Welford mean/M2
+ - VWAP -> running PV / V sums over the ticks in the window
+ - tick_vol_ratio -> running sum + non-zero count of the last 50 bar volumes
+
+Like compute_signals(), the series covers the bars spanned by the last `window` ticks, and the
+current (still open) second is folded into every value on read without being committed.
+signals() therefore returns the same keys and values as compute_signals() for the same ticks
+(EMA-family values converge to the pandas ones once the tick window starts sliding).
+
+Differences vs the pandas path (documented, intentional):
+ - ticks older than the open bar are folded into the open bar instead of being re-sorted
+ - gaps of more than `window` seconds are not replayed bar by bar; EMAs are decayed in closed form
+"""
+
+import math
+import collections
+from threading import Lock
+
+NS_PER_SEC = 1_000_000_000
+
+SMA_PERIODS = (5, 15, 50, 200)
+EMA_PERIODS = (5, 15, 20, 50)
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BOLL_PERIOD, BOLL_STD = 20, 2.0
+VOL_NORM_PERIOD = 50
+
+
+def _alpha(span):
+    return 2.0 / (span + 1.0)
+
+
+class _WindowSum:
+    """Running sum of the last `size` committed values (size may be 0)."""
+    __slots__ = ("size", "buf", "total")
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = collections.deque()
+        self.total = 0.0
+
+    def push(self, x):
+        if self.size <= 0:
+            return
+        self.buf.append(x)
+        self.total += x
+        if len(self.buf) > self.size:
+            self.total -= self.buf.popleft()
+
+
+class _WindowWelford:
+    """Sliding-window Welford mean / M2 over the last `size` committed values."""
+    __slots__ = ("size", "buf", "mean", "m2")
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = collections.deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, x):
+        if self.size <= 0:
+            return
+        self.buf.append(x)
+        if len(self.buf) <= self.size:
+            n = len(self.buf)
+            d = x - self.mean
+            self.mean += d / n
+            self.m2 += d * (x - self.mean)
+            return
+        old = self.buf.popleft()
+        old_mean = self.mean
+        self.mean += (x - old) / self.size
+        self.m2 += (x - old) * (x - self.mean + old - old_mean)
+        if self.m2 < 0:
+            self.m2 = 0.0
+
+    def with_value(self, x):
+        """(n, mean, m2) as if x were appended, without mutating the window."""
+        n = len(self.buf) + 1
+        d = x - self.mean
+        mean = self.mean + d / n
+        return n, mean, max(self.m2 + d * (x - mean), 0.0)
+
+
+class IndicatorState:
+    """Streaming indicator state for one token, fed with ticks in time order."""
+
+    def __init__(self, window=500):
+        self.window = int(window)
+        self.cur_sec = None      # open bar (epoch second)
+        self.cur_close = None    # last non-NaN price inside the open bar (None until one arrives)
+        self.cur_vol = 0.0
+        self.cur_bar = None      # [close, volume still inside the tick window] of the open bar
+        self.ticks = collections.deque()  # (sec, volume, bar) for the last `window` ticks
+        self.pv_total = 0.0      # sum(close * volume) of committed bars, ticks in window only
+        self.v_total = 0.0       # sum(volume) of committed bars, ticks in window only
+        self.last_close = None   # close of the newest committed bar
+        self.prev_close = None   # close of the bar before that
+        self.tradingsymbol = None
+
+        self.sma = {p: _WindowSum(p - 1) for p in SMA_PERIODS}
+        self.ema = {p: None for p in EMA_PERIODS}
+        self.ema_fast = None
+        self.ema_slow = None
+        self.macd_signal = None
+        self.gain = _WindowSum(RSI_PERIOD - 1)
+        self.loss = _WindowSum(RSI_PERIOD - 1)
+        self.tr = _WindowSum(ATR_PERIOD - 1)
+        self.boll = _WindowWelford(BOLL_PERIOD - 1)
+        self.vol_win = _WindowSum(VOL_NORM_PERIOD - 1)
+        self.vol_nonzero = collections.deque()
+
+    # ---------------- ingestion ----------------
+    def update(self, ts_ns, ltp, volume):
+        sec = int(ts_ns) // NS_PER_SEC
+        has_price = ltp is not None and not math.isnan(ltp)
+        vol = 0.0 if volume is None or math.isnan(volume) else float(volume)
+
+        if self.cur_sec is None:
+            if not has_price:
+                # nothing to anchor a bar on yet (pandas would bfill; we wait for a price)
+                return
+            self.cur_sec = sec
+            self.cur_bar = [None, 0.0]
+        elif sec > self.cur_sec:
+            self._roll_to(sec)
+
+        if has_price:
+            self.cur_close = float(ltp)
+        self.cur_vol += vol
+        self.cur_bar[1] += vol
+        self.ticks.append((self.cur_sec, vol, self.cur_bar))
+        if len(self.ticks) > self.window:
+            self._evict_tick()
+
+    def _evict_tick(self):
+        _, vol, bar = self.ticks.popleft()
+        bar[1] -= vol
+        if bar is not self.cur_bar:
+            self.pv_total -= bar[0] * vol
+            self.v_total -= vol
+
+    def _roll_to(self, sec):
+        close = self.cur_close if self.cur_close is not None else self.last_close
+        self.cur_bar[0] = close
+        self.pv_total += close * self.cur_bar[1]
+        self.v_total += self.cur_bar[1]
+        self._commit(close, self.cur_vol)
+        gap = sec - self.cur_sec - 1
+        if gap > 0:
+            replay = min(gap, self.window)
+            for _ in range(replay):
+                self._commit(close, 0.0)
+            if gap > replay:
+                self._decay_emas(close, gap - replay)
+        self.cur_sec = sec
+        self.cur_close = None
+        self.cur_vol = 0.0
+        self.cur_bar = [None, 0.0]
+
+    def _commit(self, close, vol):
+        if self.last_close is not None:
+            diff = close - self.last_close
+            self.gain.push(diff if diff > 0 else 0.0)
+            self.loss.push(-diff if diff < 0 else 0.0)
+            self.tr.push(abs(diff))
+        for p, ws in self.sma.items():
+            ws.push(close)
+        for p, prev in self.ema.items():
+            self.ema[p] = close if prev is None else prev + _alpha(p) * (close - prev)
+        self.ema_fast = close if self.ema_fast is None else self.ema_fast + _alpha(MACD_FAST) * (close - self.ema_fast)
+        self.ema_slow = close if self.ema_slow is None else self.ema_slow + _alpha(MACD_SLOW) * (close - self.ema_slow)
+        macd_line = self.ema_fast - self.ema_slow
+        self.macd_signal = macd_line if self.macd_signal is None else self.macd_signal + _alpha(MACD_SIGNAL) * (macd_line - self.macd_signal)
+        self.boll.push(close)
+        self.vol_win.push(vol)
+        self.vol_nonzero.append(vol != 0)
+        if len(self.vol_nonzero) > VOL_NORM_PERIOD - 1:
+            self.vol_nonzero.popleft()
+        self.prev_close = self.last_close
+        self.last_close = close
+
+    def _decay_emas(self, close, k):
+        """Apply k more constant-price bars to the recursive EMA state in closed form."""
+        for p, prev in self.ema.items():
+            self.ema[p] = close + (prev - close) * (1 - _alpha(p)) ** k
+        self.ema_fast = close + (self.ema_fast - close) * (1 - _alpha(MACD_FAST)) ** k
+        self.ema_slow = close + (self.ema_slow - close) * (1 - _alpha(MACD_SLOW)) ** k
+        macd_line = self.ema_fast - self.ema_slow
+        self.macd_signal = macd_line + (self.macd_signal - macd_line) * (1 - _alpha(MACD_SIGNAL)) ** k
+
+    # ---------------- read side ----------------
+    def snapshot(self):
+        """
+        Indicator dict for the bar series (committed bars + open bar).
+        Keys match indicators.compute_signals (minus token/tradingsymbol meta).
+        """
+        if self.cur_sec is None:
+            return {}
+        x = self.cur_close if self.cur_close is not None else self.last_close
+        vol = self.cur_vol
+        # bars spanned by the tick window (what len(series) is in compute_signals)
+        n = self.cur_sec - self.ticks[0][0] + 1 if self.ticks else 1
+        prev = self.last_close
+
+        out = {"last": float(x)}
+        for p in SMA_PERIODS:
+            out[f"ma{p}"] = float((self.sma[p].total + x) / p) if n >= p else None
+        for p in EMA_PERIODS:
+            e = self.ema[p]
+            out[f"ema{p}"] = float(x if e is None else e + _alpha(p) * (x - e))
+
+        # RSI: rolling mean of clipped diffs over the last RSI_PERIOD diffs
+        if n >= RSI_PERIOD + 2:
+            d = x - prev
+            gain = (self.gain.total + (d if d > 0 else 0.0)) / RSI_PERIOD
+            loss = (self.loss.total + (-d if d < 0 else 0.0)) / RSI_PERIOD
+            rs = gain / (loss + 1e-9)
+            out["rsi14"] = float(100 - (100 / (1 + rs)))
+        else:
+            out["rsi14"] = None
+
+        if n >= MACD_SLOW:
+            fast = x if self.ema_fast is None else self.ema_fast + _alpha(MACD_FAST) * (x - self.ema_fast)
+            slow = x if self.ema_slow is None else self.ema_slow + _alpha(MACD_SLOW) * (x - self.ema_slow)
+            line = fast - slow
+            sig = line if self.macd_signal is None else self.macd_signal + _alpha(MACD_SIGNAL) * (line - self.macd_signal)
+            out["macd"] = float(line)
+            out["macd_signal"] = float(sig)
+        else:
+            out["macd"] = None
+            out["macd_signal"] = None
+
+        out["atr14"] = float((self.tr.total + abs(x - prev)) / ATR_PERIOD) if n >= ATR_PERIOD + 1 else None
+
+        if n >= BOLL_PERIOD:
+            bn, mean, m2 = self.boll.with_value(x)
+            std = math.sqrt(m2 / (bn - 1))
+            out["boll_up"] = float(mean + BOLL_STD * std)
+            out["boll_mid"] = float(mean)
+            out["boll_low"] = float(mean - BOLL_STD * std)
+        else:
+            out["boll_up"] = out["boll_mid"] = out["boll_low"] = None
+
+        v_total = self.v_total + self.cur_bar[1]
+        out["vwap"] = float((self.pv_total + x * self.cur_bar[1]) / (v_total + 1e-9)) if v_total != 0 else None
+
+        r1 = float(x / prev - 1) if n >= 2 and prev else None
+        out["ret1"] = r1
+
+        try:
+            out["ema_cross"] = bool(out["ema5"] is not None and out["ema15"] is not None and out["ema5"] > out["ema15"])
+        except Exception:
+            out["ema_cross"] = None
+
+        # volume normalization relative to recent average (mirrors compute_signals semantics)
+        mean_vol = None
+        if n >= 10:
+            nonzero = sum(self.vol_nonzero) + (1 if vol != 0 else 0)
+            if n >= VOL_NORM_PERIOD and nonzero == VOL_NORM_PERIOD:
+                mean_vol = (self.vol_win.total + vol) / VOL_NORM_PERIOD
+        else:
+            mean_vol = v_total / n
+        out["tick_vol_ratio"] = float(vol / (mean_vol + 1e-9)) if mean_vol and mean_vol > 0 else None
+
+        out["tick_ret1"] = r1
+        out["tick_ret1_lag"] = float(prev / self.prev_close - 1) if n >= 3 and self.prev_close else None
+
+        score = 0.0
+        count = 0.0
+        if out.get("ema_cross"):
+            score += 1.0; count += 1.0
+        if out.get("rsi14") is not None:
+            score += (50 - min(max(out["rsi14"], 0), 100)) / 50.0
+            count += 1.0
+        if out.get("tick_vol_ratio") is not None:
+            score += min(max(out["tick_vol_ratio"], 0), 3) / 3.0
+            count += 1.0
+        out["score"] = (score / count) if count > 0 else None
+        return out
+
+
+class IndicatorEngine:
+    """Singleton registry of IndicatorState per token (str key, same as TickBuffer)."""
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, window=500):
+        self.window = window
+        self.states = {}
+        self.lock = Lock()
+
+    def update(self, token, ts_ns, ltp, volume, tradingsymbol=None):
+        key = str(token)
+        with self.lock:
+            st = self.states.get(key)
+            if st is None:
+                st = self.states[key] = IndicatorState(self.window)
+            st.update(ts_ns, ltp, volume)
+            if tradingsymbol is not None:
+                st.tradingsymbol = tradingsymbol
+
+    def signals(self, token):
+        """Same dict shape as indicators.compute_signals(token); {} if the token has no data."""
+        key = str(token)
+        with self.lock:
+            st = self.states.get(key)
+            if st is None:
+                return {}
+            out = st.snapshot()
+            if not out:
+                return {}
+            out["token"] = key
+            out["tradingsymbol"] = st.tradingsymbol
+        return out
+
+    def reset(self, token=None):
+        with self.lock:
+            if token is None:
+                self.states.clear()
+            else:
+                self.states.pop(str(token), None)
@@ -1,16 +1,78 @@
 # app/indicators.py
 """
 Indicators & TickBuffer.
-- TickBuffer: in-memory deque storing recent ticks (token, ltp, volume, timestamp, raw)
+- TickBuffer: per-token columnar ring buffers (timestamp ns, ltp, volume) backed by preallocated NumPy arrays
 - compute_signals(token): returns dict of indicator values (safe if not enough data)
+- compute_signals_incremental(token): same dict from the O(1)-per-tick IndicatorEngine state
 - Designed to be robust to different tick payload shapes coming from Kite/yfinance/other.
 """
 
+import os
+import time
 import collections
 import pandas as pd
 import numpy as np
 from threading import Lock
-from datetime import datetime
+
+from .indicator_engine import IndicatorEngine
+
+# per-token history length (ticks) kept by TickBuffer
+TICK_BUFFER_CAPACITY = int(os.getenv("TICK_BUFFER_CAPACITY", "5000"))
+
+TickView = collections.namedtuple("TickView", ["ts", "ltp", "volume"])
+
+
+def _to_epoch_ns(ts_val):
+    """
+    Convert the tolerant timestamp forms we accept into int64 epoch nanoseconds (UTC).
+    Numeric values are treated as epoch seconds (same as before); None -> now.
+    """
+    if ts_val is None:
+        return time.time_ns()
+    try:
+        if isinstance(ts_val, (int, float)):
+            return int(float(ts_val) * 1_000_000_000)
+        t = pd.Timestamp(ts_val)
+        if t.tzinfo is None:
+            t = t.tz_localize("UTC")
+        return int(t.value)
+    except Exception:
+        return time.time_ns()
+
+
+class _TokenRing:
+    """
+    Fixed-capacity ring for one instrument.
+    Every row is written twice (at i and i + capacity) so the last n rows are always
+    one contiguous slice -> view() can hand out NumPy views without copying.
+    """
+    __slots__ = ("capacity", "ts", "ltp", "volume", "head", "count", "tradingsymbol", "raw")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ts = np.zeros(2 * capacity, dtype=np.int64)
+        self.ltp = np.full(2 * capacity, np.nan, dtype=np.float64)
+        self.volume = np.full(2 * capacity, np.nan, dtype=np.float64)
+        self.head = 0  # next write position in [0, capacity)
+        self.count = 0
+        self.tradingsymbol = None
+        self.raw = None
+
+    def append(self, ts_ns, ltp, vol):
+        i = self.head
+        j = i + self.capacity
+        self.ts[i] = self.ts[j] = ts_ns
+        self.ltp[i] = self.ltp[j] = ltp
+        self.volume[i] = self.volume[j] = vol
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def view(self, n=None):
+        n = self.count if n is None else max(0, min(int(n), self.count))
+        end = self.head + self.capacity
+        return TickView(self.ts[end - n:end], self.ltp[end - n:end], self.volume[end - n:end])
+
 
 # ---- Tick buffer singleton ----
 class TickBuffer:
@@ -22,15 +84,15 @@ class TickBuffer:
             cls._instance = cls()
         return cls._instance
 
-    def __init__(self, maxlen=20_000):
-        self.maxlen = maxlen
-        self.buf = collections.deque(maxlen=maxlen)
+    def __init__(self, capacity=TICK_BUFFER_CAPACITY):
+        self.capacity = int(capacity)
+        self.rings = {}  # token (str) -> _TokenRing
         self.lock = Lock()
 
     def push(self, tick):
         """
         Accepts tick dicts from various sources (Kite, yfinance fallback, etc.)
-        Normalizes into {token, ltp, volume, timestamp, raw}
+        Normalizes into (token, ltp, volume, timestamp) and appends to the token's ring in O(1).
         - tolerant: accepts 'last_price', 'ltp', 'price', 'last_trade_price'
         - volume tolerant keys: 'volume','last_quantity','tick_volume'
         - timestamp tolerant keys: 'timestamp','tick_timestamp','exchange_timestamp'
@@ -63,55 +125,68 @@ class TickBuffer:
                     except Exception:
                         continue
 
-            # timestamp
+            # timestamp (epoch seconds or ISO string / datetime)
             ts_val = tick.get("timestamp") or tick.get("tick_timestamp") or tick.get("exchange_timestamp") or tick.get("time")
-            if ts_val is None:
-                ts = datetime.utcnow()
-            else:
-                # accept epoch numeric or ISO string
-                try:
-                    if isinstance(ts_val, (int, float)):
-                        ts = pd.to_datetime(float(ts_val), unit="s", utc=True)
-                    else:
-                        ts = pd.to_datetime(ts_val, utc=True)
-                except Exception:
-                    ts = datetime.utcnow()
+            ts_ns = _to_epoch_ns(ts_val)
 
             # tradingsymbol if present
             tradingsymbol = tick.get("tradingsymbol") or tick.get("symbol") or tick.get("instrument_token") or None
 
-            normalized = {
-                "token": token_key,
-                "ltp": ltp,
-                "volume": vol,
-                "timestamp": ts,
-                "tradingsymbol": tradingsymbol,
-                "raw": tick
-            }
             with self.lock:
-                self.buf.append(normalized)
+                ring = self.rings.get(token_key)
+                if ring is None:
+                    ring = self.rings[token_key] = _TokenRing(self.capacity)
+                ring.append(ts_ns, np.nan if ltp is None else ltp, np.nan if vol is None else vol)
+                ring.tradingsymbol = tradingsymbol
+                ring.raw = tick
+            # keep the streaming indicator state in step with the buffer
+            IndicatorEngine.instance().update(token_key, ts_ns, ltp, vol, tradingsymbol)
         except Exception:
             # be forgiving: don't raise from push
             return
 
+    def tokens(self):
+        with self.lock:
+            return list(self.rings.keys())
+
+    def view(self, token, n=None):
+        """
+        Zero-copy view of the last n ticks for token as TickView(ts, ltp, volume) NumPy arrays
+        (ts is int64 epoch ns, oldest -> newest). Returns None if the token is unknown.
+        The arrays alias the ring storage: copy them if you need them to survive later pushes.
+        """
+        with self.lock:
+            ring = self.rings.get(str(token))
+            if ring is None:
+                return None
+            return ring.view(n)
+
     def to_dataframe(self, token=None, window=500):
         """
         Return a DataFrame for the given token (or all tokens if token None).
         Index is timezone-aware timestamp.
         Resample to 1-second bars and forward/backfill missing prices.
         """
+        frames = []
         with self.lock:
-            rows = [r for r in list(self.buf) if (token is None or r["token"] == str(token))]
-        if not rows:
+            keys = list(self.rings.keys()) if token is None else [str(token)]
+            for key in keys:
+                ring = self.rings.get(key)
+                if ring is None or ring.count == 0:
+                    continue
+                v = ring.view(window)
+                frames.append(pd.DataFrame({
+                    "timestamp": v.ts.copy(),
+                    "ltp": v.ltp.copy(),
+                    "volume": v.volume.copy(),
+                    "token": key,
+                    "tradingsymbol": ring.tradingsymbol,
+                    "raw": [ring.raw] * len(v.ts),
+                }))
+        if not frames:
             return pd.DataFrame()
-        df = pd.DataFrame(rows)
-        # ensure timestamp column and proper index
-        if "timestamp" not in df.columns:
-            return pd.DataFrame()
-        try:
-            df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-        except Exception:
-            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce").fillna(pd.Timestamp.utcnow())
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ns", utc=True)
         df = df.set_index("timestamp").sort_index()
         # keep only last `window` rows by index
         if window is not None:
@@ -205,7 +280,9 @@ def compute_signals(token, window=500):
     Returns dict with keys:
       - last, ma5, ma15, ema20, ema50, rsi14, macd, macd_signal, atr14,
         boll_up, boll_mid, boll_low, vwap, ret1, ema_cross (True/False)
-      - compatibility keys: r1, r2, vol_norm (for older ML models)
+      - tick-level keys: tick_ret1 (1s-bar return), tick_ret1_lag (previous one),
+        tick_vol_ratio (volume / 50-bar mean). Named apart from the feature store's r1 / r2 /
+        vol_norm (bar formulas the model trains on) so they never bind to model features
     If not enough data for an indicator, its value is None.
     """
     tb = TickBuffer.instance()
@@ -249,19 +326,19 @@ def compute_signals(token, window=500):
     try:
         mean_vol = float(vol.replace(0, np.nan).rolling(50).mean().iloc[-1]) if len(vol) >= 10 else (float(vol.mean()) if len(vol)>0 else None)
         if mean_vol and mean_vol > 0:
-            out["vol_norm"] = float((vol.iloc[-1]) / (mean_vol + 1e-9))
+            out["tick_vol_ratio"] = float((vol.iloc[-1]) / (mean_vol + 1e-9))
         else:
-            out["vol_norm"] = None
+            out["tick_vol_ratio"] = None
     except Exception:
-        out["vol_norm"] = None
+        out["tick_vol_ratio"] = None
 
-    # Backwards compatibility: some pre-existing ML expected 'r1','r2' (simple returns)
+    # tick-level returns (not the model's r1 / r2, see feature_store)
     try:
-        out["r1"] = float(s.pct_change().shift(0).iloc[-1]) if len(s) >= 2 else None
-        out["r2"] = float(s.pct_change().shift(1).iloc[-1]) if len(s) >= 3 else None
+        out["tick_ret1"] = float(s.pct_change().shift(0).iloc[-1]) if len(s) >= 2 else None
+        out["tick_ret1_lag"] = float(s.pct_change().shift(1).iloc[-1]) if len(s) >= 3 else None
     except Exception:
-        out["r1"] = None
-        out["r2"] = None
+        out["tick_ret1"] = None
+        out["tick_ret1_lag"] = None
 
     # Add a simple "score" aggregator (optional)
     try:
@@ -273,8 +350,8 @@ def compute_signals(token, window=500):
             # lower RSI = more buy-y; scale to 0..1
             score += (50 - min(max(out["rsi14"], 0), 100))/50.0
             count += 1.0
-        if out.get("vol_norm") is not None:
-            score += min(max(out["vol_norm"], 0), 3)/3.0
+        if out.get("tick_vol_ratio") is not None:
+            score += min(max(out["tick_vol_ratio"], 0), 3)/3.0
             count += 1.0
         out["score"] = (score / count) if count>0 else None
     except Exception:
@@ -289,3 +366,11 @@ def compute_signals(token, window=500):
         pass
 
     return out
+
+
+def compute_signals_incremental(token):
+    """
+    Same keys as compute_signals(token), read from the streaming IndicatorEngine state that
+    TickBuffer.push() updates in O(1) per tick (no DataFrame / resample on the hot path).
+    """
+    return IndicatorEngine.instance().signals(token)
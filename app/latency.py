@@ -0,0 +1,195 @@
+# app/latency.py
+"""
+Tick-to-signal latency instrumentation.
+
+- Ticks are stamped with a monotonic receive time in streamer.on_tick (TICK_STAMP_KEY).
+- Each pipeline stage records its duration into a per-stage LatencyHistogram.
+- Histograms are HDR-style log-linear buckets (32 sub-buckets per power of two, ~3% value
+  precision) over integer nanoseconds, preallocated and updated without locks: a record is
+  a couple of list increments, so the hot path never waits on another thread. Under heavy
+  thread contention an increment can very rarely be lost; percentiles stay accurate.
+- render_prometheus() / snapshot() expose p50/p99/p999 per stage for /metrics and the admin API.
+
+Stages used by the app:
+  streamer        Kite on_tick frame processing (parse + candle + frontend hand-off)
+  frontend_send   tick receive -> frontend WebSocket send completed (streamer clients)
+  queue           tick receive -> StrategyEngine.on_ticks start
+  indicators      indicator update + snapshot for a frame
+  ml              model predict_proba for a frame
+  register        OrderManager.register_signal for a frame's signals
+  ws_send         signal enqueued for WS -> sent by ws_broadcast
+  end_to_end      tick receive -> signals registered
+"""
+
+import time
+from threading import Lock
+from typing import Dict, Iterable, Optional
+
+TICK_STAMP_KEY = "_recv_ns"
+
+SUB_BITS = 5
+_SUB_COUNT = 1 << SUB_BITS
+_MAX_SHIFT = 40  # values up to ~2^46 ns (~19h) before clamping
+_N_BUCKETS = (_MAX_SHIFT + 2) * _SUB_COUNT
+
+STAGES = ("streamer", "frontend_send", "queue", "indicators", "ml", "register", "ws_send", "end_to_end")
+
+
+def now_ns() -> int:
+    return time.monotonic_ns()
+
+
+def _bucket_index(v: int) -> int:
+    if v < 2 * _SUB_COUNT:
+        return v if v > 0 else 0
+    shift = v.bit_length() - SUB_BITS - 1
+    if shift > _MAX_SHIFT:
+        return _N_BUCKETS - 1
+    return shift * _SUB_COUNT + (v >> shift)
+
+
+def _bucket_upper(idx: int) -> int:
+    """Highest value (ns) that maps to bucket idx."""
+    if idx < 2 * _SUB_COUNT:
+        return idx
+    shift = idx // _SUB_COUNT - 1
+    mant = idx - shift * _SUB_COUNT
+    return ((mant + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    __slots__ = ("name", "counts", "count", "total_ns", "max_ns")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, value_ns: int):
+        v = int(value_ns)
+        if v < 0:
+            v = 0
+        self.counts[_bucket_index(v)] += 1
+        self.count += 1
+        self.total_ns += v
+        if v > self.max_ns:
+            self.max_ns = v
+
+    def percentile(self, q: float) -> Optional[int]:
+        counts = list(self.counts)
+        total = sum(counts)
+        if total == 0:
+            return None
+        target = max(1, int(q * total + 0.5))
+        seen = 0
+        for idx, c in enumerate(counts):
+            if c:
+                seen += c
+                if seen >= target:
+                    return min(_bucket_upper(idx), self.max_ns)
+        return self.max_ns
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        def us(v):
+            return None if v is None else v / 1000.0
+        count = self.count
+        return {
+            "count": count,
+            "mean_us": (self.total_ns / count / 1000.0) if count else None,
+            "p50_us": us(self.percentile(0.50)),
+            "p99_us": us(self.percentile(0.99)),
+            "p999_us": us(self.percentile(0.999)),
+            "max_us": us(self.max_ns) if count else None,
+        }
+
+    def reset(self):
+        self.counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+
+_histograms: Dict[str, LatencyHistogram] = {name: LatencyHistogram(name) for name in STAGES}
+_hist_lock = Lock()  # only taken when a new stage name is first seen
+
+
+def histogram(stage: str) -> LatencyHistogram:
+    h = _histograms.get(stage)
+    if h is None:
+        with _hist_lock:
+            h = _histograms.get(stage)
+            if h is None:
+                h = _histograms[stage] = LatencyHistogram(stage)
+    return h
+
+
+def record(stage: str, value_ns: int):
+    histogram(stage).record(value_ns)
+
+
+def record_since(stage: str, start_ns: Optional[int], end_ns: Optional[int] = None):
+    """Record end - start for a stage; no-op when start is unknown (e.g. tick not from streamer)."""
+    if start_ns is None:
+        return
+    histogram(stage).record((end_ns if end_ns is not None else now_ns()) - start_ns)
+
+
+def tick_stamp(tick) -> Optional[int]:
+    try:
+        return tick.get(TICK_STAMP_KEY)
+    except Exception:
+        return None
+
+
+def earliest_stamp(ticks: Iterable) -> Optional[int]:
+    stamps = [s for s in (tick_stamp(t) for t in ticks) if s is not None]
+    return min(stamps) if stamps else None
+
+
+def snapshot() -> Dict[str, Dict[str, Optional[float]]]:
+    return {name: h.snapshot() for name, h in list(_histograms.items())}
+
+
+def reset():
+    for h in list(_histograms.values()):
+        h.reset()
+
+
+# ---------------------------
+# Prometheus text exposition
+# ---------------------------
+def _fmt(v) -> str:
+    if v is None:
+        return "NaN"
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    return repr(float(v))
+
+
+def render_prometheus(gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """
+    Prometheus text format (0.0.4): one summary per stage in seconds, plus optional
+    gauge groups {metric_prefix: {name: value}} (pipeline / cache counters).
+    """
+    lines = [
+        "# HELP algo_latency_seconds Tick-to-signal stage latency",
+        "# TYPE algo_latency_seconds summary",
+    ]
+    for name, h in sorted(_histograms.items()):
+        for q in (0.5, 0.99, 0.999):
+            p = h.percentile(q)
+            lines.append(f'algo_latency_seconds{{stage="{name}",quantile="{q}"}} {_fmt(None if p is None else p / 1e9)}')
+        lines.append(f'algo_latency_seconds_sum{{stage="{name}"}} {_fmt(h.total_ns / 1e9)}')
+        lines.append(f'algo_latency_seconds_count{{stage="{name}"}} {h.count}')
+    lines.append("# TYPE algo_latency_max_seconds gauge")
+    for name, h in sorted(_histograms.items()):
+        lines.append(f'algo_latency_max_seconds{{stage="{name}"}} {_fmt(h.max_ns / 1e9)}')
+    for prefix, values in (gauges or {}).items():
+        for key, val in sorted(values.items()):
+            if isinstance(val, (int, float)) or val is None:
+                metric = f"algo_{prefix}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {_fmt(val)}")
+    return "\n".join(lines) + "\n"
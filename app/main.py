@@ -229,16 +229,75 @@ def self_test():
 def health():
     return {"ok": True, "time": int(time.time())}
 
+# =====================================================
+# METRICS (Prometheus text format)
+# =====================================================
+from fastapi.responses import PlainTextResponse
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    from app import latency
+    gauges = {}
+    try:
+        from app.signal_pipeline import SignalPipeline
+        if SignalPipeline._instance is not None:
+            gauges["signal_pipeline"] = SignalPipeline._instance.metrics()
+    except Exception:
+        log.debug("metrics: signal pipeline unavailable", exc_info=True)
+    try:
+        from app.broadcast_hub import BroadcastHub
+        gauges["broadcast_hub"] = BroadcastHub.instance().stats()
+        from app.ws_broadcast import hub_stats
+        gauges["ws_broadcast"] = hub_stats()
+    except Exception:
+        log.debug("metrics: broadcast hub unavailable", exc_info=True)
+    try:
+        from app.sentiment_cache import SentimentCache
+        gauges["sentiment_cache"] = SentimentCache.instance().stats()
+    except Exception:
+        log.debug("metrics: sentiment cache unavailable", exc_info=True)
+    try:
+        from app.tick_store import TickRecorder
+        gauges["tick_recorder"] = TickRecorder.instance().stats()
+    except Exception:
+        log.debug("metrics: tick recorder unavailable", exc_info=True)
+    return PlainTextResponse(latency.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
 # =====================================================
 # STARTUP / SHUTDOWN
 # =====================================================
 @app.on_event("startup")
 async def startup():
     init_db()
+    try:
+        from app.streamer import set_event_loop
+        set_event_loop(asyncio.get_running_loop())
+    except Exception:
+        log.exception("Failed to set streamer event loop")
+    try:
+        from app.ws_broadcast import start_ws_broadcast_loop
+        await start_ws_broadcast_loop()
+    except Exception:
+        log.exception("Failed to start WS broadcast loop")
+    try:
+        from app.sentiment_cache import SentimentCache
+        SentimentCache.instance().start_listener()
+    except Exception:
+        log.exception("Failed to start sentiment cache listener")
     log.info("✅ Algo Trader Backend Started")
 
 @app.on_event("shutdown")
 async def shutdown():
+    try:
+        from app.signal_pipeline import shutdown_pipeline
+        shutdown_pipeline()
+    except Exception:
+        log.exception("Failed to flush signal pipeline")
+    try:
+        from app.tick_store import TickRecorder
+        TickRecorder.instance().stop()
+    except Exception:
+        log.exception("Failed to flush tick recorder")
     log.info("🛑 Algo Trader Backend Stopped")
 
 # =====================================================
@@ -4,74 +4,150 @@ ML model wrapper: RandomForest starter model.
 Features added:
  - train_dummy(...) (unchanged) but now saves metadata via crud.save_model_metadata
  - train_from_yfinance(...) same as before
- - load_model_from_path(path) -> loads pickle into memory
- - load_latest_model_from_db() -> loads model file path recorded in DB (crud.get_latest_model)
+ - load_model_from_path(path) / load_model_version(id) / load_latest_model_from_db() -> load through the model registry
+   (model_registry.ModelRegistry): background loader thread, validation, warm-up, then an
+   atomic swap; wait=False returns a Future instead of blocking
  - predict(...) and predict_from_symbol(...) unchanged and use in-memory model
+ - predict_proba_batch(rows) -> prob_up for many feature dicts with one predict_proba call
+ - predict / predict_proba_batch score through a flattened copy of the forest
+   (forest_inference.FlatForest, same probabilities as sklearn) instead of sklearn's
+   per-call validation / thread-pool overhead
+ - the served model is one ModelVersion reference (self.active): each predict call reads it
+   once, so a swap never mixes two versions inside a call; inference latency is recorded per version
+ - train_dummy writes a versioned file (app/storage/models/) and registers it in ml_models
+ - training features come from the feature store registry (services/feature_store), the same
+   definitions walk_forward and the backtest scripts read
+ - module-level load / load_version / load_latest / rollback / versions / model / model_path for the API
+
+Config via .env:
+  ML_FAST_INFERENCE=true      # false -> always call sklearn predict_proba
 """
+import math
+import os
+import time
 import pickle
+from datetime import datetime
 from pathlib import Path
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 
 from .historical_fetcher import fetch_recent_ohlc
-from .crud import save_model_metadata, get_latest_model
+from .crud import save_model_metadata
+from .model_registry import ModelRegistry, ModelVersion
+from .services import feature_store
 
 MODEL_FILE = Path("app/storage/rf_model.pkl")
+MODEL_DIR = Path("app/storage/models")
+FEATURES = ['r1','r2','vol_norm']
+FAST_INFERENCE = os.getenv("ML_FAST_INFERENCE", "true").lower() in ("1","true","yes")
+VOL_WINDOW = 20
+
+
+def _last_row_features(recent_df: pd.DataFrame):
+    """
+    FEATURES of the newest row, as predict() computes them over the whole frame (nan -> 0).
+    vol_norm uses the exactly rounded mean of the last 20 volumes (pandas' running rolling
+    mean can differ from it in the last bit). None if the frame cannot be read this way.
+    """
+    try:
+        last = recent_df.iloc[-1]
+        o, h, l, c = float(last['open']), float(last['high']), float(last['low']), float(last['close'])
+        vol = recent_df['volume'].iloc[-VOL_WINDOW:].to_numpy(dtype=np.float64)
+    except Exception:
+        return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r1 = np.float64(c - o) / np.float64(o)
+        r2 = np.float64(h - l) / np.float64(o)
+    vol_norm = vol[-1] - math.fsum(vol) / VOL_WINDOW if len(vol) == VOL_WINDOW else 0.0
+    return np.nan_to_num(np.array([r1, r2, vol_norm]), nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+
+def _names(v):
+    """Feature order expected by version v (falls back to FEATURES)."""
+    return list(v.features) if v is not None and v.features else list(FEATURES)
+
 
 class MLModel:
     def __init__(self):
-        self.model = None
+        # served version (model + flat forest + stats); replaced as a whole by swap()
+        self.active = None
+        registry = ModelRegistry.instance()
         # try load local MODEL_FILE first
         if MODEL_FILE.exists():
             try:
-                self.model = pickle.loads(MODEL_FILE.read_bytes())
+                registry.activate(registry.prepare(path=MODEL_FILE), target=self)
             except Exception:
-                self.model = None
+                self.active = None
         else:
             # try to load latest model referenced in DB
             try:
-                latest = get_latest_model()
-                if latest and latest.filename:
-                    p = Path(latest.filename)
-                    if p.exists():
-                        self.model = pickle.loads(p.read_bytes())
+                registry.activate(registry.prepare(), target=self)
             except Exception:
-                self.model = None
+                self.active = None
 
-    def load_model_from_path(self, path: str):
-        """
-        Load a pickle model file into memory from given path.
-        Accepts absolute path or relative path under project root.
-        """
-        p = Path(path)
-        if not p.exists():
-            # try under app/storage
-            alt = Path("app/storage") / p.name
-            if alt.exists():
-                p = alt
-        if not p.exists():
-            raise FileNotFoundError(f"Model file not found: {path}")
-        data = p.read_bytes()
-        m = pickle.loads(data)
-        self.model = m
-        # also copy to central MODEL_FILE for consistency (optional)
+    @property
+    def model(self):
+        v = self.active
+        return v.model if v is not None else None
+
+    @model.setter
+    def model(self, m):
+        """Direct assignment (scripts) serves m as an unregistered version."""
+        self.swap(ModelVersion(m) if m is not None else None)
+
+    @property
+    def model_path(self):
+        v = self.active
+        return v.path if v is not None else None
+
+    def swap(self, version):
+        """Serve `version` from now on (a single reference assignment); returns the previous one."""
+        prev, self.active = self.active, version
+        return prev
+
+    def _persist(self, v):
+        """Copy the activated model file to MODEL_FILE, which is what the next startup loads."""
         try:
+            if not v.path or Path(v.path).resolve() == MODEL_FILE.resolve():
+                return
             MODEL_FILE.parent.mkdir(parents=True, exist_ok=True)
-            MODEL_FILE.write_bytes(data)
+            tmp = MODEL_FILE.with_suffix(".tmp")
+            tmp.write_bytes(Path(v.path).read_bytes())
+            os.replace(tmp, MODEL_FILE)
         except Exception:
             pass
+
+    def _load(self, **kw):
+        """Registry load into this wrapper; MODEL_FILE follows the new version once it is active."""
+        return ModelRegistry.instance().load(target=self, then=self._persist, **kw)
+
+    def load_model_from_path(self, path: str, wait: bool = True):
+        """
+        Load a pickle model file through the registry: unpickled, validated and warmed up in the
+        loader thread, then swapped in. Accepts absolute path or relative path under project root
+        (falls back to app/storage/<name>). wait=False returns the Future right away.
+        """
+        fut = self._load(path=path)
+        if not wait:
+            return fut
+        fut.result()
         return True
 
-    def load_latest_model_from_db(self):
+    def load_model_version(self, model_id: int, wait: bool = True):
+        """Load the ml_models row `model_id` (instant if the registry still holds it)."""
+        fut = self._load(model_id=model_id)
+        return fut.result() if wait else fut
+
+    def load_latest_model_from_db(self, wait: bool = True):
         """
-        Load the latest model path from DB (crud.get_latest_model()) and load it.
+        Load the latest model in ml_models (the active row if any) through the registry.
         """
-        latest = get_latest_model()
-        if not latest or not latest.filename:
-            return False
+        fut = self._load()
+        if not wait:
+            return fut
         try:
-            self.load_model_from_path(latest.filename)
+            fut.result()
             return True
         except Exception:
             return False
@@ -91,30 +167,36 @@ class MLModel:
         df = df.dropna().reset_index(drop=True)
         df['up'] = (df['return_next'] > 0).astype(int)
 
-        # features
-        df['r1'] = (df['close'] - df['open']) / df['open']
-        df['r2'] = (df['high'] - df['low']) / df['open']
-        df['vol_norm'] = (df['volume'] - df['volume'].rolling(20).mean()).fillna(0)
-
-        features = ['r1','r2','vol_norm']
-        X = df[features].fillna(0)
+        # features (feature store definitions, shared with walk_forward and the backtest scripts)
+        features = list(FEATURES)
+        X = feature_store.compute(df, features).fillna(0)
         y = df['up']
 
         m = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
         m.fit(X, y)
-        self.model = m
 
+        data = pickle.dumps(m)
+        MODEL_DIR.mkdir(parents=True, exist_ok=True)
+        version_file = MODEL_DIR / f"rf_{datetime.utcnow():%Y%m%d_%H%M%S_%f}.pkl"
+        version_file.write_bytes(data)
         MODEL_FILE.parent.mkdir(parents=True, exist_ok=True)
-        MODEL_FILE.write_bytes(pickle.dumps(m))
+        MODEL_FILE.write_bytes(data)
 
         # Save metadata in DB (crud)
+        model_id = None
         try:
-            save_model_metadata(filename=str(MODEL_FILE), rows=len(X), metrics={"n_estimators": m.n_estimators}, notes="trained via train_dummy", active=True)
+            row = save_model_metadata(filename=str(version_file), rows=len(X), metrics={"n_estimators": m.n_estimators}, notes="trained via train_dummy", active=True)
+            model_id = row.id
         except Exception:
             # do not break training response on DB write failure
             pass
 
-        return {"success": True, "trained_rows": len(X)}
+        try:
+            ModelRegistry.instance().add(m, model_id=model_id, path=version_file, target=self)
+        except Exception:
+            self.model = m
+
+        return {"success": True, "trained_rows": len(X), "model_id": model_id}
 
     def train_from_yfinance(self, yf_symbol: str, period: str = "6mo", interval: str = "5m"):
         """
@@ -131,22 +213,79 @@ class MLModel:
         recent_df: DataFrame with open,high,low,close,volume (rows sorted oldest->newest)
         Returns: {"prob_down": x, "prob_up": y}
         """
-        if self.model is None:
+        v = self.active
+        if v is None:
             return {"prob_down": 0.5, "prob_up": 0.5}
-        df = recent_df.copy().reset_index(drop=True)
-        if df.empty:
+        if recent_df.empty:
             return {"prob_down": 0.5, "prob_up": 0.5}
+        flat = v.flat if FAST_INFERENCE else None
+        if flat is not None and _names(v) == FEATURES:
+            x = _last_row_features(recent_df)
+            if x is not None:
+                if not np.isfinite(x).all():
+                    # sklearn rejects inf input; predict() answered 0.5 / 0.5 for it
+                    return {"prob_down": 0.5, "prob_up": 0.5}
+                try:
+                    t0 = time.perf_counter_ns()
+                    prob = flat.predict_proba(x[np.newaxis, :])[0]
+                    v.record(time.perf_counter_ns() - t0)
+                    return {"prob_down": float(prob[0]), "prob_up": float(prob[1])}
+                except Exception:
+                    pass
+        df = recent_df.copy().reset_index(drop=True)
         df['r1'] = (df['close'] - df['open']) / df['open']
         df['r2'] = (df['high'] - df['low']) / df['open']
         df['vol_norm'] = (df['volume'] - df['volume'].rolling(20).mean()).fillna(0)
         features = ['r1','r2','vol_norm']
         last = df[features].tail(1).fillna(0)
         try:
-            prob = self.model.predict_proba(last)[0]
+            t0 = time.perf_counter_ns()
+            prob = v.model.predict_proba(last)[0]
+            v.record(time.perf_counter_ns() - t0)
             return {"prob_down": float(prob[0]), "prob_up": float(prob[1])}
         except Exception:
             return {"prob_down": 0.5, "prob_up": 0.5}
 
+    def feature_names(self):
+        """Feature order expected by the loaded model (falls back to FEATURES)."""
+        return _names(self.active)
+
+    def predict_proba_batch(self, rows):
+        """
+        rows: list of feature dicts (e.g. indicator snapshots, one per token)
+        Builds one feature matrix (missing/None -> 0, same as training fillna(0)) and makes a
+        single predict_proba call. Returns np.ndarray of prob_up aligned with rows, or None.
+        """
+        ver = self.active
+        if ver is None or not rows:
+            return None
+        names = _names(ver)
+        X = np.zeros((len(rows), len(names)), dtype=np.float64)
+        for i, r in enumerate(rows):
+            for j, f in enumerate(names):
+                v = r.get(f) if r else None
+                if v is not None:
+                    try:
+                        X[i, j] = float(v)
+                    except Exception:
+                        pass
+        X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+        t0 = time.perf_counter_ns()
+        flat = ver.flat if FAST_INFERENCE else None
+        if flat is not None:
+            try:
+                proba = flat.predict_proba(X)
+                ver.record(time.perf_counter_ns() - t0)
+                return proba[:, 1].astype(float)
+            except Exception:
+                pass
+        try:
+            proba = ver.model.predict_proba(pd.DataFrame(X, columns=names))
+            ver.record(time.perf_counter_ns() - t0)
+            return proba[:, 1].astype(float)
+        except Exception:
+            return None
+
     def predict_from_symbol(self, yf_symbol: str, period: str = "2d", interval: str = "5m"):
         """
         Convenience wrapper: fetch recent OHLC then predict.
@@ -159,3 +298,31 @@ class MLModel:
 
 # singleton instance
 ml_model = MLModel()
+
+
+# ---- module-level API (app.api.routes uses the module: ml_model.load / load_latest / model_path)
+def load(path: str, wait: bool = True):
+    return ml_model.load_model_from_path(path, wait=wait)
+
+
+def load_latest(wait: bool = True):
+    return ml_model.load_latest_model_from_db(wait=wait)
+
+
+def load_version(model_id: int, wait: bool = True):
+    return ml_model.load_model_version(model_id, wait=wait)
+
+
+def rollback():
+    """Swap back to the previously active version (kept in memory by the registry)."""
+    return ModelRegistry.instance().rollback(target=ml_model).info()
+
+
+def versions():
+    return ModelRegistry.instance().versions(target=ml_model)
+
+
+def __getattr__(name):
+    if name in ("model", "model_path", "active"):
+        return getattr(ml_model, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,277 @@
+# app/model_registry.py
+"""
+In-memory registry of ML model versions, keyed by the `ml_models` table id (or the file path
+for models that are not in the table).
+
+MLModel serves from a single ModelVersion reference (model + flattened forest + stats); every
+predict call snapshots it once, so swapping versions is one attribute assignment and an
+in-flight StrategyEngine frame is always scored by exactly one version.
+
+ - load(model_id | path): runs in a background loader thread: unpickle, validate (predict_proba,
+   two classes, feature schema), flatten (forest_inference), warm up with a dummy batch (and
+   check the flat forest against sklearn on it), then swap into the MLModel. Returns a Future,
+   or the ModelVersion with wait=True. A version that fails any step is never served.
+ - add(model, ...): same validate / warm-up / swap for a model trained in this process
+ - the last ML_REGISTRY_KEEP versions stay in memory: activate(key) / rollback() swap back
+   to one of them without touching disk
+ - versions(): per-version schema, load / warm-up times and live inference latency
+   (calls, mean / max us, recorded by MLModel.predict / predict_proba_batch)
+
+Config via .env:
+  ML_REGISTRY_KEEP=3       # versions kept in memory (the active one is never evicted)
+  ML_WARMUP_ROWS=256       # rows in the warm-up batch
+"""
+
+import os
+import time
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from .forest_inference import try_flatten
+
+log = logging.getLogger(__name__)
+
+KEEP_VERSIONS = max(1, int(os.getenv("ML_REGISTRY_KEEP", "3")))
+WARMUP_ROWS = max(1, int(os.getenv("ML_WARMUP_ROWS", "256")))
+
+
+class ModelVersion:
+    """One loaded model: the estimator, its flattened forest (or None) and serving stats."""
+
+    def __init__(self, model, model_id=None, path=None):
+        self.model = model
+        self.id = model_id
+        self.path = str(path) if path else None
+        self.stamp = None  # (mtime_ns, size) of the file it was loaded from
+        self.flat = try_flatten(model)
+        names = getattr(model, "feature_names_in_", None)
+        self.features = [str(n) for n in names] if names is not None else None
+        self.n_features = getattr(model, "n_features_in_", None)
+        self.classes = [c.item() if hasattr(c, "item") else c for c in getattr(model, "classes_", [])]
+        self.loaded_at = datetime.utcnow()
+        self.load_ms = None
+        self.warm_us = None
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @property
+    def key(self):
+        return self.id if self.id is not None else self.path
+
+    def record(self, ns: int):
+        """Inference latency of one predict call (unlocked: stats may drop a sample under races)."""
+        self.calls += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def info(self):
+        return {
+            "id": self.id,
+            "path": self.path,
+            "type": type(self.model).__name__,
+            "features": self.features,
+            "n_features": self.n_features,
+            "classes": self.classes,
+            "flat": self.flat is not None,
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_ms": self.load_ms,
+            "warm_us": self.warm_us,
+            "calls": self.calls,
+            "mean_us": round(self.total_ns / self.calls / 1e3, 1) if self.calls else None,
+            "max_us": round(self.max_ns / 1e3, 1) if self.calls else None,
+        }
+
+
+def validate(v: ModelVersion):
+    """Raise ValueError if the model cannot serve MLModel.predict / predict_proba_batch."""
+    if not hasattr(v.model, "predict_proba"):
+        raise ValueError(f"{type(v.model).__name__} has no predict_proba")
+    if len(v.classes) != 2:
+        raise ValueError(f"expected a binary classifier, classes={v.classes}")
+    if not v.n_features:
+        raise ValueError("model is not fitted (no n_features_in_)")
+    if v.features is not None and len(v.features) != v.n_features:
+        raise ValueError("feature names do not match n_features_in_")
+
+
+def warm_up(v: ModelVersion, rows: int = WARMUP_ROWS):
+    """
+    Score a dummy batch through sklearn and the flat forest: pages the node arrays in, checks
+    the output, and drops the flat forest if it disagrees with sklearn (tolerance for sklearn's
+    threaded tree summation). Records the single-row serving latency in warm_us.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.normal(0.0, 1.0, (rows, v.n_features))
+    X[0] = 0.0
+    frame = X
+    if v.features is not None:
+        import pandas as pd
+        frame = pd.DataFrame(X, columns=v.features)
+    ref = np.asarray(v.model.predict_proba(frame))
+    if ref.shape != (rows, 2) or not np.all(np.isfinite(ref)):
+        raise ValueError(f"predict_proba returned shape {ref.shape} / non-finite values")
+    if v.flat is not None:
+        try:
+            ok = np.allclose(v.flat.predict_proba(X), ref, rtol=0.0, atol=1e-12)
+        except Exception as e:
+            log.warning("flat forest failed on warm-up batch: %s", e)
+            ok = False
+        if not ok:
+            log.warning("flat forest disagrees with sklearn for model %s; serving via sklearn", v.key)
+            v.flat = None
+
+    one = X[:1]
+    score = v.flat.predict_proba if v.flat is not None else (lambda a: v.model.predict_proba(frame[:1]))
+    score(one)
+    t0 = time.perf_counter_ns()
+    for _ in range(5):
+        score(one)
+    v.warm_us = round((time.perf_counter_ns() - t0) / 5 / 1e3, 1)
+
+
+def _default_target():
+    from .ml_model import ml_model
+    return ml_model
+
+
+class ModelRegistry:
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, keep: int = KEEP_VERSIONS):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self._versions = OrderedDict()  # key -> ModelVersion, least recently activated first
+        self._history = []              # keys in activation order (rollback walks it back)
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    # ---------- loading ----------
+    @staticmethod
+    def _resolve(model_id=None, path=None):
+        """(model_id, path) of the file to load; model_id / neither -> looked up in ml_models."""
+        if path is None:
+            from .crud import get_latest_model, get_model
+            row = get_model(model_id) if model_id is not None else (get_latest_model(active_only=True) or get_latest_model())
+            if not row or not row.filename:
+                raise FileNotFoundError(f"no ml_models row for id={model_id}")
+            model_id, path = row.id, row.filename
+        p = Path(path)
+        if not p.exists():
+            alt = Path("app/storage") / p.name
+            if alt.exists():
+                p = alt
+        if not p.exists():
+            raise FileNotFoundError(f"Model file not found: {path}")
+        return model_id, p
+
+    def prepare(self, model_id=None, path=None) -> ModelVersion:
+        """Load (or reuse the cached) version, validated and warmed; does not activate it."""
+        model_id, p = self._resolve(model_id, path)
+        st = p.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        key = model_id if model_id is not None else str(p)
+        with self.lock:
+            cached = self._versions.get(key)
+            if cached is not None and cached.stamp == stamp:
+                return cached
+        t0 = time.perf_counter()
+        v = ModelVersion(pickle.loads(p.read_bytes()), model_id=model_id, path=p)
+        v.stamp = stamp
+        validate(v)
+        warm_up(v)
+        v.load_ms = round((time.perf_counter() - t0) * 1e3, 1)
+        log.info("model %s loaded in %.1f ms (flat=%s, warm %.1f us)", v.key, v.load_ms, v.flat is not None, v.warm_us)
+        return v
+
+    def load(self, model_id=None, path=None, target=None, activate=True, wait=False, then=None):
+        """
+        Prepare in the loader thread, then swap into target (default: the ml_model singleton) and
+        call then(version) there, before the Future resolves.
+        """
+        def job():
+            v = self.prepare(model_id, path)
+            if activate:
+                self.activate(v, target)
+                if then is not None:
+                    then(v)
+            return v
+        fut = self._loader.submit(job)
+        return fut.result() if wait else fut
+
+    def add(self, model, model_id=None, path=None, target=None, activate=True) -> ModelVersion:
+        """Register a model already in memory (e.g. just trained); validated and warmed first."""
+        t0 = time.perf_counter()
+        v = ModelVersion(model, model_id=model_id, path=path)
+        if path is not None and Path(path).exists():
+            st = Path(path).stat()
+            v.stamp = (st.st_mtime_ns, st.st_size)
+        validate(v)
+        warm_up(v)
+        v.load_ms = round((time.perf_counter() - t0) * 1e3, 1)
+        if activate:
+            self.activate(v, target)
+        return v
+
+    # ---------- serving ----------
+    def activate(self, version, target=None) -> ModelVersion:
+        """Swap a version (ModelVersion or a cached key) into target; marks it active in ml_models."""
+        target = target or _default_target()
+        with self.lock:
+            v = version if isinstance(version, ModelVersion) else self._versions.get(version)
+            if v is None:
+                raise KeyError(f"model version {version} is not loaded")
+            self._versions[v.key] = v
+            self._versions.move_to_end(v.key)
+            if not self._history or self._history[-1] != v.key:
+                self._history.append(v.key)
+            target.swap(v)
+            self._evict()
+        if v.id is not None:
+            try:
+                from .crud import set_active_model
+                set_active_model(v.id)
+            except Exception as e:
+                log.debug("set_active_model(%s) failed: %s", v.id, e)
+        log.info("model %s active", v.key)
+        return v
+
+    def rollback(self, target=None) -> ModelVersion:
+        """Re-activate the previously active version that is still in memory."""
+        with self.lock:
+            hist = self._history[:-1]
+            while hist and hist[-1] not in self._versions:
+                hist.pop()
+            if not hist:
+                raise LookupError("no previous model version in memory")
+            prev = self._versions[hist[-1]]
+            self._history = hist[:-1]  # activate() pushes it again
+        return self.activate(prev, target)
+
+    def _evict(self):
+        active = self._history[-1] if self._history else None
+        while len(self._versions) > self.keep:
+            key = next(k for k in self._versions if k != active)
+            del self._versions[key]
+
+    def versions(self, target=None):
+        target = target or _default_target()
+        current = getattr(target, "active", None)
+        with self.lock:
+            items = list(self._versions.values())
+        if current is not None and all(v is not current for v in items):
+            items.append(current)
+        return [dict(v.info(), active=v is current) for v in reversed(items)]
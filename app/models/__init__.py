@@ -156,6 +156,57 @@ if not _class_defined("Tick"):
         ltp = Column(Float)
         raw = Column(JSON)
 
+
+# ------------------------------
+# Market data for backtests (filled in bulk by services/market_ingest)
+# ------------------------------
+if not _class_defined("MarketCandle"):
+    class MarketCandle(Base):
+        __tablename__ = "market_candles"
+        __table_args__ = (
+            UniqueConstraint("symbol", "interval", "ts", name="uq_market_candles_symbol_interval_ts"),
+            {"extend_existing": True},
+        )
+        id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+        symbol = Column(String(64), nullable=False)
+        interval = Column(String(16), nullable=False)
+        ts = Column(DateTime(timezone=True), nullable=False)
+        open = Column(Float)
+        high = Column(Float)
+        low = Column(Float)
+        close = Column(Float)
+        volume = Column(Float)
+
+
+if not _class_defined("MarketTick"):
+    class MarketTick(Base):
+        __tablename__ = "market_ticks"
+        __table_args__ = (
+            UniqueConstraint("symbol", "ts", name="uq_market_ticks_symbol_ts"),
+            {"extend_existing": True},
+        )
+        id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+        symbol = Column(String(64), nullable=False)
+        ts = Column(DateTime(timezone=True), nullable=False)
+        price = Column(Float)
+        volume = Column(Float)
+
+
+if not _class_defined("IngestCheckpoint"):
+    class IngestCheckpoint(Base):
+        __tablename__ = "ingest_checkpoints"
+        __table_args__ = (
+            UniqueConstraint("source", "symbol", "interval", name="uq_ingest_checkpoints_key"),
+            {"extend_existing": True},
+        )
+        id = Column(Integer, primary_key=True, index=True)
+        source = Column(String(128), nullable=False)
+        symbol = Column(String(64), nullable=False)
+        interval = Column(String(16), nullable=False)
+        last_ts = Column(DateTime(timezone=True), nullable=True)
+        rows = Column(BigInteger, default=0)
+        updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # ------------------------------
 # Credential & SocialAccount inline (referencing User from auth_models)
 # ------------------------------
@@ -311,6 +362,8 @@ __all__ = [
     "User", "PasswordReset", "Credential", "SocialAccount",
     # analytics
     "MLModelFile", "Sentiment", "Signal", "Instrument", "Tick",
+    # market data
+    "MarketCandle", "MarketTick", "IngestCheckpoint",
     # billing (legacy)
     "Subscription",
     # billing (new)
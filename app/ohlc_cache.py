@@ -0,0 +1,310 @@
+# app/ohlc_cache.py
+"""
+On-disk OHLC bar cache for historical_fetcher, keyed by (provider, symbol, interval).
+
+Training, backtests and predict_from_symbol ask for the same recent window (e.g. 60d of 5m bars)
+over and over; OhlcCache keeps the bars under
+OHLC_CACHE_DIR/<provider>/<symbol>/<interval>/ as time-partitioned columnar files (one per month
+for intraday intervals, one per year for daily and longer; .parquet, or .npz when no Parquet
+engine is installed) plus meta.json (tz, covered range, last fetch, partitions).
+
+get(provider, symbol, interval, period, fetch):
+ - cached window still fresh (last fetch younger than the max age) -> served from disk, no network
+ - stale -> fetch(start=<last cached bar>) for the missing tail only; the last cached bar is
+   fetched again, so a bar that was still forming when it was cached gets its final values
+ - window starts before what was ever fetched -> one fetch(start=None, period) for the whole
+   window (providers that cannot go back, e.g. Alpha Vantage, only ever append)
+ - fetch fails / returns nothing -> the cached bars are served (stale) instead of an empty frame
+New rows replace cached rows with the same timestamp; only the partitions they fall in are
+rewritten. The result is the requested period sliced out of the cache, oldest first.
+
+Freshness policy:
+  OHLC_CACHE_MAX_AGE_SEC   max age of the last fetch before the tail is refreshed
+                           (default: one bar of the interval, e.g. 300 for 5m; 0 = always refresh)
+  OHLC_CACHE_PARTIAL       keep (default) | drop - drop the latest bar while its interval has not
+                           closed yet (training / backtests on completed bars only)
+
+Config via .env:
+  OHLC_CACHE=true          # false -> historical_fetcher always downloads
+  OHLC_CACHE_DIR (default app/storage/ohlc_cache), OHLC_CACHE_MAX_AGE_SEC, OHLC_CACHE_PARTIAL
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .services.feature_store import has_parquet, index_ns
+
+log = logging.getLogger(__name__)
+
+USE_CACHE = os.getenv("OHLC_CACHE", "true").lower() in ("1", "true", "yes")
+OHLC_CACHE_DIR = os.getenv("OHLC_CACHE_DIR", "app/storage/ohlc_cache")
+_max_age = os.getenv("OHLC_CACHE_MAX_AGE_SEC", "").strip()
+MAX_AGE_SEC = float(_max_age) if _max_age else None
+DROP_PARTIAL = os.getenv("OHLC_CACHE_PARTIAL", "keep").lower() == "drop"
+
+OHLCV = ["open", "high", "low", "close", "volume"]
+META = "meta.json"
+
+_UNIT_SEC = {"m": 60, "min": 60, "h": 3600, "d": 86400, "wk": 7 * 86400, "mo": 30 * 86400}
+
+
+def interval_key(interval: str) -> str:
+    """'5min' -> '5m', '60min' -> '60m' (Alpha Vantage and yfinance spell minutes differently)."""
+    m = re.fullmatch(r"(\d+)min", str(interval).strip().lower())
+    return f"{m.group(1)}m" if m else str(interval).strip().lower()
+
+
+def interval_seconds(interval: str) -> int:
+    m = re.fullmatch(r"(\d+)(min|m|h|d|wk|mo)", str(interval).strip().lower())
+    if not m:
+        raise ValueError(f"unknown interval: {interval}")
+    return int(m.group(1)) * _UNIT_SEC[m.group(2)]
+
+
+def period_start(period: Optional[str], now: pd.Timestamp) -> Optional[pd.Timestamp]:
+    """Start (UTC) of a yfinance-style period ending now; None for 'max' / no period."""
+    if not period or period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=now.year, month=1, day=1, tz="UTC")
+    m = re.fullmatch(r"(\d+)(d|wk|mo|y)", period.strip().lower())
+    if not m:
+        raise ValueError(f"unknown period: {period}")
+    n, unit = int(m.group(1)), m.group(2)
+    offset = {"d": pd.DateOffset(days=n), "wk": pd.DateOffset(weeks=n),
+              "mo": pd.DateOffset(months=n), "y": pd.DateOffset(years=n)}[unit]
+    return now - offset
+
+
+def normalize(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Provider frame -> lower-case float OHLCV on a sorted, unique DatetimeIndex."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV, dtype=np.float64)
+    df = df.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)  # yf.download: (Price, Ticker)
+    df = df.rename(columns={c: c.lower() for c in df.columns if isinstance(c, str)})
+    for c in OHLCV:
+        if c not in df.columns:
+            df[c] = 0.0
+    df = df[OHLCV].apply(pd.to_numeric, errors="coerce").astype(np.float64)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index))
+    df = df[df["close"].notna()]
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+def _utc(t: pd.Timestamp) -> pd.Timestamp:
+    """Naive timestamps are taken as UTC."""
+    return t.tz_convert("UTC") if t.tz is not None else t.tz_localize("UTC")
+
+
+def _safe(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(s))
+
+
+class OhlcCache:
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, root: str = OHLC_CACHE_DIR, max_age_sec: Optional[float] = MAX_AGE_SEC,
+                 drop_partial: bool = DROP_PARTIAL):
+        self.root = root
+        self.max_age_sec = max_age_sec
+        self.drop_partial = drop_partial
+        self.lock = threading.Lock()
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._stats = {"hits": 0, "tail_fetches": 0, "full_fetches": 0, "stale_served": 0, "empty_fetches": 0}
+
+    # ---------- layout ----------
+    def path(self, provider: str, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, _safe(provider), _safe(symbol), _safe(interval_key(interval)))
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self.lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _partition(ts: np.ndarray, interval: str) -> np.ndarray:
+        unit = "M" if interval_seconds(interval) < 86400 else "Y"
+        return ts.astype(f"datetime64[{unit}]").astype(str)
+
+    def meta(self, provider: str, symbol: str, interval: str) -> Optional[dict]:
+        path = os.path.join(self.path(provider, symbol, interval), META)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            log.warning("unreadable OHLC cache meta %s", path, exc_info=True)
+            return None
+
+    # ---------- read / write ----------
+    def _read(self, d: str, meta: dict, since_ns: Optional[int] = None) -> pd.DataFrame:
+        parts = sorted(meta.get("partitions", []))
+        if since_ns is not None:
+            # partition names are on the stored clock; one day of slack covers tz offsets
+            first = self._partition(np.array([since_ns - 86400 * 10**9], dtype="datetime64[ns]"), meta["interval"])[0]
+            parts = [p for p in parts if p >= first]
+        frames = []
+        for part in parts:
+            path = os.path.join(d, f"{part}.{meta['format']}")
+            if meta["format"] == "parquet":
+                t = pd.read_parquet(path)
+                frames.append((t["ts"].to_numpy(dtype=np.int64), {c: t[c].to_numpy(dtype=np.float64) for c in OHLCV}))
+            else:
+                with np.load(path) as f:
+                    frames.append((f["ts"], {c: f[c] for c in OHLCV}))
+        if not frames:
+            return pd.DataFrame(columns=OHLCV, dtype=np.float64)
+        ts = np.concatenate([f[0] for f in frames])
+        index = pd.DatetimeIndex(ts.astype("datetime64[ns]"), name=meta.get("index_name"))
+        if meta.get("tz"):
+            index = index.tz_localize("UTC").tz_convert(meta["tz"])
+        return pd.DataFrame({c: np.concatenate([f[1][c] for f in frames]) for c in OHLCV}, index=index)
+
+    def _write(self, d: str, df: pd.DataFrame, parts: List[str], interval: str, fmt: str):
+        os.makedirs(d, exist_ok=True)
+        ts = index_ns(df)
+        keys = self._partition(ts.astype("datetime64[ns]"), interval)
+        for part in parts:
+            rows = keys == part
+            path = os.path.join(d, f"{part}.{fmt}")
+            tmp = path + ".tmp"
+            if fmt == "parquet":
+                t = df.loc[rows, OHLCV].reset_index(drop=True)
+                t.insert(0, "ts", ts[rows])
+                t.to_parquet(tmp, index=False)
+            else:
+                with open(tmp, "wb") as f:
+                    np.savez(f, ts=ts[rows], **{c: df[c].to_numpy(dtype=np.float64)[rows] for c in OHLCV})
+            os.replace(tmp, path)
+
+    def _write_meta(self, d: str, meta: dict):
+        tmp = os.path.join(d, META + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, os.path.join(d, META))
+
+    @staticmethod
+    def _to_tz(df: pd.DataFrame, tz: Optional[str]) -> pd.DataFrame:
+        """Bring a fetched frame onto the cache's clock (tz-aware in tz, or naive)."""
+        idx = df.index
+        if tz and idx.tz is None:
+            df.index = idx.tz_localize(tz)
+        elif tz and str(idx.tz) != tz:
+            df.index = idx.tz_convert(tz)
+        elif not tz and idx.tz is not None:
+            df.index = idx.tz_convert("UTC").tz_localize(None)
+        return df
+
+    # ---------- public ----------
+    def get(self, provider: str, symbol: str, interval: str, period: Optional[str],
+            fetch: Callable[[Optional[pd.Timestamp]], pd.DataFrame], backfill: bool = True) -> pd.DataFrame:
+        """
+        Bars for the last `period` (all cached bars for None); fetch(start) downloads bars from
+        start (UTC Timestamp) to now, or the whole period for start=None. backfill=False for
+        providers that cannot fetch from a start date: the cache is only ever extended at the tail.
+        """
+        d = self.path(provider, symbol, interval)
+        with self._key_lock((provider, symbol, interval_key(interval))):
+            now = pd.Timestamp.now(tz="UTC")
+            since = period_start(period, now)
+            want_ns = since.value if since is not None else 0
+            meta = self.meta(provider, symbol, interval)
+            cached = normalize(None)
+            if meta:
+                try:
+                    cached = self._read(d, meta, want_ns or None)
+                except Exception:
+                    log.warning("unreadable OHLC cache %s, fetching again", d, exc_info=True)
+                    meta = None
+
+            max_age = self.max_age_sec if self.max_age_sec is not None else interval_seconds(interval)
+            fresh = meta is not None and (now.value - meta["fetched_at"]) / 1e9 <= max_age
+            head_missing = meta is None or (backfill and want_ns < meta["covered_from"])
+            if fresh and not head_missing:
+                self._stats["hits"] += 1
+                return self._window(cached, since, now, interval)
+
+            start = None if head_missing or cached.empty else _utc(cached.index[-1])
+            try:
+                new = normalize(fetch(start))
+            except Exception:
+                log.warning("OHLC fetch failed for %s %s %s", provider, symbol, interval, exc_info=True)
+                new = normalize(None)
+            self._stats["full_fetches" if start is None else "tail_fetches"] += 1
+            if new.empty:
+                self._stats["empty_fetches"] += 1
+                if not cached.empty:
+                    self._stats["stale_served"] += 1
+                    log.info("serving cached %s %s %s (fetch returned no bars)", provider, symbol, interval)
+                return self._window(cached, since, now, interval)
+
+            tz = meta.get("tz") if meta else (str(new.index.tz) if new.index.tz is not None else None)
+            new = self._to_tz(new, tz)
+            if meta:
+                # rows of the touched partitions, then the fetched rows win on equal timestamps
+                parts = sorted(set(self._partition(index_ns(new).astype("datetime64[ns]"), interval)))
+                old = self._read(d, dict(meta, partitions=[p for p in meta["partitions"] if p in parts]))
+                merged = pd.concat([old, new])
+                merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+            else:
+                merged, parts = new, sorted(set(self._partition(index_ns(new).astype("datetime64[ns]"), interval)))
+            fmt = meta["format"] if meta else ("parquet" if has_parquet() else "npz")
+            self._write(d, merged, parts, interval, fmt)
+
+            all_parts = sorted(set(meta["partitions"] if meta else []) | set(parts))
+            if start is None:
+                # a provider without backfill covers only from its first bar
+                covered = want_ns if backfill else int(_utc(new.index[0]).value)
+                covered = min(covered, meta["covered_from"]) if meta else covered
+            else:
+                covered = meta["covered_from"]
+            meta = {
+                "provider": provider,
+                "symbol": symbol,
+                "interval": interval_key(interval),
+                "format": fmt,
+                "tz": tz,
+                "index_name": new.index.name or (meta or {}).get("index_name"),
+                "partitions": all_parts,
+                "covered_from": covered,
+                "fetched_at": now.value,
+                "last_ts": int(index_ns(merged)[-1]),
+            }
+            self._write_meta(d, meta)
+            return self._window(self._read(d, meta, want_ns or None), since, now, interval)
+
+    def _window(self, df: pd.DataFrame, since: Optional[pd.Timestamp], now: pd.Timestamp, interval: str) -> pd.DataFrame:
+        if df.empty:
+            return df
+        if since is not None:
+            start = since if df.index.tz is not None else since.tz_localize(None)
+            df = df[df.index >= start]
+        if self.drop_partial and len(df):
+            if _utc(df.index[-1]).value + interval_seconds(interval) * 10**9 > now.value:
+                df = df.iloc[:-1]
+        return df
+
+    def clear(self, provider: str, symbol: str, interval: str):
+        d = self.path(provider, symbol, interval)
+        if os.path.isdir(d):
+            for name in os.listdir(d):
+                os.remove(os.path.join(d, name))
+            os.rmdir(d)
+
+    def stats(self):
+        return dict(self._stats)
@@ -4,6 +4,7 @@ from threading import Lock
 from datetime import datetime
 
 from .kite_client import kite_client
+from .signal_pipeline import PIPELINE_ENABLED, SignalPipeline
 
 log = logging.getLogger(__name__)
 
@@ -15,21 +16,11 @@ try:
     # prefer explicit helpers if your redis_client provides them
     from .redis_client import set_last_signal as _set_last_signal  # (key, payload, expire_seconds)
     _redis_set_last_signal = _set_last_signal
-    try:
-        # your project earlier used publish_channel(name, payload)
-        from .redis_client import publish_channel as _publish_channel
-        def _pub(payload: dict):
-            # publish to a standard channel for UI/backends
-            try:
-                _publish_channel("signal_updates", payload)
-            except Exception:
-                # fallback channel name
-                _publish_channel("signals", payload)
-        _redis_publish = _pub
-    except Exception:
-        # if there's publish_signal(payload) helper
-        from .redis_client import publish_signal as _publish_signal
-        _redis_publish = _publish_signal
+    # same channel as the signal pipeline (write_signals_batch), whichever path is enabled
+    from .redis_client import PUBSUB_CHANNEL, publish_channel as _publish_channel
+    def _pub(payload: dict):
+        _publish_channel(PUBSUB_CHANNEL, payload)
+    _redis_publish = _pub
     _HAS_REDIS = True
 except Exception:
     _HAS_REDIS = False
@@ -37,7 +28,7 @@ except Exception:
 # ---- Optional WebSocket broadcaster (best-effort) ----
 _ws_publish = None
 try:
-    from .ws_broadcast import publish_signal as _ws_pub
+    from .ws_broadcast import publish_signal_threadsafe as _ws_pub
     _ws_publish = _ws_pub
 except Exception:
     _ws_publish = None
@@ -64,6 +55,8 @@ class OrderManager:
     """
     Singleton OrderManager
     - In-memory last_signals (fast lookup)
+    - Side effects below go through SignalPipeline (background, batched) unless
+      SIGNAL_PIPELINE_ENABLED=false, in which case they run inline as before
     - Redis cache + pub/sub (if redis_client available)
     - WebSocket broadcast to all connected clients (if ws_broadcast available)
     - Optional DB persistence (crud.save_signal, crud.save_order)
@@ -102,9 +95,9 @@ class OrderManager:
               }
         Effects:
          - update in-memory dict
-         - write into Redis (set+expire) & publish on pubsub (best-effort)
-         - broadcast to WebSocket clients (best-effort)
-         - persist to DB via crud.save_signal (best-effort)
+         - hand off to SignalPipeline (non-blocking): Redis set+publish, WS broadcast and
+           DB insert happen batched on a worker thread, coalesced per token
+         - with the pipeline disabled the same effects run inline (_publish_inline)
         """
         token_key = str(token)
         payload = dict(data) if isinstance(data, dict) else {"action": str(data)}
@@ -116,6 +109,16 @@ class OrderManager:
         # update in-memory
         self.last_signals[token_key] = payload
 
+        if PIPELINE_ENABLED:
+            if not SignalPipeline.instance().submit(token_key, payload):
+                log.debug("Signal pipeline full; dropped side effects for %s", token_key)
+        else:
+            self._publish_inline(token_key, payload)
+
+        log.debug("Registered signal for %s: action=%s", token_key, payload.get("action"))
+        return payload
+
+    def _publish_inline(self, token_key, payload):
         # Redis: set + publish (best-effort)
         if _HAS_REDIS:
             try:
@@ -159,8 +162,8 @@ class OrderManager:
             except Exception:
                 log.exception("Failed to persist signal for %s", token_key)
 
-        log.info("Registered signal for %s: %s", token_key, payload)
-        return payload
+    def pipeline_metrics(self):
+        return SignalPipeline.instance().metrics() if PIPELINE_ENABLED else {"enabled": False}
 
     def get_signals(self):
         # return a shallow copy to avoid external mutation
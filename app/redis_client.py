@@ -49,6 +49,50 @@ def publish_signal(payload: Dict):
         # optional: log
         pass
 
+def publish_channel(channel: str, payload: Dict):
+    """Publish JSON payload on an arbitrary channel (e.g. sentiment_updates, kite_token_events)."""
+    _redis.publish(channel, json.dumps(payload, default=str))
+
+def set_last_sentiment(ticker: str, payload: Dict, expire_seconds: Optional[int] = None):
+    """
+    Store last sentiment payload as JSON. Key: last_sentiment:{ticker}
+    """
+    key = f"last_sentiment:{ticker}"
+    _redis.set(key, json.dumps(payload, default=str))
+    if expire_seconds:
+        _redis.expire(key, int(expire_seconds))
+
+def subscribe_channel(channel: str):
+    """
+    Blocking generator yielding message data (str) published on `channel`.
+    Uses a dedicated pubsub connection; intended for background listener threads.
+    """
+    pubsub = _redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(channel)
+    try:
+        for message in pubsub.listen():
+            if message and message.get("type") == "message":
+                yield message.get("data")
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+def write_signals_batch(items, expire_seconds: Optional[int] = 300, channel: str = PUBSUB_CHANNEL):
+    """
+    Write many signals in one round-trip (non-transactional pipeline):
+    SET last_signal:{token} (with TTL) + PUBLISH on `channel` for each (instrument_token, payload).
+    """
+    if not items:
+        return
+    pipe = _redis.pipeline(transaction=False)
+    for instrument_token, payload in items:
+        data = json.dumps(payload, default=str)
+        pipe.set(f"last_signal:{instrument_token}", data, ex=int(expire_seconds) if expire_seconds else None)
+        pipe.publish(channel, data)
+    pipe.execute()
+
 def list_keys(pattern: str = "last_signal:*"):
     return _redis.keys(pattern)
 
@@ -1,13 +1,16 @@
 # app/scheduler.py
 """
 Scheduler:
-  - news_fetch_job: Fetch headlines using NewsAPI, compute VADER sentiment, save to DB, publish to Redis.
-  - retrain_job: Retrain ML model periodically.
+  - news_fetch_job: Fetch headlines using NewsAPI, compute VADER sentiment, save to DB, refresh the
+    in-process SentimentCache, publish to Redis.
+  - retrain_job: Retrain ML model periodically. RETRAIN_MODE=incremental (default) appends the new
+    bars and warm-starts the forest in a low-priority process (services/incremental_training), then
+    hands the new version to the model registry (background load + swap); "full" keeps the old refit.
   - refresh_kite_token_job: Clears old Kite token daily (so user re-logs for a fresh token before market open).
 
 Config via .env:
   NEWSAPI_KEY, ML_TICKERS, NEWS_INTERVAL_MIN (default 10)
-  RETRAIN_INTERVAL_MIN (default 10)
+  RETRAIN_INTERVAL_MIN (default 10), RETRAIN_MODE (incremental | full), TRAIN_INTERVAL (default 5m)
   KITE_API_KEY, KITE_API_SECRET, TOKEN_FILE (for kite)
 """
 
@@ -26,6 +29,7 @@ from apscheduler.triggers.cron import CronTrigger
 import pytz
 
 from .sentiment_analyzer import sentiment
+from .sentiment_cache import SentimentCache
 from . import crud
 
 # --- optional redis client hooks
@@ -118,6 +122,7 @@ def news_fetch_job():
 
             avg_score = float(sum(scores) / len(scores))
             crud.save_sentiment(t, avg_score)
+            SentimentCache.instance().put(t, avg_score)
             log.info("[%s][news] %s: avg_compound=%.4f", now, t, avg_score)
 
             if _have_redis:
@@ -173,6 +178,27 @@ def _run_train_via_script(symbol):
         log.exception("Training subprocess timed out: %s", e)
         return {"success": False, "error": "timeout"}
 
+def _run_incremental_train(symbol, interval=None):
+    """Incremental retrain in a low-priority process; the new version is loaded in the background."""
+    try:
+        from .services import incremental_training
+    except Exception as e:
+        log.debug("incremental_training import failed: %s", e)
+        return None
+    res = incremental_training.run_in_subprocess(symbol, interval=interval or "5m")
+    if res.get("success") and res.get("path"):
+        try:
+            from . import ml_model
+            if res.get("model_id") is not None:
+                ml_model.load_version(res["model_id"], wait=False)
+            else:
+                ml_model.load(res["path"], wait=False)
+            res["activation"] = "loading"
+        except Exception as e:
+            log.exception("loading retrained model failed: %s", e)
+            res["activation"] = f"failed: {e}"
+    return res
+
 def retrain_job():
     start = datetime.utcnow().isoformat()
     symbol = PRIMARY_TICKER
@@ -180,7 +206,11 @@ def retrain_job():
 
     period = os.getenv("TRAIN_PERIOD", None)
     interval = os.getenv("TRAIN_INTERVAL", None)
-    res = _run_train_via_ml_module(symbol, period=period, interval=interval)
+    res = None
+    if os.getenv("RETRAIN_MODE", "incremental").lower() == "incremental":
+        res = _run_incremental_train(symbol, interval=interval)
+    if res is None:
+        res = _run_train_via_ml_module(symbol, period=period, interval=interval)
     if res is None:
         log.info("ml_model training not found; using script fallback.")
         res = _run_train_via_script(symbol)
@@ -0,0 +1,150 @@
+# app/sentiment_cache.py
+"""
+In-process sentiment score cache keyed by ticker (e.g. 'RELIANCE.NS').
+
+news_fetch_job only writes a new score every NEWS_INTERVAL_MIN minutes, but the strategy
+asks for it on every tick. SentimentCache serves those reads from memory:
+ - put(ticker, score): called by scheduler.news_fetch_job right after crud.save_sentiment
+ - Redis listener on the `sentiment_updates` channel keeps other processes' caches fresh
+ - TTL fallback: a stale / unknown ticker is reloaded once via crud.get_latest_sentiment
+   (misses are cached too, so tickers without news do not hit the DB every tick)
+ - stats(): hit / miss / load counters
+
+Config via .env:
+  SENTIMENT_CACHE_TTL_SEC (default NEWS_INTERVAL_MIN * 60, i.e. 600)
+  SENTIMENT_CACHE_REDIS (default true) - subscribe to `sentiment_updates`
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+try:
+    _default_ttl = int(os.getenv("NEWS_INTERVAL_MIN", "10")) * 60
+except Exception:
+    _default_ttl = 600
+CACHE_TTL_SEC = int(os.getenv("SENTIMENT_CACHE_TTL_SEC", str(_default_ttl)))
+USE_REDIS = os.getenv("SENTIMENT_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+SENTIMENT_CHANNEL = "sentiment_updates"
+
+
+def _load_from_db(ticker: str) -> Optional[float]:
+    from .crud import get_latest_sentiment
+    entry = get_latest_sentiment(ticker)
+    if not entry:
+        return None
+    return float(getattr(entry, "score", 0.0))
+
+
+class SentimentCache:
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, ttl_seconds: int = CACHE_TTL_SEC, loader=_load_from_db):
+        self.ttl = ttl_seconds
+        self.loader = loader
+        self.lock = threading.Lock()
+        self._entries = {}  # ticker -> (score or None, expires_at monotonic)
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "load_errors": 0, "updates": 0}
+        self._listener = None
+
+    @staticmethod
+    def _key(ticker):
+        return (ticker or "").upper()
+
+    def get(self, ticker: Optional[str]) -> Optional[float]:
+        """Cached score for ticker; reloads from DB at most once per TTL."""
+        if not ticker:
+            return None
+        key = self._key(ticker)
+        now = time.monotonic()
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            # reserve the slot so concurrent misses for the same ticker don't all hit the DB
+            self._entries[key] = (entry[0] if entry else None, now + self.ttl)
+
+        score = entry[0] if entry else None
+        try:
+            score = self.loader(ticker)
+            with self.lock:
+                self._stats["loads"] += 1
+        except Exception:
+            with self.lock:
+                self._stats["load_errors"] += 1
+            log.debug("SentimentCache: load failed for %s", ticker, exc_info=True)
+        with self.lock:
+            self._entries[key] = (score, time.monotonic() + self.ttl)
+        return score
+
+    def put(self, ticker: str, score: float):
+        """Push a freshly computed score (news job / Redis update)."""
+        if not ticker:
+            return
+        with self.lock:
+            self._entries[self._key(ticker)] = (float(score), time.monotonic() + self.ttl)
+            self._stats["updates"] += 1
+
+    def invalidate(self, ticker: Optional[str] = None):
+        with self.lock:
+            if ticker is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(ticker), None)
+
+    def stats(self):
+        with self.lock:
+            out = dict(self._stats)
+            out["size"] = len(self._entries)
+        lookups = out["hits"] + out["misses"]
+        out["hit_ratio"] = (out["hits"] / lookups) if lookups else None
+        out["ttl_seconds"] = self.ttl
+        out["redis_listener"] = bool(self._listener and self._listener.is_alive())
+        return out
+
+    # ---------------------------
+    # Redis `sentiment_updates` listener
+    # ---------------------------
+    def start_listener(self):
+        """Subscribe to the scheduler's sentiment_updates channel (best-effort, daemon thread)."""
+        if not USE_REDIS or (self._listener and self._listener.is_alive()):
+            return False
+        try:
+            from .redis_client import subscribe_channel
+        except Exception:
+            log.debug("SentimentCache: redis_client not available; listener disabled")
+            return False
+        self._listener = threading.Thread(target=self._listen, args=(subscribe_channel,),
+                                          name="sentiment-cache-listener", daemon=True)
+        self._listener.start()
+        return True
+
+    def _listen(self, subscribe_channel):
+        backoff = 1.0
+        while True:
+            try:
+                for message in subscribe_channel(SENTIMENT_CHANNEL):
+                    backoff = 1.0
+                    try:
+                        data = json.loads(message) if isinstance(message, str) else message
+                        if data and data.get("ticker") is not None and data.get("score") is not None:
+                            self.put(data["ticker"], data["score"])
+                    except Exception:
+                        log.debug("SentimentCache: bad sentiment_updates message: %r", message)
+            except Exception:
+                log.debug("SentimentCache: redis listener error; retrying in %.0fs", backoff, exc_info=True)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
@@ -1,10 +1,38 @@
-from sqlalchemy import text
+import numpy as np
+from sqlalchemy import text, DateTime, Float
 from app.db import SessionLocal
+from app import tick_store
+from app.services.candle_loader import CHUNK_ROWS, epoch_seconds, stream_query
+
+
+def _resolve_token(db, symbol):
+    """Instrument token for a symbol (numeric symbols are taken as tokens)."""
+    sym = str(symbol or "").strip()
+    if sym.isdigit():
+        return sym
+    try:
+        from app.models import Instrument
+        inst = (
+            db.query(Instrument)
+            .filter((Instrument.tradingsymbol == sym) | (Instrument.yahoo_symbol == sym))
+            .first()
+        )
+        return inst.instrument_token if inst else None
+    except Exception:
+        return None
 
 
 def load_ticks(symbol, start, end, dataset):
     db = SessionLocal()
     try:
+        # recorded ticks (tick_store segments, memory-mapped) take precedence over market_ticks
+        token = _resolve_token(db, symbol)
+        if token is not None and start is not None and end is not None:
+            arr = tick_store.read_ticks(token, start, end)
+            if len(arr):
+                ts = arr["ts"] // 1_000_000_000
+                return [{"price": p, "ts": t} for p, t in zip(arr["price"].tolist(), ts.tolist())]
+
         rows = db.execute(
             text("""
                 SELECT price, ts
@@ -18,45 +46,101 @@ def load_ticks(symbol, start, end, dataset):
 
         # fallback demo ticks
         if not rows:
-            price = 2400
-            rows = []
-            for i in range(500):
-                price += (1 if i % 3 else -1)
-                rows.append({"price": price, "ts": i})
+            rows = _demo_ticks()
 
         return rows
     finally:
         db.close()
 
 
-def run_backtest(symbol, start, end, slippage_pct, commission, dataset):
-    ticks = load_ticks(symbol, start, end, dataset)
+def _demo_ticks():
+    price = 2400
+    rows = []
+    for i in range(500):
+        price += (1 if i % 3 else -1)
+        rows.append({"price": price, "ts": i})
+    return rows
+
+
+def iter_tick_chunks(symbol, start, end, dataset, chunk_rows=CHUNK_ROWS):
+    """
+    Stream ticks as {"ts": int64 epoch s, "price": float64} NumPy chunks in time order, from the
+    tick store (one memory-mapped segment at a time) or market_ticks via a server-side cursor,
+    so long ranges run in bounded memory. Falls back to the demo ticks when nothing is found.
+    """
+    db = SessionLocal()
+    try:
+        token = _resolve_token(db, symbol)
+    finally:
+        db.close()
+
+    if token is not None and start is not None and end is not None:
+        found = False
+        for arr in tick_store.iter_ticks(token, start, end, chunk_rows=chunk_rows):
+            if len(arr):
+                found = True
+                yield {"ts": arr["ts"] // 1_000_000_000, "price": np.array(arr["price"])}
+        if found:
+            return
 
+    empty = True
+    for part in stream_query(
+        """
+            SELECT ts, price
+            FROM market_ticks
+            WHERE symbol = :sym
+              AND ts BETWEEN :f AND :t
+            ORDER BY ts ASC
+        """,
+        {"sym": symbol, "f": start, "t": end},
+        chunk_rows,
+        ts=DateTime(), price=Float(),
+    ):
+        if not part:
+            continue
+        empty = False
+        ts, prices = zip(*part)
+        yield {
+            "ts": np.fromiter((epoch_seconds(t) for t in ts), dtype=np.int64, count=len(part)),
+            "price": np.array(prices, dtype=np.float64),
+        }
+
+    if empty:
+        rows = _demo_ticks()
+        yield {
+            "ts": np.array([r["ts"] for r in rows], dtype=np.int64),
+            "price": np.array([r["price"] for r in rows], dtype=np.float64),
+        }
+
+
+def run_backtest(symbol, start, end, slippage_pct, commission, dataset):
     position = 0
     entry_price = 0
     trades = []
     equity = 0
     peak = 0
     max_dd = 0
+    i = 0
 
-    for i, tick in enumerate(ticks):
-        price = float(tick["price"])
+    for chunk in iter_tick_chunks(symbol, start, end, dataset):
+        for price in chunk["price"].tolist():
 
-        # Simple strategy: BUY every 20 ticks, SELL after 10
-        if position == 0 and i % 20 == 0:
-            entry_price = price * (1 + slippage_pct / 100)
-            position = 1
+            # Simple strategy: BUY every 20 ticks, SELL after 10
+            if position == 0 and i % 20 == 0:
+                entry_price = price * (1 + slippage_pct / 100)
+                position = 1
 
-        elif position == 1 and i % 20 == 10:
-            exit_price = price * (1 - slippage_pct / 100)
-            pnl = (exit_price - entry_price) - commission
-            equity += pnl
-            trades.append(pnl)
-            position = 0
+            elif position == 1 and i % 20 == 10:
+                exit_price = price * (1 - slippage_pct / 100)
+                pnl = (exit_price - entry_price) - commission
+                equity += pnl
+                trades.append(pnl)
+                position = 0
 
-        peak = max(peak, equity)
-        dd = peak - equity
-        max_dd = max(max_dd, dd)
+            peak = max(peak, equity)
+            dd = peak - equity
+            max_dd = max(max_dd, dd)
+            i += 1
 
     wins = len([x for x in trades if x > 0])
 
@@ -1,4 +1,14 @@
+from app.services.vector_backtest import backtest_arrays, signals_to_codes
+
+
 def backtest(candles, signals, slippage=0.0, commission=0.0):
+    """Long-only replay of BUY/SELL signals over candle closes (array core in vector_backtest)."""
+    closes = [float(c["close"]) for c in candles]
+    return backtest_arrays(closes, signals_to_codes(signals), slippage, commission)
+
+
+def backtest_loop(candles, signals, slippage=0.0, commission=0.0):
+    """Bar-by-bar reference for backtest (parity checks)."""
     position = None
     entry = 0.0
     pnl = 0.0
@@ -1,5 +1,6 @@
-from app.services.candle_loader import load_candles
-from app.services.candle_strategy import generate_signals
+from app.services.candle_loader import iter_candle_chunks
+from app.services.candle_strategy import iter_signal_chunks
+from app.services.vector_backtest import run_candle_backtest_arrays
 
 
 def run_candle_backtest(
@@ -10,9 +11,14 @@ def run_candle_backtest(
     slippage_pct,
     commission,
 ):
-    candles = load_candles(symbol, interval, start, end)
-    signals = generate_signals(candles)
+    # closes stream in NumPy chunks; signals and the position/equity state machine run on
+    # arrays (vector_backtest), state carried across chunks
+    closes = (chunk["close"] for chunk in iter_candle_chunks(symbol, interval, start, end))
+    return run_candle_backtest_arrays(closes, slippage_pct, commission)
 
+
+def run_candle_backtest_loop(close_chunks, slippage_pct, commission):
+    """Bar-by-bar reference for run_candle_backtest (parity checks; see scripts/check_vector_backtest.py)."""
     position = 0
     entry_price = 0
     equity = 0
@@ -20,23 +26,21 @@ def run_candle_backtest(
     max_dd = 0
     trades = []
 
-    for i in range(len(candles)):
-        signal = signals[i]
-        price = float(candles[i]["close"])
-
-        if signal == "BUY" and position == 0:
-            entry_price = price * (1 + slippage_pct / 100)
-            position = 1
-
-        elif signal == "SELL" and position == 1:
-            exit_price = price * (1 - slippage_pct / 100)
-            pnl = (exit_price - entry_price) - commission
-            equity += pnl
-            trades.append(pnl)
-            position = 0
-
-        peak = max(peak, equity)
-        max_dd = max(max_dd, peak - equity)
+    for prices, signals in iter_signal_chunks(close_chunks):
+        for price, signal in zip(prices, signals):
+            if signal == "BUY" and position == 0:
+                entry_price = price * (1 + slippage_pct / 100)
+                position = 1
+
+            elif signal == "SELL" and position == 1:
+                exit_price = price * (1 - slippage_pct / 100)
+                pnl = (exit_price - entry_price) - commission
+                equity += pnl
+                trades.append(pnl)
+                position = 0
+
+            peak = max(peak, equity)
+            max_dd = max(max_dd, peak - equity)
 
     wins = len([x for x in trades if x > 0])
 
@@ -1,6 +1,95 @@
-from sqlalchemy import text
+import os
+import calendar
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text, DateTime, Float
 from app.db import SessionLocal
 
+# rows per NumPy chunk for the streaming loaders (server-side cursor batch size)
+CHUNK_ROWS = int(os.getenv("BACKTEST_CHUNK_ROWS", "100000"))
+
+CANDLE_FIELDS = ("ts", "open", "high", "low", "close", "volume")
+
+
+def epoch_seconds(ts) -> int:
+    """DB timestamp -> epoch seconds (naive values are UTC, as written by market_ingest)."""
+    if isinstance(ts, datetime):
+        return calendar.timegm(ts.utctimetuple())
+    return int(ts)
+
+
+def stream_query(sql, params, chunk_rows=CHUNK_ROWS, **types):
+    """
+    Run sql with a server-side cursor (stream_results) and yield lists of rows, chunk_rows at a time.
+    types: column -> SQLAlchemy type, so timestamps come back as datetimes on every backend.
+    """
+    db = SessionLocal()
+    try:
+        stmt = text(sql).columns(**types) if types else text(sql)
+        result = db.execute(stmt, params, execution_options={"stream_results": True})
+        for part in result.partitions(chunk_rows):
+            yield part
+    finally:
+        db.close()
+
+
+def _demo_candles():
+    price = 2400
+    rows = []
+    for i in range(300):
+        o = price
+        c = o + (2 if i % 3 else -1)
+        rows.append({
+            "open": o,
+            "high": max(o, c) + 2,
+            "low": min(o, c) - 2,
+            "close": c,
+            "ts": i
+        })
+        price = c
+    return rows
+
+
+def _demo_chunk():
+    rows = _demo_candles()
+    chunk = {"ts": np.arange(len(rows), dtype=np.int64), "volume": np.zeros(len(rows), dtype=np.float64)}
+    for f in ("open", "high", "low", "close"):
+        chunk[f] = np.array([r[f] for r in rows], dtype=np.float64)
+    return chunk
+
+
+def iter_candle_chunks(symbol, interval, start, end, chunk_rows=CHUNK_ROWS):
+    """
+    Stream candles as dicts of NumPy arrays: ts (int64 epoch s), open/high/low/close/volume (float64),
+    at most chunk_rows bars each, in time order. Falls back to the demo candles when the range is empty.
+    """
+    empty = True
+    for part in stream_query(
+        """
+            SELECT ts, open, high, low, close, volume
+            FROM market_candles
+            WHERE symbol = :sym
+              AND interval = :intv
+              AND ts BETWEEN :f AND :t
+            ORDER BY ts ASC
+        """,
+        {"sym": symbol, "intv": interval, "f": start, "t": end},
+        chunk_rows,
+        ts=DateTime(), open=Float(), high=Float(), low=Float(), close=Float(), volume=Float(),
+    ):
+        if not part:
+            continue
+        empty = False
+        cols = list(zip(*part))
+        chunk = {"ts": np.fromiter((epoch_seconds(t) for t in cols[0]), dtype=np.int64, count=len(part))}
+        for name, values in zip(CANDLE_FIELDS[1:], cols[1:]):
+            chunk[name] = np.array(values, dtype=np.float64)  # NULL -> nan
+        yield chunk
+
+    if empty:
+        yield _demo_chunk()
+
 
 def load_candles(symbol, interval, start, end):
     db = SessionLocal()
@@ -24,19 +113,7 @@ def load_candles(symbol, interval, start, end):
 
         # fallback demo candles
         if not rows:
-            price = 2400
-            rows = []
-            for i in range(300):
-                o = price
-                c = o + (2 if i % 3 else -1)
-                rows.append({
-                    "open": o,
-                    "high": max(o, c) + 2,
-                    "low": min(o, c) - 2,
-                    "close": c,
-                    "ts": i
-                })
-                price = c
+            rows = _demo_candles()
 
         return rows
     finally:
@@ -50,9 +50,14 @@ Candle Strategy: SMA Crossover (Production Ready)
 - Proper crossover detection (no signal spam)
 - Configurable periods
 - Safe for backtest + live execution
+- SmaCrossover (one close at a time, live), iter_signal_chunks (streamed chunks) and
+  vector_backtest.sma_crossover_codes (whole arrays, backs generate_signals) give identical signals
 """
 
-from typing import List, Optional
+import collections
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.vector_backtest import codes_to_signals, sma_crossover_codes
 
 
 def sma(values: List[float], period: int) -> Optional[float]:
@@ -72,39 +77,91 @@ def generate_signals(
     - "SELL" → bearish crossover
     - None   → no action
     """
+    closes = [float(candle["close"]) for candle in candles]
+    return codes_to_signals(sma_crossover_codes(closes, fast_period, slow_period))
 
-    closes: List[float] = []
-    signals: List[Optional[str]] = []
 
-    prev_fast: Optional[float] = None
-    prev_slow: Optional[float] = None
+class SmaCrossover:
+    """Stateful generate_signals: feed closes one at a time (keeps max(fast, slow) closes)."""
 
-    for candle in candles:
-        close = float(candle["close"])
-        closes.append(close)
+    def __init__(self, fast_period: int = 5, slow_period: int = 20):
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self._closes = collections.deque(maxlen=max(fast_period, slow_period))
+        self.prev_fast: Optional[float] = None
+        self.prev_slow: Optional[float] = None
 
-        fast_sma = sma(closes, fast_period)
-        slow_sma = sma(closes, slow_period)
+    def update(self, close: float) -> Optional[str]:
+        self._closes.append(float(close))
+        closes = list(self._closes)
+        fast_sma = sma(closes, self.fast_period)
+        slow_sma = sma(closes, self.slow_period)
 
         signal = None
-
         if (
             fast_sma is not None
             and slow_sma is not None
-            and prev_fast is not None
-            and prev_slow is not None
+            and self.prev_fast is not None
+            and self.prev_slow is not None
         ):
-            # 🔥 Bullish crossover
-            if prev_fast <= prev_slow and fast_sma > slow_sma:
+            if self.prev_fast <= self.prev_slow and fast_sma > slow_sma:
                 signal = "BUY"
-
-            # 🔥 Bearish crossover
-            elif prev_fast >= prev_slow and fast_sma < slow_sma:
+            elif self.prev_fast >= self.prev_slow and fast_sma < slow_sma:
                 signal = "SELL"
 
-        signals.append(signal)
+        self.prev_fast = fast_sma
+        self.prev_slow = slow_sma
+        return signal
+
 
-        prev_fast = fast_sma
-        prev_slow = slow_sma
+def iter_signal_chunks(
+    close_chunks: Iterable[Sequence[float]],
+    fast_period: int = 5,
+    slow_period: int = 20,
+) -> Iterator[Tuple[List[float], List[Optional[str]]]]:
+    """
+    Same signals as generate_signals for closes arriving in chunks (lists or NumPy arrays);
+    yields (closes as floats, signals) per chunk. Only the last max(fast, slow) closes are
+    carried over.
+    """
+    keep = max(fast_period, slow_period)
+    tail: List[float] = []
+
+    prev_fast: Optional[float] = None
+    prev_slow: Optional[float] = None
 
-    return signals
+    for chunk in close_chunks:
+        if hasattr(chunk, "tolist"):
+            chunk = chunk.tolist()
+        chunk = [float(c) for c in chunk]
+        closes = tail + chunk
+        signals: List[Optional[str]] = []
+
+        for i in range(len(tail), len(closes)):
+            n = i + 1
+            fast_sma = sum(closes[n - fast_period:n]) / fast_period if n >= fast_period else None
+            slow_sma = sum(closes[n - slow_period:n]) / slow_period if n >= slow_period else None
+
+            signal = None
+
+            if (
+                fast_sma is not None
+                and slow_sma is not None
+                and prev_fast is not None
+                and prev_slow is not None
+            ):
+                # 🔥 Bullish crossover
+                if prev_fast <= prev_slow and fast_sma > slow_sma:
+                    signal = "BUY"
+
+                # 🔥 Bearish crossover
+                elif prev_fast >= prev_slow and fast_sma < slow_sma:
+                    signal = "SELL"
+
+            signals.append(signal)
+
+            prev_fast = fast_sma
+            prev_slow = slow_sma
+
+        tail = closes[-keep:]
+        yield chunk, signals
@@ -0,0 +1,426 @@
+# app/services/feature_store.py
+"""
+Offline feature store: one registry of named, versioned bar features shared by training
+(ml_model.train_dummy, walk_forward / incremental_training), the backtest / evaluation scripts
+and their model-alignment step (ensure_features_for_model).
+
+- REGISTRY: name -> FeatureDef(version, fn, doc); fn(bars) is a vectorized Series over a
+  lower-case OHLCV frame (ohlcv()). r1 / r2 / vol_norm are the ml_model training formulas; the
+  backtest scripts used the same names for pct-change returns and a volume ratio, which are now
+  ret1 / ret2 / vol_ratio20. Bump a feature's version whenever its formula changes
+- serving: StrategyEngine computes model inputs with these same definitions over CandleEngine
+  bars; the tick-level indicator snapshot (indicators.compute_signals / IndicatorEngine) names
+  its returns and volume ratio tick_ret1 / tick_ret1_lag / tick_vol_ratio so they cannot bind
+  to r1 / r2 / vol_norm
+- compute(df, names): the features over a frame of bars, index kept
+- materialize(df, symbol, interval): computes every registered feature once and writes
+  FEATURE_STORE_DIR/<symbol>/<interval>/features.parquet (.npz when no Parquet engine is
+  installed) plus manifest.json (rows, first / last bar, sha1 of the OHLCV data, feature
+  versions, format); unchanged data with current versions is not rewritten
+- get_features(df, symbol, interval, names): materialized columns when the manifest matches the
+  data hash and versions, otherwise materialize first
+- read(symbol, interval, names, start, end): materialized features without the bars
+- resolve / align(frame, names): map a model's feature_names_in_ onto store columns (exact name,
+  ALIASES, then case-insensitive); align returns (X, missing) as ensure_features_for_model does
+
+Config via .env:
+  FEATURE_STORE_DIR (default app/storage/feature_store)
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "app/storage/feature_store")
+
+OHLCV = ["open", "high", "low", "close", "volume"]
+MANIFEST = "manifest.json"
+
+
+# -------------------------
+# Bars
+# -------------------------
+def ohlcv(df: pd.DataFrame) -> pd.DataFrame:
+    """Lower-case numeric OHLCV columns, rows without a close dropped."""
+    df = df.rename(columns={c: c.lower() for c in df.columns if isinstance(c, str)})
+    missing = [c for c in OHLCV if c not in df.columns]
+    if missing:
+        raise ValueError(f"missing OHLCV columns: {missing}")
+    out = df[OHLCV].apply(pd.to_numeric, errors="coerce")
+    return out[out["close"].notna()]
+
+
+def index_ns(df: pd.DataFrame) -> np.ndarray:
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.index.values.astype("datetime64[ns]").view(np.int64)  # UTC for tz-aware indexes
+    return np.arange(len(df), dtype=np.int64)
+
+
+def data_hash(df: pd.DataFrame) -> str:
+    """sha1 over the bar timestamps and OHLCV values."""
+    df = ohlcv(df)
+    h = hashlib.sha1()
+    h.update(index_ns(df).tobytes())
+    h.update(np.ascontiguousarray(df.to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+# -------------------------
+# Registry
+# -------------------------
+class FeatureDef:
+    __slots__ = ("name", "version", "fn", "doc")
+
+    def __init__(self, name: str, version: int, fn: Callable[[pd.DataFrame], pd.Series], doc: str = ""):
+        self.name = name
+        self.version = version
+        self.fn = fn
+        self.doc = doc
+
+    def info(self):
+        return {"name": self.name, "version": self.version, "doc": self.doc}
+
+
+REGISTRY: Dict[str, FeatureDef] = {}
+
+
+def feature(name: str, version: int = 1):
+    """Register fn(bars) -> Series as feature `name`; the docstring is its description."""
+    def deco(fn):
+        REGISTRY[name] = FeatureDef(name, version, fn, (fn.__doc__ or "").strip())
+        return fn
+    return deco
+
+
+def _rsi_sma(close: pd.Series, n: int) -> pd.Series:
+    delta = close.diff()
+    up = delta.clip(lower=0).rolling(n).mean()
+    down = -delta.clip(upper=0).rolling(n).mean()
+    return 100 - (100 / (1 + (up / (down + 1e-9))))
+
+
+@feature("r1")
+def _r1(b):
+    """bar body (close - open) / open; ml_model training feature"""
+    return (b["close"] - b["open"]) / b["open"]
+
+
+@feature("r2")
+def _r2(b):
+    """bar range (high - low) / open; ml_model training feature"""
+    return (b["high"] - b["low"]) / b["open"]
+
+
+@feature("vol_norm")
+def _vol_norm(b):
+    """volume minus its 20-bar mean, 0 during warm-up; ml_model training feature"""
+    return (b["volume"] - b["volume"].rolling(20).mean()).fillna(0)
+
+
+@feature("ret1")
+def _ret1(b):
+    """1-bar close return"""
+    return b["close"].pct_change(1).fillna(0)
+
+
+@feature("ret2")
+def _ret2(b):
+    """2-bar close return"""
+    return b["close"].pct_change(2).fillna(0)
+
+
+@feature("lag1_ret")
+def _lag1_ret(b):
+    """previous bar's 1-bar close return"""
+    return b["close"].pct_change(1).fillna(0).shift(1)
+
+
+@feature("lag1_close")
+def _lag1_close(b):
+    """previous close"""
+    return b["close"].shift(1)
+
+
+@feature("ma5")
+def _ma5(b):
+    """5-bar SMA of close"""
+    return b["close"].rolling(5).mean()
+
+
+@feature("ma15")
+def _ma15(b):
+    """15-bar SMA of close"""
+    return b["close"].rolling(15).mean()
+
+
+@feature("ma20")
+def _ma20(b):
+    """20-bar SMA of close"""
+    return b["close"].rolling(20).mean()
+
+
+@feature("close_ma5_diff")
+def _close_ma5_diff(b):
+    """(close - ma5) / ma5"""
+    ma = b["close"].rolling(5).mean()
+    return (b["close"] - ma) / (ma + 1e-9)
+
+
+@feature("close_ma15_diff")
+def _close_ma15_diff(b):
+    """(close - ma15) / ma15"""
+    ma = b["close"].rolling(15).mean()
+    return (b["close"] - ma) / (ma + 1e-9)
+
+
+@feature("rsi14")
+def _rsi14(b):
+    """14-bar RSI from simple means of gains / losses"""
+    return _rsi_sma(b["close"], 14)
+
+
+@feature("vol")
+def _vol(b):
+    """raw volume"""
+    return b["volume"].astype(np.float64)
+
+
+@feature("vol_mean20")
+def _vol_mean20(b):
+    """20-bar mean volume"""
+    return b["volume"].rolling(20).mean()
+
+
+@feature("vol_ratio20")
+def _vol_ratio20(b):
+    """volume / 20-bar mean volume"""
+    return b["volume"] / (b["volume"].rolling(20).mean() + 1e-9)
+
+
+# model feature name -> store feature (names a model may have been trained with)
+ALIASES = {
+    "r_1": "ret1", "return_1": "ret1",
+    "r_2": "ret2", "return_2": "ret2",
+    "r1_lag": "lag1_ret",
+    "sma5": "ma5", "ma_5": "ma5",
+    "sma15": "ma15", "ma_15": "ma15",
+    "sma20": "ma20", "ma_20": "ma20",
+    "rsi_14": "rsi14",
+    "volume": "vol",
+    "volume_norm": "vol_norm",
+    "vol/ma": "vol_ratio20", "volume/vol_mean20": "vol_ratio20",
+}
+
+
+def versions(names: Optional[List[str]] = None) -> Dict[str, int]:
+    return {n: REGISTRY[n].version for n in (names or REGISTRY)}
+
+
+def _check(names) -> List[str]:
+    names = list(names) if names is not None else list(REGISTRY)
+    unknown = [n for n in names if n not in REGISTRY]
+    if unknown:
+        raise KeyError(f"unknown features: {unknown}")
+    return names
+
+
+def compute(df: pd.DataFrame, names: Optional[List[str]] = None) -> pd.DataFrame:
+    """Features `names` (default: all registered) over the bars of df, same index as ohlcv(df)."""
+    names = _check(names)
+    bars = ohlcv(df)
+    return pd.DataFrame({n: REGISTRY[n].fn(bars).astype(np.float64) for n in names}, index=bars.index)
+
+
+# -------------------------
+# Materialized files
+# -------------------------
+def _safe(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(s))
+
+
+def store_dir(symbol: str, interval: str, root: Optional[str] = None) -> str:
+    return os.path.join(root or FEATURE_STORE_DIR, _safe(symbol), _safe(interval))
+
+
+def has_parquet() -> bool:
+    """True if pandas has a Parquet engine (pyarrow / fastparquet) to write with."""
+    for mod in ("pyarrow", "fastparquet"):
+        try:
+            __import__(mod)
+            return True
+        except ImportError:
+            continue
+    return False
+
+
+def manifest(symbol: str, interval: str, root: Optional[str] = None) -> Optional[dict]:
+    path = os.path.join(store_dir(symbol, interval, root), MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        log.warning("unreadable feature manifest %s", path, exc_info=True)
+        return None
+
+
+def _current(man: Optional[dict], digest: str, names: List[str]) -> bool:
+    if not man or man.get("data_sha1") != digest:
+        return False
+    have = man.get("features", {})
+    return all(have.get(n) == REGISTRY[n].version for n in names)
+
+
+def _write(d: str, ts: np.ndarray, feats: pd.DataFrame) -> Tuple[str, str]:
+    """Write the feature columns (+ ts) atomically; returns (file name, format)."""
+    os.makedirs(d, exist_ok=True)
+    if has_parquet():
+        fname, fmt = "features.parquet", "parquet"
+        table = feats.reset_index(drop=True)
+        table.insert(0, "ts", ts)
+        tmp = os.path.join(d, fname + ".tmp")
+        table.to_parquet(tmp, index=False)
+    else:
+        fname, fmt = "features.npz", "npz"
+        tmp = os.path.join(d, fname + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, ts=ts, **{n: feats[n].to_numpy(dtype=np.float64) for n in feats.columns})
+    os.replace(tmp, os.path.join(d, fname))
+    for other in ("features.parquet", "features.npz"):
+        if other != fname and os.path.exists(os.path.join(d, other)):
+            os.remove(os.path.join(d, other))
+    return fname, fmt
+
+
+def materialize(df: pd.DataFrame, symbol: str, interval: str, root: Optional[str] = None,
+                force: bool = False) -> dict:
+    """Compute every registered feature over df and store it; returns the manifest."""
+    bars = ohlcv(df)
+    digest = data_hash(bars)
+    d = store_dir(symbol, interval, root)
+    man = manifest(symbol, interval, root)
+    if not force and _current(man, digest, list(REGISTRY)):
+        return man
+
+    feats = compute(bars)
+    ts = index_ns(bars)
+    fname, fmt = _write(d, ts, feats)
+    man = {
+        "symbol": symbol,
+        "interval": interval,
+        "file": fname,
+        "format": fmt,
+        "rows": int(len(bars)),
+        "index": "datetime" if isinstance(bars.index, pd.DatetimeIndex) else "range",
+        "tz": str(bars.index.tz) if isinstance(bars.index, pd.DatetimeIndex) and bars.index.tz is not None else None,
+        "first_ts": int(ts[0]) if len(ts) else None,
+        "last_ts": int(ts[-1]) if len(ts) else None,
+        "data_sha1": digest,
+        "features": versions(),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    tmp = os.path.join(d, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(man, f, indent=2)
+    os.replace(tmp, os.path.join(d, MANIFEST))
+    log.info("materialized %d features x %d rows for %s %s (%s)", len(feats.columns), len(bars), symbol, interval, fmt)
+    return man
+
+
+def _load(d: str, man: dict, names: List[str]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    path = os.path.join(d, man["file"])
+    if man.get("format") == "parquet":
+        table = pd.read_parquet(path, columns=["ts"] + names)
+        return table["ts"].to_numpy(dtype=np.int64), {n: table[n].to_numpy(dtype=np.float64) for n in names}
+    with np.load(path) as f:
+        return f["ts"], {n: f[n] for n in names}
+
+
+def _stamp(t, tz) -> pd.Timestamp:
+    t = pd.Timestamp(t)
+    return t.tz_localize(tz) if t.tz is None else t.tz_convert(tz)
+
+
+def read(symbol: str, interval: str, names: Optional[List[str]] = None, start=None, end=None,
+         root: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Materialized features for [start, end] (inclusive), or None if nothing is stored."""
+    names = _check(names)
+    man = manifest(symbol, interval, root)
+    if not man or any(man.get("features", {}).get(n) != REGISTRY[n].version for n in names):
+        return None
+    ts, cols = _load(store_dir(symbol, interval, root), man, names)
+    if man.get("index") == "datetime":
+        index = pd.to_datetime(ts, utc=True)
+        if man.get("tz"):
+            index = index.tz_convert(man["tz"])
+        keep = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            keep &= index >= _stamp(start, index.tz)
+        if end is not None:
+            keep &= index <= _stamp(end, index.tz)
+    else:
+        index = pd.RangeIndex(len(ts))
+        keep = np.ones(len(ts), dtype=bool)
+    return pd.DataFrame({n: cols[n][keep] for n in names}, index=index[keep])
+
+
+def get_features(df: pd.DataFrame, symbol: Optional[str] = None, interval: Optional[str] = None,
+                 names: Optional[List[str]] = None, root: Optional[str] = None) -> pd.DataFrame:
+    """
+    Features for the bars of df (index as ohlcv(df)); read from the store when symbol / interval
+    were materialized from the same data, else materialized first. Without a symbol, or if the
+    store cannot be written, they are computed in memory.
+    """
+    names = _check(names)
+    if not symbol or not interval:
+        return compute(df, names)
+    bars = ohlcv(df)
+    try:
+        man = manifest(symbol, interval, root)
+        if not _current(man, data_hash(bars), names):
+            man = materialize(bars, symbol, interval, root)
+        ts, cols = _load(store_dir(symbol, interval, root), man, names)
+        if len(ts) == len(bars):
+            return pd.DataFrame(cols, index=bars.index)[names]
+    except Exception:
+        log.warning("feature store unavailable for %s %s, computing in memory", symbol, interval, exc_info=True)
+    return compute(bars, names)
+
+
+# -------------------------
+# Model alignment
+# -------------------------
+def resolve(names: List[str], available) -> Tuple[Dict[str, str], List[str]]:
+    """({model name: column}, missing) for a model's feature names against available columns."""
+    available = list(available)
+    lower = {str(c).lower(): c for c in available}
+    mapping, missing = {}, []
+    for f in names:
+        if f in available:
+            mapping[f] = f
+        elif ALIASES.get(f) in available:
+            mapping[f] = ALIASES[f]
+        elif ALIASES.get(str(f).lower()) in available:
+            mapping[f] = ALIASES[str(f).lower()]
+        elif str(f).lower() in lower:
+            mapping[f] = lower[str(f).lower()]
+        else:
+            missing.append(f)
+    return mapping, missing
+
+
+def align(frame: pd.DataFrame, names: List[str]) -> Tuple[pd.DataFrame, List[str]]:
+    """(X with the model's column names / order, unresolved names)."""
+    mapping, missing = resolve(names, frame.columns)
+    X = pd.DataFrame({f: frame[c] for f, c in mapping.items()}, index=frame.index)
+    return X[[f for f in names if f in mapping]], missing
@@ -0,0 +1,345 @@
+# app/services/incremental_training.py
+"""
+Incremental retraining of the RandomForest next-bar model, run by scheduler.retrain_job in a
+separate low-priority process.
+
+A full retrain refetches the whole yfinance history and refits 100 trees on every core each
+RETRAIN_INTERVAL_MIN. Instead:
+
+- training set on disk per symbol / interval (TRAIN_SET_DIR/<symbol>__<interval>.npz): the raw
+  bars (ts, open, high, low, close, volume) and the prepared X / y (walk_forward.feature_matrix,
+  the ml_model features). A run fetches only a short recent window (INCR_FETCH_PERIOD), appends
+  the bars newer than the stored ones (the last stored bar is replaced, it may have been
+  partial; a window that does not reach back to the stored bars triggers one full-period
+  fetch instead) and recomputes features / labels only for the changed tail plus the 20-bar volume
+  window before it
+- model update:
+    "warm_start" (default): the current model (MODEL_FILE, i.e. the active version) gets
+      ceil(new_rows / INCR_ROWS_PER_TREE) new trees (at most INCR_MAX_NEW_TREES), fitted on the
+      last INCR_FIT_ROWS rows (RandomForestClassifier warm_start); the oldest trees are dropped
+      beyond INCR_MAX_TREES, so the forest slides forward in time
+    "window": refit from scratch on the last INCR_WINDOW rows
+  no new bars -> no training at all; no stored set / no usable current model -> window refit
+- the new model goes to a versioned file under app/storage/models/ plus an ml_models row
+  (inactive); the API process loads and activates it through the model registry
+
+run_in_subprocess() starts `python -m app.services.incremental_training` with nice INCR_NICE
+(BELOW_NORMAL priority class on Windows), CPU affinity limited to INCR_CPUS cores (Linux) and
+n_jobs / BLAS threads capped to the same count, so trading keeps its cores.
+
+Config via .env:
+  RETRAIN_MODE=incremental     # incremental | full (the old train_from_yfinance / script path)
+  INCR_UPDATE=warm_start       # warm_start | window
+  INCR_FETCH_PERIOD=5d         # recent window fetched on incremental runs (first run: TRAIN_PERIOD or 60d)
+  TRAIN_SET_DIR=app/storage/train_sets
+  INCR_ROWS_PER_TREE=50, INCR_MAX_NEW_TREES=20, INCR_MAX_TREES=100, INCR_FIT_ROWS=2000
+  INCR_WINDOW=20000, INCR_MAX_ROWS=200000 (bars kept on disk)
+  INCR_NICE=10, INCR_CPUS (default a quarter of the cores, at least 1)
+"""
+
+import os
+import sys
+import json
+import math
+import pickle
+import hashlib
+import logging
+import argparse
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+UPDATE_MODE = os.getenv("INCR_UPDATE", "warm_start").lower()
+FETCH_PERIOD = os.getenv("INCR_FETCH_PERIOD", "5d")
+FULL_PERIOD = os.getenv("TRAIN_PERIOD") or "60d"
+TRAIN_SET_DIR = Path(os.getenv("TRAIN_SET_DIR", "app/storage/train_sets"))
+ROWS_PER_TREE = int(os.getenv("INCR_ROWS_PER_TREE", "50"))
+MAX_NEW_TREES = int(os.getenv("INCR_MAX_NEW_TREES", "20"))
+MAX_TREES = int(os.getenv("INCR_MAX_TREES", "100"))
+FIT_ROWS = int(os.getenv("INCR_FIT_ROWS", "2000"))
+WINDOW_ROWS = int(os.getenv("INCR_WINDOW", "20000"))
+MAX_ROWS = int(os.getenv("INCR_MAX_ROWS", "200000"))
+NICE = int(os.getenv("INCR_NICE", "10"))
+N_CPUS = int(os.getenv("INCR_CPUS", "0")) or max(1, (os.cpu_count() or 1) // 4)
+
+# same files as app.ml_model (not imported here: that would load and warm up the live model)
+MODEL_FILE = Path("app/storage/rf_model.pkl")
+MODEL_DIR = Path("app/storage/models")
+
+RAW = ("ts", "open", "high", "low", "close", "volume")
+VOL_WINDOW = 20  # feature_matrix's rolling volume window
+
+
+# -------------------------
+# Training set
+# -------------------------
+def _bars(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Provider frame -> sorted, de-duplicated raw bar arrays (ts in ns UTC)."""
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.droplevel(-1, axis=1)  # yfinance (field, ticker) columns
+    df = df.rename(columns={c: c.lower() for c in df.columns if isinstance(c, str)})
+    idx = pd.DatetimeIndex(df.index)
+    ts = (idx.tz_convert("UTC") if idx.tz is not None else idx).asi8
+    out = {"ts": ts}
+    for c in RAW[1:]:
+        out[c] = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64)
+    keep = ~np.isnan(out["close"])
+    order = np.argsort(out["ts"][keep], kind="stable")
+    out = {k: v[keep][order] for k, v in out.items()}
+    last = np.r_[out["ts"][1:] != out["ts"][:-1], True]  # duplicate timestamps: last one wins
+    return {k: v[last] for k, v in out.items()}
+
+
+def _frame(raw: Dict[str, np.ndarray], start: int = 0) -> pd.DataFrame:
+    return pd.DataFrame({c: raw[c][start:] for c in RAW[1:]}, index=pd.to_datetime(raw["ts"][start:], utc=True))
+
+
+def _features(raw: Dict[str, np.ndarray], start: int = 0):
+    """(X, y) for bars start .. n-2 (the last bar has no label yet)."""
+    from app.services.walk_forward import feature_matrix
+    ctx = max(0, start - (VOL_WINDOW - 1))
+    fm = feature_matrix(_frame(raw, ctx))
+    return fm["X"][start - ctx:], fm["y"][start - ctx:]
+
+
+def _safe(s: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "_.-" else "_" for ch in str(s))
+
+
+def train_set_path(symbol: str, interval: str) -> Path:
+    return TRAIN_SET_DIR / f"{_safe(symbol)}__{_safe(interval)}.npz"
+
+
+def load_train_set(symbol: str, interval: str) -> Optional[Dict[str, Any]]:
+    path = train_set_path(symbol, interval)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            return {k: f[k] for k in f.files}
+    except Exception:
+        log.warning("unreadable training set %s, rebuilding", path, exc_info=True)
+        return None
+
+
+def save_train_set(symbol: str, interval: str, tset: Dict[str, Any]):
+    path = train_set_path(symbol, interval)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **tset)
+    os.replace(tmp, path)
+
+
+def merge_bars(store: Optional[Dict[str, Any]], new: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Append `new` bars to the stored set; features are recomputed only from the first changed
+    bar (minus one: its predecessor's label depends on it). Returns the updated set with
+    "changed_from" = first X row that differs from the stored one.
+    """
+    if store is None or not len(store["ts"]):
+        X, y = _features(new)
+        return dict(new, X=X, y=y, changed_from=np.int64(0), trained_rows=np.int64(0), model_digest=np.array(""))
+
+    first_new = int(np.searchsorted(new["ts"], store["ts"][-1], side="left"))
+    keep = int(np.searchsorted(store["ts"], new["ts"][first_new], side="left")) if first_new < len(new["ts"]) else len(store["ts"])
+    raw = {c: np.concatenate([store[c][:keep], new[c][first_new:]]) for c in RAW}
+    start = max(0, keep - 1)
+    X_tail, y_tail = _features(raw, start)
+    out = dict(raw, X=np.concatenate([store["X"][:start], X_tail]), y=np.concatenate([store["y"][:start], y_tail]))
+    out.update(changed_from=np.int64(start), trained_rows=store["trained_rows"], model_digest=store["model_digest"])
+
+    drop = len(out["ts"]) - MAX_ROWS
+    if drop > 0:
+        for c in RAW + ("X", "y"):
+            out[c] = out[c][drop:]
+        out["changed_from"] = np.int64(max(0, start - drop))
+        out["trained_rows"] = np.int64(max(0, int(out["trained_rows"]) - drop))
+    return out
+
+
+# -------------------------
+# Model update
+# -------------------------
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _frame_X(X: np.ndarray) -> pd.DataFrame:
+    from app.services.walk_forward import FEATURES
+    return pd.DataFrame(X, columns=FEATURES)
+
+
+def _usable_base(model) -> bool:
+    from app.services.walk_forward import FEATURES
+    names = getattr(model, "feature_names_in_", None)
+    return (
+        hasattr(model, "estimators_") and getattr(model, "n_features_in_", None) == len(FEATURES)
+        and (names is None or list(names) == FEATURES) and len(getattr(model, "classes_", [])) == 2
+    )
+
+
+def refit_window(X: np.ndarray, y: np.ndarray, n_jobs: int):
+    from sklearn.ensemble import RandomForestClassifier
+    m = RandomForestClassifier(n_estimators=MAX_TREES, random_state=42, n_jobs=n_jobs)
+    m.fit(_frame_X(X[-WINDOW_ROWS:]), y[-WINDOW_ROWS:])
+    return m
+
+
+def warm_start(model, X: np.ndarray, y: np.ndarray, new_rows: int, n_jobs: int):
+    """Add trees fitted on the most recent rows, then drop the oldest trees beyond MAX_TREES."""
+    k = min(MAX_NEW_TREES, max(1, math.ceil(new_rows / ROWS_PER_TREE)))
+    rows = max(FIT_ROWS, new_rows)
+    n_jobs_before = model.n_jobs
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + k, n_jobs=n_jobs)
+    model.fit(_frame_X(X[-rows:]), y[-rows:])
+    if len(model.estimators_) > MAX_TREES:
+        model.estimators_ = model.estimators_[-MAX_TREES:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_), n_jobs=n_jobs_before)
+    return model, k, min(rows, len(X))
+
+
+def retrain(symbol: str, interval: str = "5m", period: Optional[str] = None, mode: str = UPDATE_MODE,
+            n_jobs: int = 1, fetch=None) -> Dict[str, Any]:
+    """One incremental run (in the training process). fetch(symbol, period, interval) -> DataFrame."""
+    if fetch is None:
+        from app.historical_fetcher import fetch_recent_ohlc
+        fetch = lambda s, p, i: fetch_recent_ohlc(s, provider_preference="yfinance", period=p, interval=i)
+
+    store = load_train_set(symbol, interval)
+    df = fetch(symbol, period or (FETCH_PERIOD if store is not None else FULL_PERIOD), interval)
+    if df is None or df.empty:
+        return {"success": False, "error": "no data"}
+    bars = _bars(df)
+    if store is not None and len(store["ts"]) and len(bars["ts"]) and bars["ts"][0] > store["ts"][-1] and not period:
+        # down for longer than the fetch window: fill the hole with one full-period fetch
+        df = fetch(symbol, FULL_PERIOD, interval)
+        if df is not None and not df.empty:
+            bars = _bars(df)
+    tset = merge_bars(store, bars)
+    n = len(tset["X"])
+    new_rows = n - int(tset["trained_rows"])
+    if store is not None and new_rows <= 0:
+        save_train_set(symbol, interval, tset)
+        return {"success": True, "skipped": "no new bars", "rows": n}
+    if n < 50 or len(np.unique(tset["y"][-max(FIT_ROWS, new_rows):])) < 2:
+        save_train_set(symbol, interval, tset)
+        return {"success": False, "error": "not enough data", "rows": n}
+
+    base = None
+    if mode == "warm_start" and MODEL_FILE.exists() and store is not None:
+        data = MODEL_FILE.read_bytes()
+        if _digest(data) == str(tset["model_digest"]):
+            base = pickle.loads(data)
+            if not _usable_base(base):
+                base = None
+
+    if base is not None:
+        model, added, fit_rows = warm_start(base, tset["X"], tset["y"], new_rows, n_jobs)
+        used = "warm_start"
+    else:
+        model = refit_window(tset["X"], tset["y"], n_jobs)
+        added, fit_rows, used = len(model.estimators_), min(n, WINDOW_ROWS), "window"
+
+    data = pickle.dumps(model)
+    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    version_file = MODEL_DIR / f"rf_{datetime.utcnow():%Y%m%d_%H%M%S_%f}.pkl"
+    version_file.write_bytes(data)
+    tset["trained_rows"] = np.int64(n)
+    tset["model_digest"] = np.array(_digest(data))
+    save_train_set(symbol, interval, tset)
+
+    res = {"success": True, "mode": used, "path": str(version_file), "model_id": None, "rows": n,
+           "new_rows": new_rows, "fit_rows": fit_rows, "trees_added": added, "trees": len(model.estimators_)}
+    try:
+        from app.crud import save_model_metadata
+        row = save_model_metadata(filename=str(version_file), rows=fit_rows,
+                                  metrics={k: res[k] for k in ("mode", "new_rows", "trees_added", "trees")},
+                                  notes=f"incremental retrain {symbol} {interval}", active=False)
+        res["model_id"] = row.id
+    except Exception as e:
+        log.debug("save_model_metadata failed: %s", e)
+    return res
+
+
+# -------------------------
+# Low-priority process
+# -------------------------
+def train_cpus(n: int = N_CPUS) -> List[int]:
+    """The n highest-numbered cores this process may run on (trading keeps the others)."""
+    try:
+        allowed = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        allowed = list(range(os.cpu_count() or 1))
+    return allowed[-n:]
+
+
+def lower_priority(cpus: List[int]):
+    """Called in the training process itself: nice + CPU affinity where the OS has them."""
+    if hasattr(os, "nice") and NICE > 0:
+        try:
+            os.nice(NICE)
+        except OSError:
+            pass
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError:
+            pass
+
+
+def run_in_subprocess(symbol: str, interval: str = "5m", period: Optional[str] = None,
+                      timeout: int = 3600) -> Dict[str, Any]:
+    """Run retrain() in `python -m app.services.incremental_training`; returns its JSON result."""
+    cpus = train_cpus()
+    cmd = [sys.executable, "-m", "app.services.incremental_training", "--symbol", symbol,
+           "--interval", interval, "--cpus", ",".join(map(str, cpus))]
+    if period:
+        cmd += ["--period", period]
+    env = os.environ.copy()
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        env[var] = str(len(cpus))
+    log.info("Starting incremental training process on cpus %s: %s", cpus, " ".join(cmd))
+    try:
+        p = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=timeout,
+                           creationflags=getattr(subprocess, "BELOW_NORMAL_PRIORITY_CLASS", 0))
+    except subprocess.TimeoutExpired:
+        log.exception("Incremental training timed out")
+        return {"success": False, "error": "timeout"}
+    lines = [ln for ln in (p.stdout or "").splitlines() if ln.strip()]
+    try:
+        res = json.loads(lines[-1])
+    except Exception:
+        return {"success": False, "returncode": p.returncode, "stderr": (p.stderr or "")[-2000:]}
+    if p.returncode != 0:
+        res.setdefault("success", False)
+    return res
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="incremental RandomForest retrain (low priority)")
+    p.add_argument("--symbol", required=True)
+    p.add_argument("--interval", default="5m")
+    p.add_argument("--period", default=None)
+    p.add_argument("--mode", choices=("warm_start", "window"), default=UPDATE_MODE)
+    p.add_argument("--cpus", default=None, help="comma-separated cores (default: INCR_CPUS highest cores)")
+    args = p.parse_args(argv)
+    cpus = [int(c) for c in args.cpus.split(",")] if args.cpus else train_cpus()
+    lower_priority(cpus)
+    try:
+        res = retrain(args.symbol, args.interval, args.period, args.mode, n_jobs=len(cpus))
+    except Exception as e:
+        log.exception("incremental retrain failed")
+        res = {"success": False, "error": str(e)}
+    print(json.dumps(res, default=str))
+    return 0 if res.get("success") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
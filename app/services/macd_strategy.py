@@ -1,5 +1,29 @@
+"""
+MACD crossover signals.
+
+- MacdSignals: O(1) per close, for live use (update(close) -> "BUY" / "SELL" / None)
+- macd_codes: whole-array version for backtests (int8 codes, see vector_backtest)
+- generate_signals(candles): list API, backed by macd_codes
+
+All three give the same output as the original prefix-recomputing loop (kept as
+generate_signals_loop): each EMA is seeded with sum(first period values) / period and then
+updated with v * k + ema * (1 - k), the same float operations in the same order.
+"""
+import logging
 from typing import List, Optional
 
+import numpy as np
+
+from app.services.vector_backtest import codes_to_signals, crossover_codes
+
+log = logging.getLogger(__name__)
+
+try:
+    from scipy.signal import lfilter  # type: ignore
+except Exception:
+    lfilter = None
+
+
 def ema(values: List[float], period: int) -> Optional[float]:
     if len(values) < period:
         return None
@@ -10,7 +34,131 @@ def ema(values: List[float], period: int) -> Optional[float]:
     return ema_val
 
 
+class EmaState:
+    """Incremental ema(): None until `period` values, then one recursion step per value."""
+    __slots__ = ("period", "k", "value", "_seed")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.k = 2 / (period + 1)
+        self.value: Optional[float] = None
+        self._seed: List[float] = []
+
+    def update(self, v: float) -> Optional[float]:
+        if self.value is not None:
+            self.value = v * self.k + self.value * (1 - self.k)
+        else:
+            self._seed.append(v)
+            if len(self._seed) == self.period:
+                self.value = sum(self._seed) / self.period
+                self._seed = []
+        return self.value
+
+
+class MacdSignals:
+    """Stateful generate_signals: feed closes one at a time."""
+
+    def __init__(self, fast=12, slow=26, signal_period=9):
+        self.fast = EmaState(fast)
+        self.slow = EmaState(slow)
+        self.signal = EmaState(signal_period)
+        self.prev_macd: Optional[float] = None
+        self.prev_signal: Optional[float] = None
+
+    def update(self, close: float) -> Optional[str]:
+        fast_ema = self.fast.update(float(close))
+        slow_ema = self.slow.update(float(close))
+        if fast_ema is None or slow_ema is None:
+            return None
+
+        macd = fast_ema - slow_ema
+        signal_line = self.signal.update(macd)
+
+        sig = None
+        if (
+            self.prev_macd is not None
+            and self.prev_signal is not None
+            and signal_line is not None
+        ):
+            if self.prev_macd <= self.prev_signal and macd > signal_line:
+                sig = "BUY"
+            elif self.prev_macd >= self.prev_signal and macd < signal_line:
+                sig = "SELL"
+
+        self.prev_macd, self.prev_signal = macd, signal_line
+        return sig
+
+
+def _ema_tail_loop(x: np.ndarray, k: float, seed: float) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.float64)
+    e = seed
+    for i, v in enumerate(x.tolist()):
+        e = v * k + e * (1 - k)
+        out[i] = e
+    return out
+
+
+def _ema_tail(x: np.ndarray, k: float, seed: float) -> np.ndarray:
+    """e[i] = x[i] * k + e[i - 1] * (1 - k) from e[-1] = seed."""
+    if _LFILTER_EXACT and len(x):
+        # y[n] = k*x[n] + z, z = (1-k)*y[n]: the same two products and sum as the loop
+        y, _ = lfilter([k], [1.0, -(1 - k)], x, zi=[seed * (1 - k)])
+        return y
+    return _ema_tail_loop(x, k, seed)
+
+
+def ema_array(x, period: int) -> np.ndarray:
+    """ema() of every prefix of x (nan until period values are available)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if len(x) < period:
+        return out
+    k = 2 / (period + 1)
+    seed = sum(x[:period].tolist()) / period
+    out[period - 1] = seed
+    out[period:] = _ema_tail(x[period:], k, seed)
+    return out
+
+
+def _check_lfilter() -> bool:
+    """Use lfilter only if it reproduces the loop bit for bit on this build (no FMA contraction etc.)."""
+    if lfilter is None:
+        return False
+    try:
+        x = np.cumsum(np.random.default_rng(0).normal(0, 1, 256)) + 100.0
+        k = 2 / 27
+        y, _ = lfilter([k], [1.0, -(1 - k)], x, zi=[x[0] * (1 - k)])
+        return bool(np.array_equal(y, _ema_tail_loop(x, k, float(x[0]))))
+    except Exception:
+        log.debug("lfilter EMA check failed", exc_info=True)
+        return False
+
+
+_LFILTER_EXACT = _check_lfilter()
+
+
+def macd_codes(close, fast=12, slow=26, signal_period=9) -> np.ndarray:
+    """Vectorized generate_signals over a close array -> int8 codes (BUY = 1, SELL = -1)."""
+    x = np.asarray(close, dtype=np.float64)
+    n = len(x)
+    start = max(fast, slow) - 1  # first bar with both EMAs
+    if n <= start:
+        return np.zeros(n, dtype=np.int8)
+    macd = np.full(n, np.nan)
+    macd[start:] = ema_array(x, fast)[start:] - ema_array(x, slow)[start:]
+    signal_line = np.full(n, np.nan)
+    signal_line[start:] = ema_array(macd[start:], signal_period)
+    # prev and current signal line exist from start + signal_period
+    return crossover_codes(macd, signal_line, start + signal_period)
+
+
 def generate_signals(candles, fast=12, slow=26, signal_period=9):
+    closes = [float(c["close"]) for c in candles]
+    return codes_to_signals(macd_codes(closes, fast, slow, signal_period))
+
+
+def generate_signals_loop(candles, fast=12, slow=26, signal_period=9):
+    """Original O(n^2) formulation (recomputes every EMA per candle); reference for parity checks."""
     closes, macd_vals, signals = [], [], []
     prev_macd, prev_signal = None, None
 
@@ -0,0 +1,439 @@
+# app/services/market_ingest.py
+"""
+Bulk loader for market_candles / market_ticks (read by candle_loader.load_candles and
+backtest_engine.load_ticks).
+
+Sources:
+  ingest_dataframe(df, symbol, interval)      any OHLCV DataFrame (DatetimeIndex or ts column)
+  ingest_fetcher(symbol, period, interval)    historical_fetcher.fetch_recent_ohlc (yfinance / AlphaVantage)
+  ingest_kite(symbol, start, end, interval)   Kite historical_data, fetched in per-interval date windows
+  ingest_file(path, interval, symbol=None)    CSV (read in chunks) or Parquet
+  ingest_tick_store(token, symbol, start, end) ticks recorded by app.tick_store -> market_ticks
+
+Writes:
+  - PostgreSQL: COPY FROM STDIN into a temp staging table, then one
+    INSERT ... SELECT ... ON CONFLICT (symbol, interval, ts) DO UPDATE per batch
+  - SQLite / others: executemany of INSERT ... ON CONFLICT DO UPDATE in one transaction per batch
+  - rows are de-duplicated on the key within a batch (last one wins)
+  - every batch commits together with its ingest_checkpoints rows (source, symbol, interval ->
+    last_ts), so an interrupted load resumes after the last committed bar (resume=True skips rows
+    at or before the checkpoint; sources are expected to be in time order per symbol)
+
+Timestamps are stored in UTC; naive input timestamps are taken as INGEST_NAIVE_TZ.
+
+Config via .env:
+  INGEST_BATCH_ROWS (default 50000), INGEST_NAIVE_TZ (default UTC),
+  KITE_HIST_MIN_INTERVAL (seconds between Kite historical calls, default 0.35)
+"""
+
+import os
+import io
+import csv
+import math
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, or_, select
+
+from app.db import engine
+from app.models import MarketCandle, MarketTick, IngestCheckpoint
+
+log = logging.getLogger(__name__)
+
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "50000"))
+INGEST_NAIVE_TZ = os.getenv("INGEST_NAIVE_TZ", "UTC")
+KITE_HIST_MIN_INTERVAL = float(os.getenv("KITE_HIST_MIN_INTERVAL", "0.35"))
+
+CANDLE_COLUMNS = ("symbol", "interval", "ts", "open", "high", "low", "close", "volume")
+CANDLE_KEY = ("symbol", "interval", "ts")
+TICK_COLUMNS = ("symbol", "ts", "price", "volume")
+TICK_KEY = ("symbol", "ts")
+TICK_INTERVAL = "tick"  # checkpoint interval for market_ticks
+
+# short interval name -> (Kite historical interval, max days per request)
+KITE_INTERVALS = {
+    "1m": ("minute", 60),
+    "3m": ("3minute", 100),
+    "5m": ("5minute", 100),
+    "10m": ("10minute", 100),
+    "15m": ("15minute", 200),
+    "30m": ("30minute", 200),
+    "1h": ("60minute", 400),
+    "1d": ("day", 2000),
+}
+
+_TS_COLUMNS = ("ts", "timestamp", "datetime", "date", "time")
+_SYMBOL_COLUMNS = ("symbol", "tradingsymbol", "ticker")
+
+
+# ---------------------------
+# Normalization
+# ---------------------------
+def _naive_tz():
+    if INGEST_NAIVE_TZ.upper() == "UTC":
+        return timezone.utc
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(INGEST_NAIVE_TZ)
+    except Exception:
+        log.warning("market_ingest: unknown INGEST_NAIVE_TZ=%s, using UTC", INGEST_NAIVE_TZ)
+        return timezone.utc
+
+
+def to_utc(value) -> Optional[datetime]:
+    """datetime / pandas Timestamp / numpy datetime64 / epoch s|ms|ns / ISO string -> aware UTC datetime."""
+    if value is None:
+        return None
+    if hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    elif hasattr(value, "astype") and "datetime64" in str(getattr(value, "dtype", "")):
+        value = int(value.astype("datetime64[ns]").astype("int64"))
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=_naive_tz())
+        return value.astimezone(timezone.utc)
+    v = int(value)
+    if v > 10 ** 17:
+        return datetime.fromtimestamp(v // 10 ** 9, tz=timezone.utc) + timedelta(microseconds=(v % 10 ** 9) // 1000)
+    if v > 10 ** 12:
+        return datetime.fromtimestamp(v // 1000, tz=timezone.utc) + timedelta(milliseconds=v % 1000)
+    return datetime.fromtimestamp(v, tz=timezone.utc)
+
+
+def _num(v) -> Optional[float]:
+    if v is None:
+        return None
+    try:
+        f = float(v)
+    except Exception:
+        return None
+    return None if math.isnan(f) else f
+
+
+def _pick(columns: Sequence[str], names: Sequence[str]) -> Optional[str]:
+    lower = {str(c).lower(): c for c in columns}
+    for n in names:
+        if n in lower:
+            return lower[n]
+    return None
+
+
+# ---------------------------
+# Checkpoints
+# ---------------------------
+def load_checkpoint(source: str, symbol: str, interval: str) -> Optional[datetime]:
+    """Last committed bar time for (source, symbol, interval), aware UTC, or None."""
+    t = IngestCheckpoint.__table__
+    with engine.connect() as conn:
+        row = conn.execute(
+            select(t.c.last_ts).where(t.c.source == source, t.c.symbol == symbol, t.c.interval == interval)
+        ).first()
+    if not row or row[0] is None:
+        return None
+    return to_utc(row[0])
+
+
+def _dialect_insert(conn):
+    name = conn.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _save_checkpoints(conn, source: str, marks: Dict[Tuple[str, str], Tuple[datetime, int]]):
+    insert = _dialect_insert(conn)
+    if not source or not marks or insert is None:
+        return
+    t = IngestCheckpoint.__table__
+    stmt = insert(t)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["source", "symbol", "interval"],
+        set_={
+            # never move a checkpoint backwards (re-sent older bars in a later batch)
+            "last_ts": case(
+                (or_(t.c.last_ts.is_(None), stmt.excluded.last_ts > t.c.last_ts), stmt.excluded.last_ts),
+                else_=t.c.last_ts,
+            ),
+            "rows": t.c.rows + stmt.excluded.rows,
+        },
+    )
+    conn.execute(stmt, [
+        {"source": source, "symbol": sym, "interval": intv, "last_ts": last, "rows": n}
+        for (sym, intv), (last, n) in marks.items()
+    ])
+
+
+# ---------------------------
+# Batch writers
+# ---------------------------
+def _copy_rows(cursor, sql: str, buf: io.StringIO) -> bool:
+    """COPY FROM STDIN with psycopg2 (copy_expert) or psycopg 3 (cursor.copy)."""
+    if hasattr(cursor, "copy_expert"):
+        cursor.copy_expert(sql, buf)
+        return True
+    if hasattr(cursor, "copy"):
+        with cursor.copy(sql) as cp:
+            cp.write(buf.getvalue())
+        return True
+    return False
+
+
+def _write_copy(conn, table, columns: Sequence[str], key: Sequence[str], rows: List[tuple]) -> bool:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        writer.writerow(["" if v is None else (v.isoformat() if isinstance(v, datetime) else v) for v in r])
+    buf.seek(0)
+
+    stage = f"_stage_{table.name}"  # emptied on commit
+    q = conn.dialect.identifier_preparer.quote
+    cols = ", ".join(q(c) for c in columns)
+    updates = ", ".join(f"{q(c)} = EXCLUDED.{q(c)}" for c in columns if c not in key)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DELETE ROWS AS "
+            f"SELECT {cols} FROM {table.name} WITH NO DATA"
+        )
+        if not _copy_rows(cursor, f"COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv)", buf):
+            return False
+        cursor.execute(
+            f"INSERT INTO {table.name} ({cols}) SELECT {cols} FROM {stage} "
+            f"ON CONFLICT ({', '.join(q(k) for k in key)}) DO UPDATE SET {updates}"
+        )
+    finally:
+        cursor.close()
+    return True
+
+
+def _write_executemany(conn, table, columns: Sequence[str], key: Sequence[str], rows: List[tuple]):
+    params = [dict(zip(columns, r)) for r in rows]
+    insert = _dialect_insert(conn)
+    if insert is None:
+        # no portable upsert: plain insert (duplicates rejected by the unique constraint)
+        conn.execute(table.insert(), params)
+        return
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={c: stmt.excluded[c] for c in columns if c not in key},
+    )
+    conn.execute(stmt, params)
+
+
+def _bulk_upsert(table, columns: Sequence[str], key: Sequence[str], rows: Iterable[tuple],
+                 source: Optional[str] = None, batch_size: int = INGEST_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Upsert tuples (ordered as `columns`) in batches of batch_size; one transaction per batch
+    including the checkpoint update. Returns {"rows", "batches", "seconds", "method"}.
+    """
+    key_idx = [columns.index(k) for k in key]
+    ts_idx = columns.index("ts")
+    intv_idx = columns.index("interval") if "interval" in columns else None
+    t0 = time.perf_counter()
+    total = batches = 0
+    method = None
+
+    with engine.connect() as conn:
+        use_copy = conn.dialect.name == "postgresql"
+
+        def flush(batch: Dict[tuple, tuple]):
+            nonlocal total, batches, method, use_copy
+            rows_ = list(batch.values())
+            marks: Dict[Tuple[str, str], Tuple[datetime, int]] = {}
+            for r in rows_:
+                mk = (r[0], r[intv_idx] if intv_idx is not None else TICK_INTERVAL)
+                last, n = marks.get(mk, (r[ts_idx], 0))
+                marks[mk] = (max(last, r[ts_idx]), n + 1)
+            with conn.begin():
+                if use_copy and _write_copy(conn, table, columns, key, rows_):
+                    method = "copy"
+                else:
+                    use_copy = False
+                    _write_executemany(conn, table, columns, key, rows_)
+                    method = method or "executemany"
+                _save_checkpoints(conn, source, marks)
+            total += len(rows_)
+            batches += 1
+
+        batch: Dict[tuple, tuple] = {}
+        for r in rows:
+            batch[tuple(r[i] for i in key_idx)] = r
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = {}
+        if batch:
+            flush(batch)
+
+    secs = time.perf_counter() - t0
+    log.info("market_ingest: %s rows -> %s in %d batches (%.1fs, %s)",
+             total, table.name, batches, secs, method or "-")
+    return {"rows": total, "batches": batches, "seconds": round(secs, 3), "method": method}
+
+
+def upsert_candles(rows: Iterable[tuple], source: Optional[str] = None,
+                   batch_size: int = INGEST_BATCH_ROWS) -> Dict[str, Any]:
+    """rows: (symbol, interval, ts, open, high, low, close, volume) tuples, ts as aware UTC datetime."""
+    return _bulk_upsert(MarketCandle.__table__, CANDLE_COLUMNS, CANDLE_KEY, rows, source, batch_size)
+
+
+def upsert_ticks(rows: Iterable[tuple], source: Optional[str] = None,
+                 batch_size: int = INGEST_BATCH_ROWS) -> Dict[str, Any]:
+    """rows: (symbol, ts, price, volume) tuples, ts as aware UTC datetime."""
+    return _bulk_upsert(MarketTick.__table__, TICK_COLUMNS, TICK_KEY, rows, source, batch_size)
+
+
+def _after(rows: Iterable[tuple], ts_idx: int, since: Optional[datetime]) -> Iterator[tuple]:
+    if since is None:
+        yield from rows
+        return
+    for r in rows:
+        if r[ts_idx] > since:
+            yield r
+
+
+# ---------------------------
+# Sources
+# ---------------------------
+def _frame_rows(df, interval: str, symbol: Optional[str] = None) -> Iterator[tuple]:
+    """OHLCV DataFrame -> candle tuples (timestamp from DatetimeIndex or a ts/date column)."""
+    if df is None or len(df) == 0:
+        return
+    if hasattr(df.columns, "levels"):  # yfinance multi-ticker columns
+        df = df.copy()
+        df.columns = [c[0] if isinstance(c, tuple) else c for c in df.columns]
+    cols = list(df.columns)
+    ts_col = _pick(cols, _TS_COLUMNS)
+    sym_col = None if symbol else _pick(cols, _SYMBOL_COLUMNS)
+    if not symbol and sym_col is None:
+        raise ValueError("symbol not given and no symbol column in data")
+    o, h, l, c = (_pick(cols, (n,)) for n in ("open", "high", "low", "close"))
+    v = _pick(cols, ("volume",))
+    if c is None:
+        raise ValueError(f"no close column in {cols}")
+
+    times = df[ts_col] if ts_col is not None else df.index
+    data = [df[x].tolist() if x is not None else [None] * len(df) for x in (o, h, l, c, v)]
+    syms = df[sym_col].tolist() if sym_col is not None else None
+    for i, ts in enumerate(times):
+        sym = syms[i] if syms is not None else symbol
+        close = _num(data[3][i])
+        if close is None:
+            continue
+        yield (str(sym), interval, to_utc(ts), _num(data[0][i]), _num(data[1][i]),
+               _num(data[2][i]), close, _num(data[4][i]))
+
+
+def ingest_dataframe(df, symbol: str, interval: str, source: Optional[str] = None,
+                     resume: bool = True) -> Dict[str, Any]:
+    since = load_checkpoint(source, symbol, interval) if (source and resume) else None
+    return upsert_candles(_after(_frame_rows(df, interval, symbol), 2, since), source=source)
+
+
+def ingest_fetcher(symbol: str, period: str = "7d", interval: str = "5m",
+                   provider_preference: str = "yfinance", resume: bool = True) -> Dict[str, Any]:
+    """Load recent bars from historical_fetcher.fetch_recent_ohlc (Yahoo symbol, e.g. RELIANCE.NS)."""
+    from app.historical_fetcher import fetch_recent_ohlc
+    df = fetch_recent_ohlc(symbol, provider_preference=provider_preference, period=period, interval=interval)
+    if df is None or df.empty:
+        return {"rows": 0, "batches": 0, "seconds": 0.0, "method": None}
+    return ingest_dataframe(df, symbol, interval, source=f"fetcher:{provider_preference}", resume=resume)
+
+
+def _kite_rows(kite, token: int, symbol: str, interval: str, start: datetime, end: datetime) -> Iterator[tuple]:
+    kite_interval, max_days = KITE_INTERVALS[interval]
+    window = timedelta(days=max_days)
+    cur = start
+    last_call = 0.0
+    while cur < end:
+        upto = min(cur + window, end)
+        wait = KITE_HIST_MIN_INTERVAL - (time.monotonic() - last_call)
+        if wait > 0:
+            time.sleep(wait)
+        last_call = time.monotonic()
+        bars = kite.historical_data(token, cur, upto, kite_interval) or []
+        for b in bars:
+            close = _num(b.get("close"))
+            if close is None:
+                continue
+            yield (symbol, interval, to_utc(b.get("date")), _num(b.get("open")), _num(b.get("high")),
+                   _num(b.get("low")), close, _num(b.get("volume")))
+        cur = upto + timedelta(seconds=1)
+
+
+def ingest_kite(symbol: str, start, end, interval: str = "1m", instrument_token: Optional[int] = None,
+                exchange: Optional[str] = None, resume: bool = True) -> Dict[str, Any]:
+    """
+    Load Kite historical bars for symbol over [start, end], split into the largest windows
+    Kite allows for the interval. With resume=True fetching starts after the checkpoint.
+    """
+    if interval not in KITE_INTERVALS:
+        raise ValueError(f"unsupported interval {interval!r}; use one of {sorted(KITE_INTERVALS)}")
+    from app.kite_client import kite_client
+    if kite_client.kite is None:
+        raise RuntimeError("Kite client not configured")
+    token = instrument_token or kite_client.get_instrument_token(symbol, exchange)
+    if start is None or end is None:
+        raise ValueError("start and end are required for Kite historical data")
+    source = "kite"
+    start, end = to_utc(start), to_utc(end)
+    if resume:
+        last = load_checkpoint(source, symbol, interval)
+        if last is not None and last >= start:
+            start = last + timedelta(seconds=1)
+    if start >= end:
+        return {"rows": 0, "batches": 0, "seconds": 0.0, "method": None}
+    return upsert_candles(_kite_rows(kite_client.kite, int(token), symbol, interval, start, end), source=source)
+
+
+def ingest_file(path: str, interval: str, symbol: Optional[str] = None,
+                resume: bool = True, chunk_rows: int = INGEST_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Load a CSV (streamed in chunks) or Parquet file. Needs a timestamp column (ts/timestamp/
+    datetime/date/time) and OHLC(V) columns; symbol comes from the argument or a symbol column.
+    """
+    import pandas as pd
+
+    source = f"file:{os.path.basename(path)}"
+    if path.lower().endswith((".parquet", ".pq")):
+        chunks = [pd.read_parquet(path)]
+    else:
+        chunks = pd.read_csv(path, chunksize=chunk_rows)
+
+    checkpoints: Dict[str, Optional[datetime]] = {}
+
+    def rows() -> Iterator[tuple]:
+        for chunk in chunks:
+            for r in _frame_rows(chunk, interval, symbol):
+                if resume:
+                    if r[0] not in checkpoints:
+                        checkpoints[r[0]] = load_checkpoint(source, r[0], interval)
+                    since = checkpoints[r[0]]
+                    if since is not None and r[2] <= since:
+                        continue
+                yield r
+
+    return upsert_candles(rows(), source=source)
+
+
+def ingest_tick_store(token, symbol: str, start, end, resume: bool = True) -> Dict[str, Any]:
+    """Copy ticks recorded by app.tick_store for token over [start, end] into market_ticks."""
+    from app import tick_store
+
+    source = "tick_store"
+    since = load_checkpoint(source, symbol, TICK_INTERVAL) if resume else None
+    arr = tick_store.read_ticks(token, start, end)
+
+    def rows() -> Iterator[tuple]:
+        for ts_ns, price, vol in zip(arr["ts"].tolist(), arr["price"].tolist(), arr["volume"].tolist()):
+            yield (symbol, to_utc(ts_ns), price, _num(vol))
+
+    return upsert_ticks(_after(rows(), 1, since), source=source)
@@ -1,3 +1,46 @@
+# app/services/optimizer.py
+"""
+Parameter-grid optimizer.
+
+- optimize(): original serial search (strategy_fn + backtest_fn over a candle list)
+- SharedArrays: named NumPy arrays (closes, OHLC, model probabilities, ...) packed into one
+  multiprocessing.shared_memory block; pool workers attach once in their initializer and read
+  zero-copy, read-only views, so the data is loaded / fetched once and never pickled per combo
+- iter_grid(): evaluates combos over a process pool and yields result rows as they complete.
+  Only ~2 combos per worker are in flight, so prune / patience / target can skip combos that
+  have not started yet
+- grid_search(): iter_grid collected into a ranked table (best first)
+- sma_crossover_eval: evaluator for the vectorized SMA candle backtest (vector_backtest)
+
+An evaluator is a module-level function evaluate(arrays, params) -> metrics dict (it is pickled
+by reference to the workers). Result rows: {"params", "ok", "elapsed_s", **metrics} or
+{"params", "ok": False, "error"}.
+
+Config via .env:
+  OPTIMIZER_WORKERS (default: CPU count)
+"""
+
+import os
+import time
+import logging
+import collections
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import product
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.services.vector_backtest import run_candle_backtest_arrays
+
+log = logging.getLogger(__name__)
+
+OPTIMIZER_WORKERS = int(os.getenv("OPTIMIZER_WORKERS", "0")) or (os.cpu_count() or 1)
+
+Evaluator = Callable[[Dict[str, np.ndarray], Dict[str, Any]], Dict[str, Any]]
+Score = Union[str, Callable[[Dict[str, Any]], Optional[float]]]
+
+
 def optimize(candles, strategy_fn, param_grid, backtest_fn):
     best = {"pnl": float("-inf"), "params": None}
 
@@ -13,3 +56,255 @@ def optimize(candles, strategy_fn, param_grid, backtest_fn):
             }
 
     return best
+
+
+def expand_grid(space: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """{"fast": [5, 10], "slow": [20]} -> [{"fast": 5, "slow": 20}, {"fast": 10, "slow": 20}]"""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in product(*(space[k] for k in keys))]
+
+
+# -------------------------
+# Shared memory
+# -------------------------
+class SharedArrays:
+    """
+    Copies named arrays into one shared memory block (owner side). `spec` is the small picklable
+    description workers attach with; close() / leaving the `with` block unlinks the block.
+    """
+
+    def __init__(self, arrays: Dict[str, Any]):
+        arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+        layout, offset = [], 0
+        for name, a in arrays.items():
+            offset = -(-offset // 64) * 64  # 64-byte aligned views
+            layout.append((name, a.dtype.str, a.shape, offset))
+            offset += a.nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (_, dtype, shape, off), a in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype, buffer=self._shm.buf, offset=off)[...] = a
+        self.spec = (self._shm.name, tuple(layout))
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_shared(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # pool workers share the owner's resource tracker, so attaching only re-registers the
+        # same name; the owner's unlink() clears it
+        return shared_memory.SharedMemory(name=name)
+
+
+def _views(shm: shared_memory.SharedMemory, layout) -> Dict[str, np.ndarray]:
+    out = {}
+    for name, dtype, shape, off in layout:
+        v = np.ndarray(shape, dtype, buffer=shm.buf, offset=off)
+        v.flags.writeable = False
+        out[name] = v
+    return out
+
+
+# per worker process
+_shm: Optional[shared_memory.SharedMemory] = None
+_arrays: Dict[str, np.ndarray] = {}
+
+
+def _attach(spec):
+    global _shm, _arrays
+    name, layout = spec
+    _shm = _open_shared(name)
+    _arrays = _views(_shm, layout)
+
+
+def _evaluate(evaluate: Evaluator, arrays: Dict[str, np.ndarray], params: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        metrics = evaluate(arrays, params)
+    except Exception as e:
+        log.debug("evaluate failed for %s", params, exc_info=True)
+        return {"params": params, "ok": False, "error": f"{type(e).__name__}: {e}",
+                "elapsed_s": time.perf_counter() - t0}
+    row = {"params": params, "ok": True, "elapsed_s": time.perf_counter() - t0}
+    row.update(metrics)
+    return row
+
+
+def _run_shared(evaluate: Evaluator, params: Dict[str, Any]) -> Dict[str, Any]:
+    return _evaluate(evaluate, _arrays, params)
+
+
+# -------------------------
+# Search
+# -------------------------
+def _score_fn(score: Score) -> Callable[[Dict[str, Any]], Optional[float]]:
+    if callable(score):
+        return score
+    return lambda row: row.get(score)
+
+
+def _valid(v) -> bool:
+    return v is not None and not (isinstance(v, float) and np.isnan(v))
+
+
+class _Progress:
+    """Best score so far + early-stopping rules over completed rows."""
+
+    def __init__(self, score: Score, maximize: bool, patience: Optional[int], target: Optional[float]):
+        self.key = _score_fn(score)
+        self.maximize = maximize
+        self.patience = patience
+        self.target = target
+        self.rows: List[Dict[str, Any]] = []
+        self.best: Optional[Dict[str, Any]] = None
+        self._best_score: Optional[float] = None
+        self._since_best = 0
+
+    def _better(self, a, b) -> bool:
+        return a > b if self.maximize else a < b
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        """Record a completed row; True when the search should stop."""
+        self.rows.append(row)
+        s = self.key(row) if row.get("ok") else None
+        if _valid(s) and (self._best_score is None or self._better(s, self._best_score)):
+            self.best, self._best_score, self._since_best = row, s, 0
+        else:
+            self._since_best += 1
+        if self.target is not None and self._best_score is not None \
+                and not self._better(self.target, self._best_score):
+            return True
+        return self.patience is not None and self._since_best >= self.patience
+
+
+def iter_grid(
+    arrays: Dict[str, Any],
+    evaluate: Evaluator,
+    combos: Iterable[Dict[str, Any]],
+    workers: Optional[int] = None,
+    score: Score = "pnl",
+    maximize: bool = True,
+    prune: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], bool]] = None,
+    patience: Optional[int] = None,
+    target: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one result row per evaluated combo, in completion order.
+
+    prune(params, rows_so_far) -> True skips a combo before it is submitted;
+    patience stops after that many completed rows without a new best score;
+    target stops once the best score reaches it. Rows of combos still running when the search
+    stops are dropped. workers <= 1 evaluates in this process (no pool, no shared memory).
+    """
+    combos = list(combos)
+    workers = min(workers or OPTIMIZER_WORKERS, max(len(combos), 1))
+    progress = _Progress(score, maximize, patience, target)
+
+    if workers <= 1:
+        arrays = {name: np.asarray(a) for name, a in arrays.items()}
+        for params in combos:
+            if prune is not None and prune(params, progress.rows):
+                continue
+            row = _evaluate(evaluate, arrays, params)
+            stop = progress.add(row)
+            yield row
+            if stop:
+                return
+        return
+
+    pending = collections.deque(combos)
+    in_flight = {}
+    with SharedArrays(arrays) as shared, ProcessPoolExecutor(
+        max_workers=workers, initializer=_attach, initargs=(shared.spec,),
+    ) as pool:
+        stop = False
+        while True:
+            while not stop and pending and len(in_flight) < workers * 2:
+                params = pending.popleft()
+                if prune is not None and prune(params, progress.rows):
+                    continue
+                in_flight[pool.submit(_run_shared, evaluate, params)] = params
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                del in_flight[fut]
+                row = fut.result()
+                stop = progress.add(row) or stop
+                yield row
+            if stop:
+                for fut in in_flight:
+                    fut.cancel()
+                break
+
+
+def rank(rows: Iterable[Dict[str, Any]], score: Score = "pnl", maximize: bool = True) -> List[Dict[str, Any]]:
+    """Best first; failed rows and rows without a score go last (rank None)."""
+    key = _score_fn(score)
+    scored, rest = [], []
+    for row in rows:
+        s = key(row) if row.get("ok") else None
+        (scored if _valid(s) else rest).append((s, row))
+    scored.sort(key=lambda t: t[0], reverse=maximize)
+    table = []
+    for i, (_, row) in enumerate(scored, start=1):
+        table.append(dict(row, rank=i))
+    for _, row in rest:
+        table.append(dict(row, rank=None))
+    return table
+
+
+def grid_search(
+    arrays: Dict[str, Any],
+    evaluate: Evaluator,
+    combos: Iterable[Dict[str, Any]],
+    workers: Optional[int] = None,
+    score: Score = "pnl",
+    maximize: bool = True,
+    prune: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], bool]] = None,
+    patience: Optional[int] = None,
+    target: Optional[float] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """iter_grid collected into a ranked table; on_result(row) is called as each row completes."""
+    rows = []
+    for row in iter_grid(arrays, evaluate, combos, workers, score, maximize, prune, patience, target):
+        if on_result is not None:
+            on_result(row)
+        rows.append(row)
+    return rank(rows, score, maximize)
+
+
+# -------------------------
+# Evaluators
+# -------------------------
+def sma_crossover_eval(arrays: Dict[str, np.ndarray], params: Dict[str, Any]) -> Dict[str, Any]:
+    """run_candle_backtest metrics on arrays["close"]; params: fast_period, slow_period, slippage_pct, commission."""
+    return run_candle_backtest_arrays(
+        [arrays["close"]],
+        params.get("slippage_pct", 0.0),
+        params.get("commission", 0.0),
+        params.get("fast_period", 5),
+        params.get("slow_period", 20),
+    )
+
+
+def optimize_sma(close, space: Dict[str, Sequence[Any]], workers: Optional[int] = None, **kwargs) -> List[Dict[str, Any]]:
+    """Ranked SMA crossover grid over one close array, e.g. space={"fast_period": [3, 5, 8], "slow_period": [20, 30]}."""
+    combos = [p for p in expand_grid(space) if p.get("fast_period", 5) < p.get("slow_period", 20)]
+    return grid_search({"close": np.asarray(close, dtype=np.float64)}, sma_crossover_eval, combos, workers, **kwargs)
@@ -0,0 +1,215 @@
+# app/services/portfolio_backtest.py
+"""
+Multi-symbol portfolio backtest on a shared clock.
+
+- align(series): N symbols -> one sorted union timestamp index and a (bars x symbols) close
+  matrix; gaps are forward-filled, bars before a symbol's first candle stay nan (not tradable)
+- signals for all symbols in one pass: vector_backtest.sma_crossover_codes on the 2-D matrix
+  (column j gets exactly the codes of the single-symbol engine on that column) or any int8 code
+  matrix from the caller
+- holdings(codes): the flat/long state machine of run_candle_backtest for every column at once
+  (long from a BUY until the next SELL)
+- target_weights(held, rule): capital allocation as in portfolio_rebalancer.rebalance_preview:
+  "equal" splits capital over the symbols held, "fixed" uses per-symbol target weights in percent
+  ({"symbol", "weight"} targets); optional max_weight cap, the rest stays in cash
+- simulate(close, weights, capital): rebalances only on bars where the target weights change;
+  target_qty = int(equity * weight / price) like rebalance_preview, fills at close +/- slippage,
+  flat commission per order. Between rebalances holdings are constant, so the equity curve is
+  cash + the (bars x symbols) position matrix times close, summed per bar
+
+Slippage is in percent and commission is per order, as in run_candle_backtest.
+"""
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.candle_loader import iter_candle_chunks
+from app.services.vector_backtest import BUY, sma_crossover_codes
+
+
+def align(series: Mapping[str, Tuple[Sequence[int], Sequence[float]]]) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """{symbol: (ts, close)} -> (ts union, symbols, close matrix (len(ts) x len(symbols)))."""
+    symbols = list(series)
+    parts = [(np.asarray(ts, dtype=np.int64), np.asarray(c, dtype=np.float64)) for ts, c in series.values()]
+    ts_all = np.unique(np.concatenate([ts for ts, _ in parts])) if parts else np.zeros(0, dtype=np.int64)
+    close = np.full((len(ts_all), len(symbols)), np.nan)
+    for j, (ts, c) in enumerate(parts):
+        close[np.searchsorted(ts_all, ts), j] = c  # duplicate timestamps: last one wins
+    return ts_all, symbols, ffill(close)
+
+
+def ffill(x: np.ndarray) -> np.ndarray:
+    """Forward-fill nan down each column (leading nans stay)."""
+    valid = ~np.isnan(x)
+    rows = np.where(valid, np.arange(len(x))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    out = np.take_along_axis(x, rows, axis=0)
+    out[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return out
+
+
+def load_close_matrix(symbols: Iterable[str], interval, start, end) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """Closes of every symbol (candle_loader chunks) aligned on one clock."""
+    series = {}
+    for sym in symbols:
+        ts, close = [], []
+        for chunk in iter_candle_chunks(sym, interval, start, end):
+            ts.append(chunk["ts"])
+            close.append(chunk["close"])
+        if ts:
+            series[sym] = (np.concatenate(ts), np.concatenate(close))
+    return align(series)
+
+
+def holdings(codes: np.ndarray) -> np.ndarray:
+    """Long (True) from each BUY until the next SELL, per column; duplicates are ignored."""
+    codes = np.asarray(codes)
+    rows = np.where(codes != 0, np.arange(len(codes))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.take_along_axis(codes, rows, axis=0) == BUY
+
+
+def target_weights(
+    held: np.ndarray,
+    rule: str = "equal",
+    symbols: Optional[Sequence[str]] = None,
+    targets: Optional[List[Dict[str, Any]]] = None,
+    max_weight: Optional[float] = None,
+) -> np.ndarray:
+    """(bars x symbols) target weights as fractions of equity."""
+    held = np.asarray(held, dtype=bool)
+    if rule == "equal":
+        n = held.sum(axis=1, keepdims=True)
+        w = np.divide(held, n, out=np.zeros(held.shape), where=n > 0)
+    elif rule == "fixed":
+        fixed = {t["symbol"]: float(t["weight"]) / 100.0 for t in targets or []}
+        w = held * np.array([fixed.get(s, 0.0) for s in symbols or []])
+    else:
+        raise ValueError(f"unknown allocation rule: {rule}")
+    if max_weight is not None:
+        np.minimum(w, max_weight, out=w)
+    return w
+
+
+def _drawdown(equity: np.ndarray) -> np.ndarray:
+    peak = np.maximum.accumulate(equity)
+    return np.divide(equity - peak, peak, out=np.zeros(len(equity)), where=peak > 0)
+
+
+def simulate(
+    close: np.ndarray,
+    weights: np.ndarray,
+    capital: float = 1_000_000.0,
+    slippage_pct: float = 0.05,
+    commission: float = 0.0,
+    rebalance_every: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Portfolio equity for target weights (bars x symbols). Orders only on rebalance bars (weights
+    changed, or every `rebalance_every` bars); symbols without a price are not traded.
+    """
+    T, N = close.shape
+    price = np.nan_to_num(close, nan=0.0)
+    tradable = price > 0
+    w = np.where(tradable, weights, 0.0)
+
+    change = np.zeros(T, dtype=bool)
+    if T:
+        change[0] = True
+        change[1:] = np.any(w[1:] != w[:-1], axis=1)
+        if rebalance_every:
+            change[::rebalance_every] = True
+    bars = np.flatnonzero(change)
+
+    qty = np.zeros(N)
+    cash = float(capital)
+    slip = slippage_pct / 100
+    seg_qty = np.zeros((len(bars), N))
+    seg_cash = np.zeros(len(bars))
+    orders = np.zeros(N, dtype=np.int64)
+    costs = np.zeros(N)
+    for k, t in enumerate(bars):
+        p = price[t]
+        equity = cash + float(qty @ p)
+        target = np.zeros(N)
+        ok = tradable[t]
+        target[ok] = np.floor(equity * w[t, ok] / (p[ok] * (1 + slip)))
+        target[~ok] = qty[~ok]  # no price: hold what we have
+        diff = target - qty
+        buy, sell = diff > 0, diff < 0
+        fill = np.where(buy, p * (1 + slip), p * (1 - slip))
+        n_orders = buy | sell
+        cash -= float(diff @ fill) + commission * int(n_orders.sum())
+        orders += n_orders
+        costs += np.abs(diff) * p * slip + commission * n_orders
+        qty = target
+        seg_qty[k] = qty
+        seg_cash[k] = cash
+
+    lengths = np.diff(np.append(bars, T))
+    positions = np.repeat(seg_qty, lengths, axis=0)
+    equity = np.repeat(seg_cash, lengths) + np.einsum("ij,ij->i", positions, price)
+    gross = positions[:-1] * np.diff(price, axis=0) if T > 1 else np.zeros((0, N))
+    dd = _drawdown(equity)
+    return {
+        "equity": equity,
+        "drawdown": dd,
+        "positions": positions,
+        "final_equity": float(equity[-1]) if T else float(capital),
+        "total_return": float(equity[-1] / capital - 1) if T and capital else 0.0,
+        "max_drawdown": round(float(-dd.min()) * 100, 2) if T else 0,
+        "rebalances": int(len(bars)),
+        "orders": int(orders.sum()),
+        "pnl_by_symbol": gross.sum(axis=0) - costs,
+        "orders_by_symbol": orders,
+    }
+
+
+def backtest_portfolio(
+    close: np.ndarray,
+    symbols: Sequence[str],
+    codes: Optional[np.ndarray] = None,
+    capital: float = 1_000_000.0,
+    rule: str = "equal",
+    targets: Optional[List[Dict[str, Any]]] = None,
+    max_weight: Optional[float] = None,
+    slippage_pct: float = 0.05,
+    commission: float = 0.0,
+    fast_period: int = 5,
+    slow_period: int = 20,
+    rebalance_every: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Signals (SMA crossover unless codes are given) -> holdings -> weights -> simulate."""
+    close = np.asarray(close, dtype=np.float64)
+    if codes is None:
+        codes = sma_crossover_codes(close, fast_period, slow_period)
+    weights = target_weights(holdings(codes), rule, symbols, targets, max_weight)
+    res = simulate(close, weights, capital, slippage_pct, commission, rebalance_every)
+    res["symbols"] = list(symbols)
+    res["per_symbol"] = [
+        {"symbol": s, "pnl": round(float(p), 2), "orders": int(o)}
+        for s, p, o in zip(symbols, res["pnl_by_symbol"], res["orders_by_symbol"])
+    ]
+    return res
+
+
+def run_portfolio_backtest(symbols, interval, start, end, capital=1_000_000.0, rule="equal",
+                           targets=None, max_weight=None, slippage_pct=0.05, commission=0.0,
+                           fast_period=5, slow_period=20) -> Dict[str, Any]:
+    """SMA crossover portfolio over stored candles; summary without the per-bar arrays."""
+    ts, syms, close = load_close_matrix(symbols, interval, start, end)
+    res = backtest_portfolio(close, syms, capital=capital, rule=rule, targets=targets,
+                             max_weight=max_weight, slippage_pct=slippage_pct, commission=commission,
+                             fast_period=fast_period, slow_period=slow_period)
+    return {
+        "symbols": syms,
+        "bars": int(len(ts)),
+        "final_equity": round(res["final_equity"], 2),
+        "pnl": round(res["final_equity"] - capital, 2),
+        "total_return": res["total_return"],
+        "max_drawdown": res["max_drawdown"],
+        "rebalances": res["rebalances"],
+        "orders": res["orders"],
+        "per_symbol": res["per_symbol"],
+    }
@@ -0,0 +1,322 @@
+# app/services/replay_engine.py
+"""
+Event-driven tick replay through the live decision path.
+
+Recorded ticks (tick_store) - or synthetic ones for pure throughput runs - are grouped into
+Kite-like frames (frame_ms) and handed to a fresh StrategyEngine.on_ticks, i.e. the production
+TickBuffer normalization, streaming IndicatorEngine, ML scoring (ml_model, on CandleEngine bar
+features), signal building and auto-order logic. For the duration of the run:
+
+- OrderManager.instance() is a SimulatedOrderManager: place_market_order fills at the replayed
+  last price +/- slippage with a flat commission and tracks positions / PnL; register_signal only
+  keeps the signal in memory (no Redis / WS / DB side effects)
+- TickBuffer / IndicatorEngine / CandleEngine start empty, so replayed state never mixes with
+  live state; every replayed tick is folded into CandleEngine as streamer.on_tick does, which is
+  where the strategy's model inputs come from
+- SentimentCache uses `sentiment` (callable ticker -> score, default: no sentiment) instead of
+  the DB loader
+- the engine's clock follows the replayed tick time, so cooldowns and signal timestamps behave
+  as they did live
+
+speed=None replays as fast as possible (throughput mode); speed=k paces frames at k x real time.
+The result reports ticks/sec, signal and order counts, simulated PnL, the latency histograms
+of the pipeline stages (queue / indicators / ml / register / end_to_end) and which scoring path
+ran ("scoring": batch / serial, the served model, bar interval, and how many signals carried an
+ML probability - none do until STRAT_ML_MIN_BARS bars have closed).
+
+Run it offline (scripts/replay_ticks.py), not inside the live server: the singletons above are
+swapped process-wide while a replay runs.
+"""
+
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import latency
+from app import ml_model
+from app import strategy
+from app import tick_store
+from app.candle_engine import CandleEngine
+from app.indicator_engine import IndicatorEngine
+from app.indicators import TickBuffer
+from app.order_manager import OrderManager
+from app.sentiment_cache import SentimentCache
+from app.strategy import StrategyEngine
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+
+# columnar replay input, time-ordered
+TickArrays = Dict[str, np.ndarray]  # ts (int64 ns), token (int64), price, qty, volume, oi
+
+
+# -------------------------
+# Tick sources
+# -------------------------
+def load_recorded(tokens: Iterable, start, end, root: Optional[str] = None) -> TickArrays:
+    """Recorded ticks of several tokens in [start, end], merged in time order."""
+    parts = []
+    for token in tokens:
+        arr = tick_store.read_ticks(token, start, end, root or tick_store.STORE_DIR)
+        if len(arr):
+            parts.append((int(token), arr))
+    if not parts:
+        return {k: np.zeros(0, dtype=np.int64 if k in ("ts", "token") else np.float64)
+                for k in ("ts", "token", "price", "qty", "volume", "oi")}
+    ts = np.concatenate([a["ts"] for _, a in parts])
+    order = np.argsort(ts, kind="stable")
+    out = {
+        "ts": ts[order],
+        "token": np.concatenate([np.full(len(a), t, dtype=np.int64) for t, a in parts])[order],
+    }
+    for name in ("price", "qty", "volume", "oi"):
+        out[name] = np.concatenate([a[name] for _, a in parts])[order]
+    return out
+
+
+def synthetic(n_tokens: int = 50, n_ticks: int = 200_000, start_ns: Optional[int] = None,
+              ticks_per_sec: float = 1000.0, seed: int = 0) -> TickArrays:
+    """Random-walk ticks for benchmarking the pipeline without recorded data."""
+    rng = np.random.default_rng(seed)
+    start_ns = time.time_ns() - int(n_ticks / ticks_per_sec * _NS) if start_ns is None else start_ns
+    token = rng.integers(0, n_tokens, n_ticks).astype(np.int64) + 100_000
+    base = 100.0 + rng.random(n_tokens) * 2900
+    steps = rng.normal(0, 0.0005, n_ticks)
+    price = np.empty(n_ticks)
+    qty = rng.integers(1, 500, n_ticks).astype(np.float64)
+    volume = np.empty(n_ticks)
+    for j in range(n_tokens):
+        m = token == j + 100_000
+        price[m] = np.round(base[j] * np.exp(np.cumsum(steps[m])), 2)
+        volume[m] = np.cumsum(qty[m])
+    ts = start_ns + (np.arange(n_ticks) * (_NS / ticks_per_sec)).astype(np.int64)
+    return {"ts": ts, "token": token, "price": price, "qty": qty, "volume": volume,
+            "oi": np.zeros(n_ticks)}
+
+
+def frames(ts: np.ndarray, frame_ms: int) -> Iterator[Tuple[int, int]]:
+    """(start, end) index ranges of ticks falling in the same frame_ms window."""
+    if not len(ts):
+        return
+    bucket = ts // (frame_ms * 1_000_000)
+    cuts = np.flatnonzero(bucket[1:] != bucket[:-1]) + 1
+    bounds = np.concatenate(([0], cuts, [len(ts)]))
+    for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        yield a, b
+
+
+# -------------------------
+# Simulated broker
+# -------------------------
+class SimulatedOrderManager(OrderManager):
+    """OrderManager with fills simulated at the replayed price (slippage in percent, commission per order)."""
+
+    def __init__(self, slippage_pct: float = 0.05, commission: float = 20.0, clock: Callable[[], datetime] = datetime.utcnow):
+        super().__init__()
+        self.slippage_pct = slippage_pct
+        self.commission = commission
+        self.clock = clock
+        self.prices: Dict[str, float] = {}
+        self.positions: Dict[str, Dict[str, float]] = {}  # token -> {"qty" (signed), "avg"}
+        self.fills: List[Dict[str, Any]] = []
+        self.realized = 0.0
+        self.commission_paid = 0.0
+        self.signals_registered = 0
+
+    def register_signal(self, token, data):
+        self.signals_registered += 1
+        payload = dict(data) if isinstance(data, dict) else {"action": str(data)}
+        self.last_signals[str(token)] = payload
+        return payload
+
+    def place_market_order(self, instrument_token, side, quantity, exchange="NSE", tradingsymbol=None,
+                           product="MIS", order_type="MARKET", record=True):
+        key = str(instrument_token)
+        price = self.prices.get(key)
+        if price is None or quantity <= 0:
+            return {"success": False, "error": "no price" if price is None else "bad quantity"}
+        buy = str(side).upper() == "BUY"
+        slip = self.slippage_pct / 100
+        fill = price * (1 + slip) if buy else price * (1 - slip)
+        signed = int(quantity) if buy else -int(quantity)
+
+        pos = self.positions.setdefault(key, {"qty": 0, "avg": 0.0})
+        q0 = pos["qty"]
+        if q0 and (q0 > 0) != (signed > 0):
+            closed = min(abs(q0), abs(signed))
+            self.realized += closed * (fill - pos["avg"]) * (1 if q0 > 0 else -1)
+        q1 = q0 + signed
+        if q1 == 0:
+            pos["avg"] = 0.0
+        elif q0 == 0 or (q0 > 0) != (q1 > 0):
+            pos["avg"] = fill  # opened, or flipped through zero
+        elif (q0 > 0) == (signed > 0):
+            pos["avg"] = (pos["avg"] * abs(q0) + fill * abs(signed)) / abs(q1)
+        pos["qty"] = q1
+        self.realized -= self.commission
+        self.commission_paid += self.commission
+
+        order_id = f"SIM-{len(self.fills) + 1}"
+        self.fills.append({"order_id": order_id, "token": key, "tradingsymbol": tradingsymbol,
+                           "side": "BUY" if buy else "SELL", "qty": int(quantity), "price": fill,
+                           "ts": self.clock().isoformat()})
+        return {"success": True, "order_id": order_id, "average_price": fill, "status": "COMPLETE"}
+
+    def summary(self) -> Dict[str, Any]:
+        unrealized = sum(p["qty"] * (self.prices.get(k, p["avg"]) - p["avg"])
+                         for k, p in self.positions.items() if p["qty"])
+        return {
+            "orders": len(self.fills),
+            "realized_pnl": round(self.realized, 2),
+            "unrealized_pnl": round(unrealized, 2),
+            "pnl": round(self.realized + unrealized, 2),
+            "commission": round(self.commission_paid, 2),
+            "open_positions": {k: dict(p) for k, p in self.positions.items() if p["qty"]},
+        }
+
+
+@contextmanager
+def _replay_singletons(orders: SimulatedOrderManager, sentiment: Optional[Callable[[str], Optional[float]]]):
+    saved = (TickBuffer._instance, IndicatorEngine._instance, CandleEngine._instance, OrderManager._instance,
+             SentimentCache._instance)
+    TickBuffer._instance = TickBuffer()
+    IndicatorEngine._instance = IndicatorEngine()
+    CandleEngine._instance = CandleEngine()
+    OrderManager._instance = orders
+    SentimentCache._instance = SentimentCache(loader=sentiment or (lambda ticker: None))
+    try:
+        yield
+    finally:
+        (TickBuffer._instance, IndicatorEngine._instance, CandleEngine._instance, OrderManager._instance,
+         SentimentCache._instance) = saved
+
+
+# -------------------------
+# Replay
+# -------------------------
+class TickReplay:
+    def __init__(
+        self,
+        ticks: TickArrays,
+        symbols: Optional[Dict[int, str]] = None,
+        frame_ms: int = 1000,
+        speed: Optional[float] = None,
+        mode: str = "auto",
+        batch_mode: Optional[bool] = None,
+        trade_amount: Optional[float] = None,
+        slippage_pct: float = 0.05,
+        commission: float = 20.0,
+        sentiment: Optional[Callable[[str], Optional[float]]] = None,
+    ):
+        self.ticks = ticks
+        self.symbols = {int(k): v for k, v in (symbols or {}).items()}
+        self.frame_ms = frame_ms
+        self.speed = speed
+        self.sentiment = sentiment
+        self._sim_ns = int(ticks["ts"][0]) if len(ticks["ts"]) else time.time_ns()
+        self.orders = SimulatedOrderManager(slippage_pct, commission, clock=self.now)
+        self.engine = StrategyEngine()
+        self.engine.set_mode(mode)
+        self.engine.clock = self.now
+        if batch_mode is not None:
+            self.engine.batch_mode = batch_mode
+        if trade_amount is not None:
+            self.engine.trade_amount = trade_amount
+
+    def now(self) -> datetime:
+        """Replayed time (naive UTC, like datetime.utcnow)."""
+        return datetime.fromtimestamp(self._sim_ns / _NS, tz=timezone.utc).replace(tzinfo=None)
+
+    def _frame(self, a: int, b: int, recv_ns: int) -> List[Dict[str, Any]]:
+        t = self.ticks
+        out = []
+        prices = self.orders.prices
+        candles = CandleEngine.instance()
+        for ts, tok, price, qty, vol, oi in zip(t["ts"][a:b].tolist(), t["token"][a:b].tolist(),
+                                               t["price"][a:b].tolist(), t["qty"][a:b].tolist(),
+                                               t["volume"][a:b].tolist(), t["oi"][a:b].tolist()):
+            prices[str(tok)] = price
+            candles.on_tick(tok, price, int(ts // _NS), vol)
+            out.append({
+                # Kite full-mode field names (+ timestamp / volume as read by TickBuffer)
+                "instrument_token": tok,
+                "tradingsymbol": self.symbols.get(tok),
+                "last_price": price,
+                "last_traded_quantity": qty,
+                "volume_traded": vol,
+                "volume": vol,
+                "oi": oi,
+                "timestamp": ts / _NS,
+                latency.TICK_STAMP_KEY: recv_ns,
+            })
+        return out
+
+    def run(self, max_ticks: Optional[int] = None, reset_latency: bool = True) -> Dict[str, Any]:
+        ts = self.ticks["ts"]
+        n_total = len(ts) if max_ticks is None else min(len(ts), max_ticks)
+        if reset_latency:
+            latency.reset()
+        actions: Dict[str, int] = {}
+        n_ticks = n_frames = n_signals = n_scored = 0
+        busy = 0.0
+
+        with _replay_singletons(self.orders, self.sentiment):
+            wall0 = time.perf_counter()
+            sim0 = int(ts[0]) if n_total else 0
+            for a, b in frames(ts[:n_total], self.frame_ms):
+                self._sim_ns = int(ts[b - 1])
+                if self.speed:
+                    wait = (self._sim_ns - sim0) / _NS / self.speed - (time.perf_counter() - wall0)
+                    if wait > 0:
+                        time.sleep(wait)
+                t0 = time.perf_counter()
+                signals = self.engine.on_ticks(self._frame(a, b, latency.now_ns())) or []
+                busy += time.perf_counter() - t0
+                n_ticks += b - a
+                n_frames += 1
+                n_signals += len(signals)
+                for sig in signals:
+                    actions[sig.get("action")] = actions.get(sig.get("action"), 0) + 1
+                    if sig.get("ml_prob") is not None:
+                        n_scored += 1
+            elapsed = time.perf_counter() - wall0
+
+        out = {
+            "ticks": n_ticks,
+            "frames": n_frames,
+            "elapsed_s": round(elapsed, 3),
+            "busy_s": round(busy, 3),
+            "ticks_per_sec": round(n_ticks / busy, 1) if busy else None,
+            "frames_per_sec": round(n_frames / busy, 1) if busy else None,
+            "replayed_span_s": round((int(ts[n_total - 1]) - int(ts[0])) / _NS, 3) if n_total else 0,
+            "signals": n_signals,
+            "actions": actions,
+            "scoring": self._scoring(n_signals, n_scored),
+            "latency_us": {k: v for k, v in latency.snapshot().items() if k in
+                           ("queue", "indicators", "ml", "register", "end_to_end")},
+        }
+        out.update(self.orders.summary())
+        return out
+
+
+    def _scoring(self, n_signals: int, n_scored: int) -> Dict[str, Any]:
+        """Which ML path the replay exercised (StrategyEngine._ml_probs in batch or serial mode)."""
+        ver = ml_model.ml_model.active
+        return {
+            "path": "batch" if self.engine.batch_mode else "serial",
+            "model": None if ver is None else {"id": ver.id, "path": ver.path, "features": ml_model.ml_model.feature_names()},
+            "bar_interval": strategy.ML_INTERVAL,
+            "min_bars": strategy.ML_MIN_BARS,
+            "scored_signals": n_scored,
+            "unscored_signals": n_signals - n_scored,
+        }
+
+
+def replay(ticks: TickArrays, **kwargs) -> Dict[str, Any]:
+    """TickReplay(ticks, **kwargs).run()"""
+    return TickReplay(ticks, **kwargs).run()
@@ -1,5 +1,23 @@
+"""
+RSI threshold signals (simple RSI over the last `period` close-to-close changes).
+
+- RsiSignals: stateful, for live use (update(close) -> "BUY" / "SELL" / None); keeps only the
+  last period + 1 closes
+- rsi_codes: whole-array version for backtests (int8 codes, see vector_backtest)
+- generate_signals(candles): list API, backed by rsi_codes
+
+Gains / losses are summed in window order with plain `+=` (vectorized as one add per window
+offset), so every RSI value - and every signal - is identical to the original per-bar rescan
+(kept as generate_signals_loop).
+"""
+import collections
 from typing import List, Optional
 
+import numpy as np
+
+from app.services.vector_backtest import BUY, SELL, codes_to_signals, window_sums
+
+
 def rsi(values: List[float], period: int = 14) -> Optional[float]:
     if len(values) < period + 1:
         return None
@@ -21,7 +39,64 @@ def rsi(values: List[float], period: int = 14) -> Optional[float]:
     return 100 - (100 / (1 + rs))
 
 
+def _classify(val: Optional[float], overbought, oversold) -> Optional[str]:
+    if val is None:
+        return None
+    if val < oversold:
+        return "BUY"
+    if val > overbought:
+        return "SELL"
+    return None
+
+
+class RsiSignals:
+    """Stateful generate_signals: feed closes one at a time."""
+
+    def __init__(self, period=14, overbought=70, oversold=30):
+        self.period = period
+        self.overbought = overbought
+        self.oversold = oversold
+        self._closes = collections.deque(maxlen=period + 1)
+
+    def update(self, close: float) -> Optional[str]:
+        self._closes.append(float(close))
+        return _classify(rsi(list(self._closes), self.period), self.overbought, self.oversold)
+
+
+def rsi_array(close, period: int = 14) -> np.ndarray:
+    """rsi() of every prefix of close (nan until period + 1 closes)."""
+    x = np.asarray(close, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if len(x) < period + 1:
+        return out
+    diff = x[1:] - x[:-1]
+    up = diff > 0
+    gains = window_sums(np.where(up, diff, 0.0), period, compensated=False)
+    losses = window_sums(np.where(up, 0.0, -diff), period, compensated=False)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        val = 100 - (100 / (1 + gains / losses))
+    val[losses == 0] = 100.0
+    out[period:] = val
+    return out
+
+
+def rsi_codes(close, period=14, overbought=70, oversold=30) -> np.ndarray:
+    """Vectorized generate_signals over a close array -> int8 codes (BUY = 1, SELL = -1)."""
+    val = rsi_array(close, period)
+    codes = np.zeros(len(val), dtype=np.int8)
+    buy = val < oversold
+    codes[buy] = BUY
+    codes[~buy & (val > overbought)] = SELL
+    return codes
+
+
 def generate_signals(candles, period=14, overbought=70, oversold=30):
+    closes = [float(c["close"]) for c in candles]
+    return codes_to_signals(rsi_codes(closes, period, overbought, oversold))
+
+
+def generate_signals_loop(candles, period=14, overbought=70, oversold=30):
+    """Original per-bar formulation; reference for parity checks."""
     closes, signals = [], []
 
     for c in candles:
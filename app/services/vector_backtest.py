@@ -0,0 +1,267 @@
+# app/services/vector_backtest.py
+"""
+Array versions of the candle backtests (candle_backtest_engine.run_candle_backtest and
+candle_backtest.backtest) with bit-identical results.
+
+- signals are int8 codes: BUY = 1, SELL = -1, none = 0
+- SMA crossover signals come from vectorized window sums; the sums add the window in the same
+  order as the builtin sum() used by candle_strategy (plain left-to-right before Python 3.12,
+  Neumaier-compensated from 3.12), so every crossover decision matches the loop version
+- the flat/long state machine reduces to "first BUY after each SELL": consecutive duplicate
+  signals are dropped and a leading SELL is ignored, leaving alternating entry/exit indices
+- equity is a sequential np.add.accumulate over closed-trade PnL, peak/drawdown use
+  np.maximum.accumulate (equity only moves on exit bars, so the trade curve is enough)
+
+CandleBacktest runs the same thing chunk by chunk (iter_candle_chunks) with state carried over.
+"""
+
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BUY = 1
+SELL = -1
+_CODES = {"BUY": BUY, "SELL": SELL}
+
+# builtin sum() of floats is compensated from 3.12 (gh-100425)
+_COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+def signals_to_codes(signals: Sequence[Optional[str]]) -> np.ndarray:
+    return np.fromiter((_CODES.get(s, 0) for s in signals), dtype=np.int8, count=len(signals))
+
+
+def codes_to_signals(codes: np.ndarray) -> List[Optional[str]]:
+    names = {BUY: "BUY", SELL: "SELL"}
+    return [names.get(c) for c in codes.tolist()]
+
+
+_BLOCK = 1 << 14  # window sums are built in cache-sized blocks
+
+
+def window_sums(x: np.ndarray, period: int, out: Optional[np.ndarray] = None,
+                compensated: Optional[bool] = None) -> np.ndarray:
+    """
+    out[j] == sum(x[j:j + period].tolist()) exactly, for j in range(len(x) - period + 1).
+    One in-place vector add per window offset and block: O(n * period) flops but no
+    Python-level loop over bars. compensated=False gives plain left-to-right `+=` sums
+    (what an explicit accumulation loop produces) on any Python version. A 2-D x (bars x
+    symbols) is summed down each column, exactly as each column on its own.
+    """
+    if compensated is None:
+        compensated = _COMPENSATED_SUM
+    x = np.asarray(x, dtype=np.float64)
+    m = len(x) - period + 1
+    if m <= 0:
+        return np.empty((0,) + x.shape[1:], dtype=np.float64)
+    if out is None:
+        out = np.empty((m,) + x.shape[1:], dtype=np.float64)
+    if not compensated:
+        for b in range(0, m, _BLOCK):
+            e = min(b + _BLOCK, m)
+            f = out[b:e]
+            f[:] = x[b:e]
+            for k in range(1, period):
+                f += x[b + k:e + k]
+        return out
+
+    # Neumaier, as in CPython's float sum: t = f + x; c += (f - t) + x if |f| >= |x| else (x - t) + f
+    n = min(_BLOCK, m)
+    shape = (n,) + x.shape[1:]
+    c_buf, t_buf, a_buf, u_buf = (np.empty(shape) for _ in range(4))
+    m_buf = np.empty(shape, dtype=bool)
+    for b in range(0, m, _BLOCK):
+        e = min(b + _BLOCK, m)
+        size = e - b
+        f = out[b:e]
+        f[:] = x[b:e]
+        c, t, a, u, ge = c_buf[:size], t_buf[:size], a_buf[:size], u_buf[:size], m_buf[:size]
+        c[:] = 0.0
+        for k in range(1, period):
+            xk = x[b + k:e + k]
+            np.add(f, xk, out=t)
+            np.abs(f, out=a)
+            np.abs(xk, out=u)
+            np.greater_equal(a, u, out=ge)
+            np.subtract(f, t, out=a)
+            a += xk
+            np.subtract(xk, t, out=u)
+            u += f
+            np.copyto(u, a, where=ge)
+            c += u
+            f[:] = t
+        with np.errstate(invalid="ignore"):
+            fix = (c != 0) & np.isfinite(c)
+        f[fix] += c[fix]
+    return out
+
+
+def _sma(x: np.ndarray, period: int) -> np.ndarray:
+    """SMA aligned with x (nan until period values are available); columns of a 2-D x independently."""
+    out = np.empty(x.shape, dtype=np.float64)
+    out[:period - 1] = np.nan
+    if len(x) >= period:
+        sums = window_sums(x, period, out=out[period - 1:])
+        sums /= period
+    return out
+
+
+def crossover_codes(fast: np.ndarray, slow: np.ndarray, first: int) -> np.ndarray:
+    """
+    Crossover of line `fast` against line `slow`: BUY where fast moves from <= slow to above it,
+    otherwise SELL where it moves from >= slow to below. Bars before `first` get none (there the
+    loops' `is not None` checks fail: a line is missing at the bar or at the bar before it).
+    """
+    codes = np.zeros(fast.shape, dtype=np.int8)
+    first = max(first, 1)
+    if first >= len(fast):
+        return codes
+    pf, ps = fast[first - 1:-1], slow[first - 1:-1]
+    f, s = fast[first:], slow[first:]
+    buy = pf <= ps
+    buy &= f > s
+    sell = pf >= ps
+    sell &= f < s
+    sell &= ~buy
+    np.subtract(buy.view(np.int8), sell.view(np.int8), out=codes[first:])  # BUY = 1, SELL = -1
+    return codes
+
+
+def sma_crossover_codes(close, fast_period: int = 5, slow_period: int = 20) -> np.ndarray:
+    """
+    Vectorized candle_strategy.generate_signals over a close array -> int8 codes. A 2-D close
+    (bars x symbols) gives the codes of every column in one pass.
+    """
+    x = np.asarray(close, dtype=np.float64)
+    if len(x) == 0:
+        return np.zeros(x.shape, dtype=np.int8)
+    # both SMAs exist at i and i - 1 from i = max(fast, slow)
+    return crossover_codes(_sma(x, fast_period), _sma(x, slow_period), max(fast_period, slow_period))
+
+
+def trade_indices(codes: np.ndarray, in_position: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bars where the flat/long state machine enters and exits, starting flat (or long).
+    Returns (entries, exits); when starting long, exits[0] closes the carried position.
+    """
+    idx = np.flatnonzero(codes)
+    if len(idx) == 0:
+        return idx, idx
+    s = codes[idx]
+    keep = np.empty(len(s), dtype=bool)
+    keep[0] = True
+    keep[1:] = s[1:] != s[:-1]
+    idx, s = idx[keep], s[keep]
+    if len(s) and s[0] == (BUY if in_position else SELL):
+        idx, s = idx[1:], s[1:]
+    return idx[s == BUY], idx[s == SELL]
+
+
+def _summary(equity, trades: np.ndarray, peak, max_dd) -> Dict:
+    wins = int(np.count_nonzero(trades > 0))
+    return {
+        "trades": len(trades),
+        "pnl": round(equity, 2),
+        "win_rate": round((wins / len(trades)) * 100, 2) if len(trades) else 0,
+        "max_drawdown": round((max_dd / peak) * 100, 2) if peak else 0,
+    }
+
+
+class CandleBacktest:
+    """
+    run_candle_backtest state machine over close/code chunks. Entry/exit prices, per-trade PnL,
+    the equity accumulation and peak/drawdown use the same float operations, in the same order,
+    as the loop, so the summary is identical.
+    """
+
+    def __init__(self, slippage_pct: float, commission: float):
+        self.slippage_pct = slippage_pct
+        self.commission = commission
+        self.position = 0
+        self.entry_price = 0
+        self.equity = 0
+        self.peak = 0
+        self.max_dd = 0
+        self._trades: List[np.ndarray] = []
+
+    def feed(self, close: np.ndarray, codes: np.ndarray):
+        entries, exits = trade_indices(codes, in_position=self.position == 1)
+        if not len(entries) and not len(exits):
+            return
+        close = np.asarray(close, dtype=np.float64)
+        entry_prices = close[entries] * (1 + self.slippage_pct / 100)
+        exit_prices = close[exits] * (1 - self.slippage_pct / 100)
+
+        carried = self.position == 1
+        if carried:
+            entry_prices = np.concatenate(([self.entry_price], entry_prices))
+        n_closed = len(exit_prices)
+        pnl = (exit_prices - entry_prices[:n_closed]) - self.commission
+
+        self.position = 1 if len(entry_prices) > n_closed else 0
+        if self.position:
+            self.entry_price = float(entry_prices[-1])
+
+        if n_closed:
+            self._trades.append(pnl)
+            eq = np.add.accumulate(np.concatenate(([self.equity], pnl)))[1:]
+            peak = np.maximum.accumulate(np.concatenate(([self.peak], eq)))[1:]
+            self.max_dd = max(self.max_dd, float(np.max(peak - eq)))
+            top = float(peak[-1])
+            if top > self.peak:
+                self.peak = top
+            self.equity = float(eq[-1])
+
+    def result(self) -> Dict:
+        trades = np.concatenate(self._trades) if self._trades else np.zeros(0)
+        return _summary(self.equity, trades, self.peak, self.max_dd)
+
+
+class SmaCrossoverCodes:
+    """sma_crossover_codes over consecutive close chunks (keeps the last max(fast, slow) closes)."""
+
+    def __init__(self, fast_period: int = 5, slow_period: int = 20):
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self._keep = max(fast_period, slow_period)
+        self._tail = np.zeros(0, dtype=np.float64)
+        self._seen = 0
+
+    def feed(self, close) -> np.ndarray:
+        chunk = np.asarray(close, dtype=np.float64)
+        ext = np.concatenate((self._tail, chunk)) if len(self._tail) else chunk
+        lead = len(self._tail)
+        first = self._keep - (self._seen - lead)  # ext index of global bar `keep`
+        codes = crossover_codes(_sma(ext, self.fast_period), _sma(ext, self.slow_period), first)
+        self._tail = ext[-self._keep:]
+        self._seen += len(chunk)
+        return codes[lead:]
+
+
+def run_candle_backtest_arrays(close_chunks: Iterable[np.ndarray], slippage_pct: float, commission: float,
+                               fast_period: int = 5, slow_period: int = 20) -> Dict:
+    """SMA crossover candle backtest over close chunks; same dict as run_candle_backtest."""
+    signals = SmaCrossoverCodes(fast_period, slow_period)
+    bt = CandleBacktest(slippage_pct, commission)
+    for close in close_chunks:
+        if len(close):
+            bt.feed(close, signals.feed(close))
+    return bt.result()
+
+
+def backtest_arrays(close, codes, slippage: float = 0.0, commission: float = 0.0) -> Dict:
+    """Array version of candle_backtest.backtest (slippage as a fraction; trades = entries)."""
+    close = np.asarray(close, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int8)
+    n = min(len(close), len(codes))
+    entries, exits = trade_indices(codes[:n])
+    entry_prices = close[entries] * (1 + slippage)
+    exit_prices = close[exits] * (1 - slippage)
+    pnl = 0.0
+    if len(exits):
+        pnl = float(np.add.accumulate(np.concatenate(([0.0], exit_prices - entry_prices[:len(exits)] - commission)))[-1])
+    return {
+        "pnl": round(pnl, 2),
+        "trades": len(entries),
+    }
@@ -0,0 +1,249 @@
+# app/services/walk_forward.py
+"""
+Walk-forward (time-series cross-validated) evaluation of the RandomForest next-bar model.
+
+- feature_matrix(df): the ml_model training features (r1, r2, vol_norm from the feature store
+  registry, as MLModel.train_dummy uses them), next-bar target and next-bar return, computed once over the whole series.
+  Every feature only looks at the current / past bars, so a fold sliced out of the full matrix
+  is the same as recomputing the fold on its own
+- cached_features(df, symbol, interval): feature_matrix stored as .npz under FEATURE_CACHE_DIR,
+  keyed by symbol / interval / sha1 of the OHLCV data / FEATURE_SET_VERSION; unchanged data only
+  loads the file, older entries for the same symbol / interval are removed on write
+- folds(n, n_folds, max_train_size, gap): sklearn TimeSeriesSplit (expanding window) as
+  contiguous (train_start, train_end, test_start, test_end) ranges
+- walk_forward(df, symbol, interval): trains and scores all folds in parallel worker processes
+  (optimizer.iter_grid; the feature arrays are shared, not copied per fold) and stitches the
+  out-of-sample strategy returns of the folds into one equity curve
+
+Strategy on out-of-sample bars: long for one bar when prob_up >= threshold, minus `cost` per trade.
+
+Bump FEATURE_SET_VERSION whenever feature_matrix or the versions of its features change.
+
+Config via .env:
+  FEATURE_CACHE_DIR (default app/storage/feature_cache), WALK_FORWARD_FOLDS (default 5)
+"""
+
+import os
+import re
+import glob
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support, roc_auc_score
+from sklearn.model_selection import TimeSeriesSplit
+
+from app.services import feature_store
+from app.services.feature_store import data_hash, index_ns as _index_ns, ohlcv as _ohlcv
+from app.services.optimizer import iter_grid
+
+log = logging.getLogger(__name__)
+
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "app/storage/feature_cache")
+WALK_FORWARD_FOLDS = int(os.getenv("WALK_FORWARD_FOLDS", "5"))
+
+FEATURE_SET_VERSION = "ml-v1"
+FEATURES = ["r1", "r2", "vol_norm"]
+
+_FOLD_METRICS = ("accuracy", "precision", "recall", "f1", "auc", "n_trades", "hit_rate",
+                 "total_return", "sharpe")
+
+
+# -------------------------
+# Features + cache
+# -------------------------
+def feature_matrix(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    {"X" (n, len(FEATURES)), "y" next bar up (int8), "ret" next-bar return, "close", "ts" (ns)}
+    for every bar with a next bar; NaN features -> 0 as in training.
+    """
+    df = _ohlcv(df)
+    close = df["close"]
+    next_close = close.shift(-1)
+    feats = feature_store.compute(df, FEATURES)
+
+    keep = next_close.notna().to_numpy()
+    ret = ((next_close - close) / close).to_numpy(dtype=np.float64)[keep]
+    X = feats[FEATURES].to_numpy(dtype=np.float64)[keep]
+    X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+    return {
+        "X": X,
+        "y": (ret > 0).astype(np.int8),
+        "ret": ret,
+        "close": close.to_numpy(dtype=np.float64)[keep],
+        "ts": _index_ns(df)[keep],
+    }
+
+
+def _safe(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(s))
+
+
+def cache_path(symbol: str, interval: str, digest: str, root: Optional[str] = None) -> str:
+    name = f"{_safe(symbol)}__{_safe(interval)}__{FEATURE_SET_VERSION}__{digest[:20]}.npz"
+    return os.path.join(root or FEATURE_CACHE_DIR, name)
+
+
+def cached_features(df: pd.DataFrame, symbol: str, interval: str, root: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """feature_matrix(df), loaded from / saved to the feature cache."""
+    path = cache_path(symbol, interval, data_hash(df), root)
+    if os.path.exists(path):
+        try:
+            with np.load(path) as f:
+                if list(f["features"]) == FEATURES:
+                    log.debug("feature cache hit %s", path)
+                    return {k: f[k] for k in ("X", "y", "ret", "close", "ts")}
+        except Exception:
+            log.warning("unreadable feature cache file %s, rebuilding", path, exc_info=True)
+
+    feats = feature_matrix(df)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, features=np.array(FEATURES), **feats)
+        os.replace(tmp, path)
+        prefix = os.path.join(os.path.dirname(path), f"{_safe(symbol)}__{_safe(interval)}__")
+        for old in glob.glob(glob.escape(prefix) + "*.npz"):
+            if old != path:
+                os.remove(old)
+    except Exception:
+        log.warning("could not write feature cache %s", path, exc_info=True)
+    return feats
+
+
+# -------------------------
+# Folds
+# -------------------------
+def folds(n: int, n_folds: int = WALK_FORWARD_FOLDS, max_train_size: Optional[int] = None,
+          gap: int = 0) -> List[Tuple[int, int, int, int]]:
+    """(train_start, train_end, test_start, test_end) per fold, oldest first (end exclusive)."""
+    split = TimeSeriesSplit(n_splits=n_folds, max_train_size=max_train_size, gap=gap)
+    return [(int(tr[0]), int(tr[-1]) + 1, int(te[0]), int(te[-1]) + 1)
+            for tr, te in split.split(np.empty((n, 1)))]
+
+
+def bars_per_year(ts: np.ndarray) -> float:
+    """Annualisation as in backtest_model: intraday bars over a 390-minute day, else daily; 252 days."""
+    if len(ts) < 2:
+        return 252.0
+    step_s = float(np.median(np.diff(ts[:200]))) / 1e9
+    if 0 < step_s < 86400:
+        return max(int(390 * 60 / step_s), 1) * 252.0
+    return 252.0
+
+
+def _sharpe(r: np.ndarray, per_year: float) -> Optional[float]:
+    if len(r) < 2:
+        return None
+    sd = float(np.std(r, ddof=1))
+    return float(np.mean(r) * per_year / (sd * np.sqrt(per_year) + 1e-9))
+
+
+def evaluate_fold(arrays: Dict[str, np.ndarray], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Train on [train_start, train_end), score [test_start, test_end). Runs in a pool worker."""
+    a, b = params["train_start"], params["train_end"]
+    c, d = params["test_start"], params["test_end"]
+    X, y, ret = arrays["X"], arrays["y"], arrays["ret"]
+
+    m = RandomForestClassifier(n_estimators=params.get("n_estimators", 100), random_state=42, n_jobs=1)
+    m.fit(X[a:b], y[a:b])
+    classes = list(m.classes_)
+    prob = m.predict_proba(X[c:d])[:, classes.index(1)] if 1 in classes else np.zeros(d - c)
+
+    y_test = y[c:d]
+    pred = (prob >= 0.5).astype(np.int8)
+    prec, rec, f1, _ = precision_recall_fscore_support(y_test, pred, average="binary", zero_division=0)
+    try:
+        auc = float(roc_auc_score(y_test, prob))
+    except ValueError:
+        auc = None
+
+    trade = prob >= params["threshold"]
+    strategy_ret = np.where(trade, ret[c:d] - params["cost"], 0.0)
+    n_trades = int(np.count_nonzero(trade))
+    return {
+        "accuracy": float(accuracy_score(y_test, pred)),
+        "precision": float(prec),
+        "recall": float(rec),
+        "f1": float(f1),
+        "auc": auc,
+        "n_trades": n_trades,
+        "hit_rate": float(np.count_nonzero(strategy_ret[trade] > 0) / n_trades) if n_trades else 0.0,
+        "total_return": float(np.prod(1 + strategy_ret) - 1),
+        "sharpe": _sharpe(strategy_ret, params["bars_per_year"]),
+        "strategy_ret": strategy_ret,
+    }
+
+
+# -------------------------
+# Walk-forward
+# -------------------------
+def walk_forward(
+    df: pd.DataFrame,
+    symbol: str,
+    interval: str,
+    n_folds: int = WALK_FORWARD_FOLDS,
+    threshold: float = 0.55,
+    cost: float = 0.0007,
+    n_estimators: int = 100,
+    max_train_size: Optional[int] = None,
+    gap: int = 0,
+    workers: Optional[int] = None,
+    cache_root: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Out-of-sample evaluation over n_folds walk-forward folds. Returns a summary with per-fold
+    metrics ("folds"), aggregate OOS metrics and the stitched OOS curve ("ts", "equity" arrays).
+    """
+    feats = cached_features(df, symbol, interval, cache_root)
+    n = len(feats["y"])
+    if n < n_folds + 1:
+        return {"symbol": symbol, "interval": interval, "success": False, "error": "not enough data", "rows": n}
+
+    per_year = bars_per_year(feats["ts"])
+    combos = [
+        {"fold": i, "train_start": a, "train_end": b, "test_start": c, "test_end": d,
+         "threshold": threshold, "cost": cost, "n_estimators": n_estimators, "bars_per_year": per_year}
+        for i, (a, b, c, d) in enumerate(folds(n, n_folds, max_train_size, gap))
+    ]
+    arrays = {k: feats[k] for k in ("X", "y", "ret")}
+    rows = sorted(iter_grid(arrays, evaluate_fold, combos, workers, score="sharpe"),
+                  key=lambda r: r["params"]["fold"])
+
+    table, parts, ts_parts, errors = [], [], [], []
+    for r in rows:
+        p = r["params"]
+        if not r["ok"]:
+            errors.append({"fold": p["fold"], "error": r["error"]})
+            continue
+        parts.append(r["strategy_ret"])
+        ts_parts.append(feats["ts"][p["test_start"]:p["test_end"]])
+        fold = {k: p[k] for k in ("fold", "train_start", "train_end", "test_start", "test_end")}
+        fold.update({k: r[k] for k in _FOLD_METRICS})
+        fold["elapsed_s"] = r["elapsed_s"]
+        table.append(fold)
+
+    oos = np.concatenate(parts) if parts else np.zeros(0)
+    equity = np.cumprod(1 + oos)
+    peak = np.maximum.accumulate(equity) if len(equity) else equity
+    trades = [f["n_trades"] for f in table]
+    return {
+        "symbol": symbol,
+        "interval": interval,
+        "success": not errors,
+        "rows": n,
+        "feature_set": FEATURE_SET_VERSION,
+        "folds": table,
+        "errors": errors,
+        "oos_bars": int(len(oos)),
+        "n_trades": int(sum(trades)),
+        "total_return": float(equity[-1] - 1) if len(equity) else 0.0,
+        "sharpe": _sharpe(oos, per_year),
+        "max_drawdown": float(np.min((equity - peak) / peak)) if len(equity) else 0.0,
+        "mean_auc": float(np.mean([f["auc"] for f in table if f["auc"] is not None])) if any(f["auc"] is not None for f in table) else None,
+        "ts": np.concatenate(ts_parts) if ts_parts else np.zeros(0, dtype=np.int64),
+        "equity": equity,
+    }
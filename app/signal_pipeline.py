@@ -0,0 +1,273 @@
+# app/signal_pipeline.py
+"""
+Background side-effect pipeline for registered signals.
+
+OrderManager.register_signal() used to do Redis SET+EXPIRE, Redis PUBLISH, WS publish and a
+DB insert synchronously on the Kite ticker thread. SignalPipeline moves all of that off the
+hot path:
+ - submit() is a non-blocking put on a bounded queue (never waits on network/disk)
+ - worker thread(s) drain the queue for up to SIGNAL_FLUSH_INTERVAL_MS, coalescing repeated
+   signals per token (only the newest payload per token in a window is written)
+ - each flush does one Redis pipeline round-trip, one DB executemany and the WS hand-offs
+ - drop policy when the queue is full: "drop_oldest" (default) or "drop_newest"
+ - metrics() exposes queue depth / drops / coalescing / flush latency for backpressure monitoring
+
+Config via .env:
+  SIGNAL_PIPELINE_ENABLED (default true), SIGNAL_QUEUE_MAX (default 10000),
+  SIGNAL_FLUSH_INTERVAL_MS (default 200), SIGNAL_BATCH_MAX (default 500),
+  SIGNAL_DROP_POLICY (drop_oldest|drop_newest), SIGNAL_PIPELINE_WORKERS (default 1),
+  SIGNAL_REDIS_TTL (default 600)
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+PIPELINE_ENABLED = os.getenv("SIGNAL_PIPELINE_ENABLED", "true").lower() in ("1", "true", "yes")
+QUEUE_MAX = int(os.getenv("SIGNAL_QUEUE_MAX", "10000"))
+FLUSH_INTERVAL_MS = int(os.getenv("SIGNAL_FLUSH_INTERVAL_MS", "200"))
+BATCH_MAX = int(os.getenv("SIGNAL_BATCH_MAX", "500"))
+DROP_POLICY = os.getenv("SIGNAL_DROP_POLICY", "drop_oldest").lower()
+WORKERS = int(os.getenv("SIGNAL_PIPELINE_WORKERS", "1"))
+REDIS_TTL = int(os.getenv("SIGNAL_REDIS_TTL", "600"))
+
+# ---- Optional sinks (best-effort, same pattern as order_manager) ----
+_redis_write_batch = None
+try:
+    from .redis_client import write_signals_batch as _redis_write_batch
+except Exception:
+    _redis_write_batch = None
+
+_ws_publish = None
+try:
+    from .ws_broadcast import publish_signal_threadsafe as _ws_publish
+except Exception:
+    _ws_publish = None
+
+_STOP = object()
+
+
+def _signal_row(token_key, payload):
+    """Map a signal payload onto the `signals` table columns (same mapping as crud.save_signal)."""
+    ts_val = payload.get("ts")
+    if isinstance(ts_val, str):
+        try:
+            ts_val = datetime.fromisoformat(ts_val)
+        except Exception:
+            ts_val = None
+    if not isinstance(ts_val, datetime):
+        ts_val = datetime.utcnow()
+    details = payload.get("details") or payload
+    try:
+        details = json.loads(json.dumps(details, default=str))
+    except Exception:
+        details = {"raw": str(details)}
+    prob_up = payload.get("prob_up", payload.get("ml_prob"))
+    return {
+        "instrument_token": str(payload.get("instrument_token") or token_key),
+        "tradingsymbol": payload.get("tradingsymbol") or payload.get("symbol"),
+        "ts": ts_val,
+        "score": payload.get("score"),
+        "prob_up": prob_up,
+        "sentiment": payload.get("sentiment"),
+        "details": details,
+    }
+
+
+def _persist_batch(rows):
+    """One executemany INSERT into `signals` for the whole flush."""
+    from .db import engine
+    from .models import Signal
+    with engine.begin() as conn:
+        conn.execute(Signal.__table__.insert(), rows)
+
+
+class SignalPipeline:
+    """Bounded queue + worker threads that batch signal side effects (Redis / WS / DB)."""
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, maxsize=QUEUE_MAX, flush_interval_ms=FLUSH_INTERVAL_MS, batch_max=BATCH_MAX,
+                 drop_policy=DROP_POLICY, workers=WORKERS):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.flush_interval = max(flush_interval_ms, 1) / 1000.0
+        self.batch_max = max(int(batch_max), 1)
+        self.drop_policy = drop_policy if drop_policy in ("drop_oldest", "drop_newest") else "drop_oldest"
+        self.n_workers = max(int(workers), 1)
+        self.lock = threading.Lock()
+        self._threads = []
+        self._running = False
+        self._stats = {
+            "submitted": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "flushed_signals": 0,
+            "flush_batches": 0,
+            "redis_errors": 0,
+            "db_errors": 0,
+            "ws_errors": 0,
+            "max_queue_depth": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+        }
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+    def start(self):
+        with self.lock:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.n_workers):
+                t = threading.Thread(target=self._worker, name=f"signal-pipeline-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        log.info("SignalPipeline started (workers=%d, maxsize=%d, flush=%.0fms, policy=%s)",
+                 self.n_workers, self.queue.maxsize, self.flush_interval * 1000, self.drop_policy)
+
+    def stop(self, timeout=5.0):
+        """Flush what is queued and stop the workers."""
+        with self.lock:
+            if not self._running:
+                return
+            self._running = False
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+        for t in threads:
+            t.join(timeout=timeout)
+        log.info("SignalPipeline stopped")
+
+    # ---------------------------
+    # Producer side (tick thread)
+    # ---------------------------
+    def submit(self, token_key, payload):
+        """Non-blocking enqueue. Returns False if the signal was dropped."""
+        if not self._running:
+            self.start()
+        item = (str(token_key), payload)
+        with self.lock:
+            self._stats["submitted"] += 1
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.drop_policy == "drop_newest":
+                self._count("dropped")
+                return False
+            try:
+                self.queue.get_nowait()
+                self._count("dropped")
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self._count("dropped")
+                return False
+        depth = self.queue.qsize()
+        if depth > self._stats["max_queue_depth"]:
+            self._stats["max_queue_depth"] = depth
+        return True
+
+    # ---------------------------
+    # Consumer side
+    # ---------------------------
+    def _worker(self):
+        while True:
+            try:
+                first = self.queue.get()
+            except Exception:
+                continue
+            if first is _STOP:
+                return
+            pending = {first[0]: first[1]}
+            received = 1
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while received < self.batch_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                received += 1
+                pending[item[0]] = item[1]
+            if received > len(pending):
+                self._count("coalesced", received - len(pending))
+            try:
+                self._flush(list(pending.items()))
+            except Exception:
+                log.exception("SignalPipeline flush failed")
+            if stop:
+                return
+
+    def _flush(self, items):
+        t0 = time.perf_counter()
+
+        if _redis_write_batch:
+            try:
+                _redis_write_batch(items, expire_seconds=REDIS_TTL)
+            except Exception:
+                self._count("redis_errors")
+                log.debug("SignalPipeline: redis batch write failed", exc_info=True)
+
+        if _ws_publish:
+            for token_key, payload in items:
+                try:
+                    _ws_publish({"type": "signal", "token": token_key, "signal": payload})
+                except Exception:
+                    self._count("ws_errors")
+
+        try:
+            _persist_batch([_signal_row(k, p) for k, p in items])
+        except Exception:
+            self._count("db_errors")
+            log.debug("SignalPipeline: DB executemany failed", exc_info=True)
+
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        with self.lock:
+            self._stats["flushed_signals"] += len(items)
+            self._stats["flush_batches"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            if elapsed_ms > self._stats["max_flush_ms"]:
+                self._stats["max_flush_ms"] = elapsed_ms
+        log.debug("SignalPipeline flushed %d signals in %.1fms", len(items), elapsed_ms)
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self._stats[key] += n
+
+    def metrics(self):
+        with self.lock:
+            out = dict(self._stats)
+        out["queue_depth"] = self.queue.qsize()
+        out["queue_max"] = self.queue.maxsize
+        out["drop_policy"] = self.drop_policy
+        out["running"] = self._running
+        return out
+
+
+def shutdown_pipeline():
+    """Flush + stop the singleton if it was ever started (call from app shutdown)."""
+    if SignalPipeline._instance is not None:
+        SignalPipeline._instance.stop()
@@ -10,6 +10,16 @@ StrategyEngine: central decision engine for manual vs auto trading.
  - Auto mode: places SELL when price predicted to go DOWN (high → low).
  - Manual mode: only sends signals to frontend, no automatic orders.
  - User can set trade amount and duration (via frontend settings).
+ - Batch mode (default): a tick frame is grouped by token and scored with one ML call.
+ - ML inputs are the model's feature store definitions (services/feature_store, what
+   train_dummy trains on) over the token's closed CandleEngine bars, not the tick-level
+   indicator snapshot; serial and batch mode score through the same helper, so
+   STRAT_BATCH_MODE only changes how ticks are grouped.
+
+Config via .env:
+  STRAT_ML_INTERVAL=5m      # CandleEngine interval the model inputs are computed on
+  STRAT_ML_BARS=50          # closed bars read per token
+  STRAT_ML_MIN_BARS=20      # fewer closed bars -> no ML score (signal stays HOLD)
 """
 
 import os
@@ -18,11 +28,16 @@ import logging
 from threading import Lock
 from datetime import datetime, timedelta
 
-from .crud import get_latest_sentiment
+from .sentiment_cache import SentimentCache
 from .order_manager import OrderManager
-from .indicators import compute_signals
+import pandas as pd
+
+from .indicators import TickBuffer, compute_signals_incremental
+from .candle_engine import CandleEngine
+from .services import feature_store
 from . import ml_model
 from . import ws_broadcast
+from . import latency
 from .models import Instrument
 
 log = logging.getLogger(__name__)
@@ -33,6 +48,14 @@ SENTIMENT_THRESHOLD = float(os.getenv("STRAT_SENTIMENT_THRESHOLD", "-0.1"))
 MIN_VOLUME = int(os.getenv("STRAT_MIN_VOLUME", "0"))
 COOLDOWN_SECS = int(os.getenv("STRAT_COOLDOWN_SECS", "10"))
 USE_INDICATOR_CONFIRM = os.getenv("STRAT_USE_INDICATOR_CONFIRM", "true").lower() in ("1","true","yes")
+BATCH_MODE = os.getenv("STRAT_BATCH_MODE", "true").lower() in ("1","true","yes")
+ML_INTERVAL = os.getenv("STRAT_ML_INTERVAL", "5m")
+ML_BARS = int(os.getenv("STRAT_ML_BARS", "50"))
+ML_MIN_BARS = int(os.getenv("STRAT_ML_MIN_BARS", "20"))  # vol_norm: 20-bar volume mean
+
+
+def _tick_token(tick):
+    return int(tick.get("instrument_token") or tick.get("instrumentToken") or tick.get("instrument") or 0)
 
 
 class StrategyEngine:
@@ -50,9 +73,14 @@ class StrategyEngine:
         self._last_action_time = {}
         self._open_positions = {}
         self._last_signals = {}
+        self._model_row_cache = {}  # token -> ((last closed bar time, feature names), row)
+        # score a whole tick frame at once (see on_ticks_batch)
+        self.batch_mode = BATCH_MODE
         # frontend will set these dynamically
         self.trade_amount = float(os.getenv("STRAT_AUTO_AMOUNT", "1"))
         self.trade_duration = int(os.getenv("STRAT_AUTO_DURATION", "60"))
+        # wall clock for cooldowns / signal timestamps; tick replay swaps in simulated time
+        self.clock = datetime.utcnow
         log.info("StrategyEngine initialized (mode=%s)", self.mode)
 
     # ============ MODE CONTROL ============
@@ -74,168 +102,280 @@ class StrategyEngine:
 
     # ============ INTERNAL HELPERS ============
     def _can_place_auto(self, token: str):
-        now = datetime.utcnow()
+        now = self.clock()
         last = self._last_action_time.get(token)
         if last and (now - last).total_seconds() < COOLDOWN_SECS:
             return False
         return True
 
     def _record_auto_action(self, token: str):
-        self._last_action_time[token] = datetime.utcnow()
+        self._last_action_time[token] = self.clock()
 
-    def _compute_ml_prob(self, token: str, features: dict):
+    def _sentiment_for(self, symbol):
+        # served from the in-process cache (refreshed by news_fetch_job / sentiment_updates)
+        ticker_for_sent = symbol + ".NS" if symbol and not symbol.upper().endswith(".NS") else symbol
         try:
-            model = getattr(ml_model, "model", None)
-            if model is None and hasattr(ml_model, "predict_proba"):
-                return ml_model.predict_proba(features)
-
-            prepare = getattr(ml_model, "prepare_features", None)
-            X = prepare(features) if prepare else features
-
-            if hasattr(ml_model, "predict_proba"):
-                res = ml_model.predict_proba(X)
-                if isinstance(res, (list, tuple)):
-                    try:
-                        return float(res[0][1])
-                    except Exception:
-                        return float(res[1]) if len(res) == 2 else None
-                return float(res)
-            elif hasattr(ml_model, "predict"):
-                p = ml_model.predict(X)
-                return float(p[0]) if isinstance(p, (list, tuple)) else float(p)
+            return SentimentCache.instance().get(ticker_for_sent)
+        except Exception:
             return None
+
+    def _model_row(self, token, names):
+        """
+        Model input for one token: feature store definitions `names` over its closed
+        ML_INTERVAL bars, read at the newest closed bar (the bar a training label follows).
+        None until ML_MIN_BARS bars are closed or if a name has no store definition.
+        Cached until the next bar closes.
+        """
+        v = CandleEngine.instance().view(token, ML_INTERVAL, ML_BARS)
+        if v is None or len(v.time) < ML_MIN_BARS:
+            return None
+        key = (int(v.time[-1]), tuple(names))
+        cached = self._model_row_cache.get(token)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        bars = pd.DataFrame({"open": v.open.copy(), "high": v.high.copy(), "low": v.low.copy(),
+                             "close": v.close.copy(), "volume": v.volume.copy()})
+        row = None
+        try:
+            mapping, missing = feature_store.resolve(names, feature_store.REGISTRY)
+            if missing:
+                log.debug("No feature store definition for model features %s", missing)
+            else:
+                last = feature_store.compute(bars, sorted(set(mapping.values()))).iloc[-1]
+                row = {f: float(last[c]) for f, c in mapping.items()}
+        except Exception as e:
+            log.debug("Model features for %s failed: %s", token, e)
+        self._model_row_cache[token] = (key, row)
+        return row
+
+    def _ml_probs(self, tokens):
+        """
+        prob_up (or None) per token with one predict_proba call for all tokens that have a
+        model row; serial and batch mode both score through here.
+        """
+        out = [None] * len(tokens)
+        mdl = ml_model.ml_model
+        if mdl.active is None or not tokens:
+            return out
+        names = mdl.feature_names()
+        rows = [self._model_row(tok, names) for tok in tokens]
+        idx = [i for i, r in enumerate(rows) if r is not None]
+        if not idx:
+            return out
+        try:
+            probs = mdl.predict_proba_batch([rows[i] for i in idx])
         except Exception as e:
             log.debug("ML prob computation failed: %s", e)
-            return None
+            probs = None
+        if probs is not None:
+            for i, p in zip(idx, probs):
+                out[i] = float(p)
+        return out
 
     # ============ SIGNAL CREATION ============
+    def _build_signal(self, token, tick, indicators, sentiment_score, ml_prob):
+        symbol = tick.get("tradingsymbol") or tick.get("symbol")
+        ltp = tick.get("last_price") or tick.get("ltp") or tick.get("price")
+        vol = tick.get("volume") or tick.get("totalBuyQuantity")
+
+        # Combine indicators, sentiment, ML
+        score = 0.0
+        weights = {"ml": 0.6, "sent": 0.2, "ind": 0.2}
+        if ml_prob is not None:
+            score += weights["ml"] * (ml_prob if 0 <= ml_prob <= 1 else 0.5)
+        if sentiment_score is not None:
+            score += weights["sent"] * ((sentiment_score + 1) / 2.0)
+
+        ind_conf = 0.0
+        if indicators:
+            if indicators.get("ema_cross") == 1:
+                ind_conf = 1.0
+            rsi = indicators.get("rsi14") or indicators.get("rsi")
+            if rsi and float(rsi) < 35:
+                ind_conf = max(ind_conf, 0.6)
+        score += weights["ind"] * ind_conf
+
+        # ✅ Action logic:
+        # - If model predicts UP (ml_prob >= threshold), BUY
+        # - If model predicts DOWN (ml_prob < (1 - threshold)), SELL
+        # - Otherwise HOLD
+        action = "HOLD"
+        if ml_prob is not None:
+            if ml_prob >= PROB_THRESHOLD:
+                action = "BUY"
+            elif ml_prob <= (1 - PROB_THRESHOLD):
+                action = "SELL"
+
+        return {
+            "token": token,
+            "symbol": symbol,
+            "ts": self.clock().isoformat(),
+            "ltp": ltp,
+            "volume": vol,
+            "indicators": indicators,
+            "sentiment": sentiment_score,
+            "ml_prob": ml_prob,
+            "score": score,
+            "action": action
+        }
+
     def _compose_signal(self, tick: dict):
         try:
-            token = int(tick.get("instrument_token") or tick.get("instrumentToken") or tick.get("instrument") or 0)
+            token = _tick_token(tick)
             symbol = tick.get("tradingsymbol") or tick.get("symbol")
-            ltp = tick.get("last_price") or tick.get("ltp") or tick.get("price")
-            vol = tick.get("volume") or tick.get("totalBuyQuantity")
 
-            # Compute indicators
+            # Compute indicators (streaming state, updated by TickBuffer.push in on_ticks)
+            t0 = latency.now_ns()
             try:
-                indicators = compute_signals(token)
+                indicators = compute_signals_incremental(token)
             except Exception:
                 indicators = {}
+            latency.record_since("indicators", t0)
 
-            # Sentiment score
-            sentiment_score = None
-            ticker_for_sent = symbol + ".NS" if symbol and not symbol.upper().endswith(".NS") else symbol
-            try:
-                sentiment_entry = get_latest_sentiment(ticker_for_sent)
-                if sentiment_entry:
-                    sentiment_score = float(getattr(sentiment_entry, "score", 0.0))
-            except Exception:
-                sentiment_score = None
+            sentiment_score = self._sentiment_for(symbol)
 
             # ML prediction probability
-            ml_prob = self._compute_ml_prob(token, indicators or tick)
-
-            # Combine indicators, sentiment, ML
-            score = 0.0
-            weights = {"ml": 0.6, "sent": 0.2, "ind": 0.2}
-            if ml_prob is not None:
-                score += weights["ml"] * (ml_prob if 0 <= ml_prob <= 1 else 0.5)
-            if sentiment_score is not None:
-                score += weights["sent"] * ((sentiment_score + 1) / 2.0)
-
-            ind_conf = 0.0
-            if indicators:
-                if indicators.get("ema_cross") == 1:
-                    ind_conf = 1.0
-                rsi = indicators.get("rsi14") or indicators.get("rsi")
-                if rsi and float(rsi) < 35:
-                    ind_conf = max(ind_conf, 0.6)
-            score += weights["ind"] * ind_conf
-
-            # ✅ Action logic:
-            # - If model predicts UP (ml_prob >= threshold), BUY
-            # - If model predicts DOWN (ml_prob < (1 - threshold)), SELL
-            # - Otherwise HOLD
-            action = "HOLD"
-            if ml_prob is not None:
-                if ml_prob >= PROB_THRESHOLD:
-                    action = "BUY"
-                elif ml_prob <= (1 - PROB_THRESHOLD):
-                    action = "SELL"
-
-            signal = {
-                "token": token,
-                "symbol": symbol,
-                "ts": datetime.utcnow().isoformat(),
-                "ltp": ltp,
-                "volume": vol,
-                "indicators": indicators,
-                "sentiment": sentiment_score,
-                "ml_prob": ml_prob,
-                "score": score,
-                "action": action
-            }
-            return signal
+            t_ml = latency.now_ns()
+            ml_prob = self._ml_probs([token])[0]
+            latency.record_since("ml", t_ml)
+
+            return self._build_signal(token, tick, indicators, sentiment_score, ml_prob)
         except Exception as e:
             log.exception("compose_signal failed: %s", e)
             return None
 
+    # ============ SIGNAL HANDLING ============
+    def _handle_signal(self, sig):
+        token = sig["token"]
+        self._last_signals[token] = sig
+
+        # Register (OrderManager hands Redis/WS/DB fan-out to the background signal pipeline)
+        try:
+            OrderManager.instance().register_signal(token, sig)
+        except Exception:
+            pass
+
+        if self.mode == "manual":
+            # ✅ manual mode: only show signal, user decides buy/sell
+            return
+
+        # ✅ auto mode logic
+        if self.mode == "auto" and self._can_place_auto(token):
+            qty = int(self.trade_amount)
+            side = sig["action"]
+
+            if side not in ("BUY", "SELL"):
+                return
+
+            # prevent repeat trade if same side already open
+            existing = self._open_positions.get(token)
+            if existing and existing["side"] == side:
+                return
+
+            try:
+                res = OrderManager.instance().place_market_order(
+                    instrument_token=token,
+                    side=side,
+                    quantity=qty,
+                    exchange="NSE",
+                    tradingsymbol=sig["symbol"],
+                    product="MIS",
+                    order_type="MARKET"
+                )
+                self._record_auto_action(token)
+                log.info(f"AUTO {side} ORDER placed for {sig['symbol']} qty={qty}")
+                self._open_positions[token] = {"side": side, "qty": qty, "ts": self.clock()}
+                ws_broadcast.publish_signal_threadsafe({"type":"order","token":token,"order":res})
+            except Exception as e:
+                log.error(f"Auto order failed for {sig['symbol']}: {e}")
+
     # ============ MAIN ENTRY ============
     def on_ticks(self, ticks):
         if not ticks:
-            return
+            return []
+        if self.batch_mode:
+            return self.on_ticks_batch(ticks)
 
+        signals = []
+        tb = TickBuffer.instance()
         for t in ticks:
             try:
+                recv_ns = latency.tick_stamp(t)
+                latency.record_since("queue", recv_ns)
+                tb.push(t)
                 sig = self._compose_signal(t)
                 if not sig:
                     continue
-                token = sig["token"]
-                self._last_signals[token] = sig
-
-                # Register + broadcast to frontend
-                try:
-                    OrderManager.instance().register_signal(token, sig)
-                    ws_broadcast.publish_signal({"type": "signal", "token": token, "signal": sig})
-                except Exception:
-                    pass
-
-                if self.mode == "manual":
-                    # ✅ manual mode: only show signal, user decides buy/sell
-                    continue
-
-                # ✅ auto mode logic
-                if self.mode == "auto" and self._can_place_auto(token):
-                    qty = int(self.trade_amount)
-                    side = sig["action"]
-
-                    if side not in ("BUY", "SELL"):
-                        continue
-
-                    # prevent repeat trade if same side already open
-                    existing = self._open_positions.get(token)
-                    if existing and existing["side"] == side:
-                        continue
-
-                    try:
-                        res = OrderManager.instance().place_market_order(
-                            instrument_token=token,
-                            side=side,
-                            quantity=qty,
-                            exchange="NSE",
-                            tradingsymbol=sig["symbol"],
-                            product="MIS",
-                            order_type="MARKET"
-                        )
-                        self._record_auto_action(token)
-                        log.info(f"AUTO {side} ORDER placed for {sig['symbol']} qty={qty}")
-                        self._open_positions[token] = {"side": side, "qty": qty, "ts": datetime.utcnow()}
-                        ws_broadcast.publish_signal({"type":"order","token":token,"order":res})
-                    except Exception as e:
-                        log.error(f"Auto order failed for {sig['symbol']}: {e}")
-                        continue
+                t_reg = latency.now_ns()
+                self._handle_signal(sig)
+                t_end = latency.now_ns()
+                latency.record("register", t_end - t_reg)
+                latency.record_since("end_to_end", recv_ns, t_end)
+                signals.append(sig)
             except Exception:
                 log.exception("on_ticks handler error (continue)")
+        return signals
+
+    def on_ticks_batch(self, ticks):
+        """
+        Batch mode for a whole Kite frame:
+         - every tick updates the streaming indicators (TickBuffer.push)
+         - the frame is grouped by token; the latest tick per token is scored
+         - one feature matrix + one predict_proba call for all tokens in the frame (_ml_probs)
+         - sentiment looked up once per symbol per frame
+        Returns the list of signals emitted (one per token).
+        """
+        if not ticks:
+            return []
+
+        t_start = latency.now_ns()
+        recv_ns = latency.earliest_stamp(ticks)
+        latency.record_since("queue", recv_ns, t_start)
+
+        tb = TickBuffer.instance()
+        latest = {}  # token -> last tick in frame (insertion order = first appearance)
+        for t in ticks:
+            try:
+                tb.push(t)
+                latest[_tick_token(t)] = t
+            except Exception:
+                log.exception("on_ticks_batch: bad tick (continue)")
+
+        tokens = list(latest.keys())
+        indicators = []
+        for token in tokens:
+            try:
+                indicators.append(compute_signals_incremental(token))
+            except Exception:
+                indicators.append({})
+        t_ind = latency.now_ns()
+        latency.record("indicators", t_ind - t_start)
+
+        probs = self._ml_probs(tokens)
+        latency.record_since("ml", t_ind)
+
+        sentiments = {}
+        signals = []
+        for token, ind, ml_prob in zip(tokens, indicators, probs):
+            tick = latest[token]
+            try:
+                symbol = tick.get("tradingsymbol") or tick.get("symbol")
+                if symbol not in sentiments:
+                    sentiments[symbol] = self._sentiment_for(symbol)
+                signals.append(self._build_signal(token, tick, ind, sentiments[symbol], ml_prob))
+            except Exception:
+                log.exception("on_ticks_batch: compose failed for %s (continue)", token)
+
+        t_reg = latency.now_ns()
+        for sig in signals:
+            try:
+                self._handle_signal(sig)
+            except Exception:
+                log.exception("on_ticks_batch handler error (continue)")
+        t_end = latency.now_ns()
+        latency.record("register", t_end - t_reg)
+        latency.record_since("end_to_end", recv_ns, t_end)
+        return signals
 
     def get_last_signals(self):
         return self._last_signals
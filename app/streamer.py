@@ -9,16 +9,25 @@ Notes:
 - Call set_event_loop(asyncio.get_event_loop()) from FastAPI startup BEFORE starting the kite websocket.
 - Use start_websocket(api_key, access_token) to initialize connection.
 - Use stop_websocket() on shutdown (main should await the shutdown coroutine if needed).
-- This module keeps thread-safe structures and schedules sends on FastAPI loop via run_coroutine_threadsafe.
+- This module keeps thread-safe structures; frontend fan-out is done by BroadcastHub on the FastAPI loop
+  (one thread-safe handoff per tick frame, per-client send queues).
+- New frontend clients get a snapshot (full candle history); tick messages only carry the current candle.
+- Clients may narrow what they receive with {"op":"subscribe","tokens":[...],"channels":[...]}
+  (see broadcast_hub); Kite subscriptions follow that demand.
 """
 
-import json
 import logging
 import time
 import asyncio
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 from threading import Lock
 
+from . import latency
+from .broadcast_hub import BroadcastHub
+from .candle_engine import CandleEngine
+from .tick_store import TickRecorder
+from .wire import DEFAULT_FORMAT, WireFrame
+
 # kiteconnect import (external dependency)
 try:
     from kiteconnect import KiteTicker  # type: ignore
@@ -43,22 +52,22 @@ _connected = False
 
 # thread-safe shared state
 _subscribed_tokens: List[int] = []
+_pinned_tokens: Set[int] = set()  # subscribed outside client demand (REST); kept when clients leave
 _lock = Lock()
 _latest_ticks: Dict[int, Dict[str, Any]] = {}  # token -> latest tick dict
 
-# candle buffers per token
-_candle_buffers: Dict[int, List[Dict[str, Any]]] = {}
-# current building candle per token
-_current_candle: Dict[int, Dict[str, Any]] = {}
+# candles per token / interval live in CandleEngine (NumPy rings, 1m + rolled-up timeframes)
+
+# every accepted tick is also appended to the on-disk tick store (batched, flushed off-thread)
+_recorder = TickRecorder.instance()
 
 # frontend WebSocket clients (these are starlette fastapi WebSocket objects;
-# we schedule send_text on the FastAPI loop using run_coroutine_threadsafe)
+# the actual sends are done by BroadcastHub on the FastAPI loop)
 frontend_clients: List["WebSocket"] = []
 frontend_lock = Lock()
 
-# candle aggregation params (seconds)
+# candle aggregation params (seconds): base bars pushed to clients; higher timeframes via CandleEngine
 CANDLE_INTERVAL_SECONDS = 60  # 1-minute buckets by default
-CANDLE_HISTORY_LENGTH = 240  # keep last N candles per token
 
 # reference to FastAPI event loop for scheduling coroutine calls from Kite thread
 _app_event_loop: Optional["asyncio.AbstractEventLoop"] = None
@@ -75,6 +84,7 @@ def set_event_loop(loop: "asyncio.AbstractEventLoop"):
     """
     global _app_event_loop
     _app_event_loop = loop
+    BroadcastHub.instance().set_loop(loop)
     logger.info("Streamer: event loop set for thread->async scheduling")
 
 async def _async_remove_frontend(ws: "WebSocket"):
@@ -89,73 +99,41 @@ def is_connected() -> bool:
 # -------------------------
 # Internal send helpers
 # -------------------------
-def _on_send_done(fut, ws):
+def _publish_frames(payloads: List[tuple], recv_ns: Optional[int] = None):
     """
-    Callback for completed run_coroutine_threadsafe futures.
-    If exception found, remove client.
+    payloads: (token, channel, payload dict). Encode each payload once per wire format in use
+    and hand the whole batch to BroadcastHub in one thread-safe call. Safe to call from KiteTicker thread.
     """
-    try:
-        fut.result()
-    except Exception as e:
-        # Could be WebSocketDisconnect or connection reset; remove client
-        try:
-            logger.debug("Send to client failed; removing client. err=%s", e)
-            remove_frontend_client(ws)
-        except Exception:
-            logger.exception("Failed to remove failing client")
-
-def _schedule_send_text(ws: "WebSocket", text: str):
-    """
-    Schedule ws.send_text on the provided FastAPI event loop.
-    Called from non-async threads (KiteTicker callbacks).
-    Uses run_coroutine_threadsafe and attaches a done callback.
-    """
-    global _app_event_loop
-    if not _app_event_loop:
-        # fallback: try best-effort non-loop scheduling (rare)
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop.create_task(ws.send_text(text))
-                return
-        except Exception:
-            pass
-        logger.debug("No event loop set; skipping send")
+    if not payloads:
         return
+    with frontend_lock:
+        if not frontend_clients:
+            logger.debug("No frontend clients to broadcast payload.")
+            return
+    hub = BroadcastHub.instance()
+    formats = hub.formats_in_use()
+    frames = [(token, channel, WireFrame(p).prepare(formats)) for token, channel, p in payloads]
+    hub.publish_threadsafe(frames, recv_ns)
 
-    try:
-        fut = asyncio.run_coroutine_threadsafe(ws.send_text(text), _app_event_loop)
-        fut.add_done_callback(lambda f: _on_send_done(f, ws))
-    except Exception as e:
-        logger.exception("run_coroutine_threadsafe failed when scheduling ws.send_text: %s", e)
-        # best-effort removal if scheduling failed
-        try:
-            remove_frontend_client(ws)
-        except Exception:
-            pass
-
-def _safe_send_to_frontends(payload: Dict[str, Any]):
+def _safe_send_to_frontends(payload: Dict[str, Any], recv_ns: Optional[int] = None, channel: Optional[str] = "tick"):
     """
-    Broadcast JSON payload to all connected frontend WebSocket clients.
-    Safe to call from KiteTicker thread. Uses scheduling helper to send on proper loop.
+    Broadcast JSON payload to frontend WebSocket clients subscribed to payload["token"].
+    recv_ns: monotonic receive stamp of the originating tick (latency instrumentation).
     """
-    text = json.dumps(payload, default=str)
-    with frontend_lock:
-        clients = list(frontend_clients)
-    if not clients:
-        logger.debug("No frontend clients to broadcast payload.")
-        return
-
-    logger.debug("Broadcasting payload to %d clients: token=%s time=%s", len(clients), payload.get("token"), payload.get("tick", {}).get("timestamp"))
-    for ws in clients:
-        try:
-            _schedule_send_text(ws, text)
-        except Exception as e:
-            logger.warning("Failed to schedule send to a client: %s", e)
-            try:
-                remove_frontend_client(ws)
-            except Exception:
-                pass
+    _publish_frames([(payload.get("token"), channel, payload)], recv_ns)
+
+def _snapshot_payload(tokens: Optional[List[int]] = None, limit: int = 100) -> Dict[str, Any]:
+    """Full candle history (+ building candle) per token; sent once to new clients."""
+    engine = CandleEngine.instance()
+    keys = list(tokens) if tokens is not None else engine.tokens()
+    candles = {}
+    current = {}
+    for token in keys:
+        candles[token] = engine.history(token, CANDLE_INTERVAL_SECONDS, limit, include_current=False)
+        cur = engine.current(token, CANDLE_INTERVAL_SECONDS)
+        if cur:
+            current[token] = cur
+    return {"type": "snapshot", "ok": True, "candles": candles, "current": current}
 
 # -------------------------
 # Candle helpers
@@ -163,34 +141,16 @@ def _safe_send_to_frontends(payload: Dict[str, Any]):
 def _bucket_for_timestamp(ts: int) -> int:
     return ts - (ts % CANDLE_INTERVAL_SECONDS)
 
-def _ingest_tick_into_candle(token: int, price: float, ts_seconds: int):
-    bucket = _bucket_for_timestamp(ts_seconds)
-    current = _current_candle.get(token)
-    if current is None or current.get("bucket") != bucket:
-        # finalize previous candle
-        if current:
-            buf = _candle_buffers.setdefault(token, [])
-            c = {
-                "time": int(current["bucket"]),
-                "open": float(current["open"]),
-                "high": float(current["high"]),
-                "low": float(current["low"]),
-                "close": float(current["close"]),
-                "volume": float(current.get("volume", 0)),
-            }
-            buf.append(c)
-            if len(buf) > CANDLE_HISTORY_LENGTH:
-                del buf[0 : len(buf) - CANDLE_HISTORY_LENGTH]
-            logger.debug("Finalized candle for token %s at bucket %s (history len=%d)", token, current["bucket"], len(buf))
-        _current_candle[token] = {"bucket": bucket, "open": price, "high": price, "low": price, "close": price, "volume": 0}
-        logger.debug("Started new candle for token %s bucket=%s open=%s", token, bucket, price)
-        return _current_candle[token]
-    else:
-        cur = current
-        cur["high"] = max(cur["high"], price)
-        cur["low"] = min(cur["low"], price)
-        cur["close"] = price
-        return cur
+def _ingest_tick_into_candle(token: int, price: float, ts_seconds: int, cum_volume: Optional[float] = None):
+    """
+    Fold a tick into CandleEngine (1m bar + rolled-up timeframes).
+    cum_volume: Kite cumulative day volume (volume_traded); bar volume is its tick-to-tick delta.
+    Returns (building 1m candle, 1m candle finalized by this tick or None).
+    """
+    current, closed = CandleEngine.instance().on_tick(token, price, ts_seconds, cum_volume)
+    if closed:
+        logger.debug("Finalized candle for token %s at %s", token, closed["time"])
+    return current, closed
 
 # -------------------------
 # Tick processing callback (KiteTicker)
@@ -217,15 +177,24 @@ def on_tick(ws, ticks: List[Dict[str, Any]]):
     """
     Called by KiteTicker when ticks arrive.
     Robust parsing of token, price, timestamp.
+    Each raw tick is stamped with latency.TICK_STAMP_KEY (monotonic ns) so downstream stages
+    (StrategyEngine, frontend sends) can report tick-to-signal latency.
     """
+    recv_ns = latency.now_ns()
+    wall_ns = time.time_ns()
     try:
         if not ticks:
             logger.debug("on_tick called with empty ticks list.")
             return
 
+        payloads: List[Dict[str, Any]] = []
         for raw in ticks:
             try:
                 logger.debug("RAW_TICK: %s", raw)
+                try:
+                    raw[latency.TICK_STAMP_KEY] = recv_ns
+                except Exception:
+                    pass
 
                 # token detection
                 token = None
@@ -274,29 +243,37 @@ def on_tick(ws, ticks: List[Dict[str, Any]]):
                     logger.debug("Ignored tick (missing token or price). token=%s price=%s keys=%s", token, price, list(raw.keys()))
                     continue
 
+                cum_volume = raw.get("volume_traded", raw.get("volume"))
+
                 with _lock:
                     _latest_ticks[token] = {"instrument_token": token, "last_price": price, "timestamp": ts, "raw": raw}
-                    current = _ingest_tick_into_candle(token, price, ts)
-                    payload = {
-                        "ok": True,
+                    current, closed = _ingest_tick_into_candle(token, price, ts, cum_volume)
+                # sub-second precision from the receive clock when the tick is from this second
+                _recorder.record(token, wall_ns if wall_ns // 1_000_000_000 == ts else ts * 1_000_000_000,
+                                 price, raw.get("last_traded_quantity", raw.get("last_quantity")),
+                                 cum_volume, raw.get("oi"))
+                if closed:
+                    payloads.append((token, "candle", {
+                        "type": "candle",
                         "token": token,
-                        "tick": {"instrument_token": token, "price": price, "timestamp": ts},
-                        "candle": {
-                            "time": int(current["bucket"]),
-                            "open": float(current["open"]),
-                            "high": float(current["high"]),
-                            "low": float(current["low"]),
-                            "close": float(current["close"]),
-                            "volume": float(current.get("volume", 0)),
-                        },
-                        "candles": _candle_buffers.get(token, [])[-100:],
-                    }
-
-                _safe_send_to_frontends(payload)
+                        "interval": CANDLE_INTERVAL_SECONDS,
+                        "candle": closed,
+                    }))
+                # delta only: history goes out in the snapshot on connect / subscribe
+                payloads.append((token, "tick", {
+                    "ok": True,
+                    "token": token,
+                    "tick": {"instrument_token": token, "price": price, "timestamp": ts},
+                    "candle": current,
+                }))
             except Exception:
                 logger.exception("Error processing raw tick element")
+
+        _publish_frames(payloads, recv_ns)
     except Exception:
         logger.exception("Exception in on_tick")
+    finally:
+        latency.record_since("streamer", recv_ns)
 
 # -------------------------
 # Kite websocket control (idempotent + safe)
@@ -383,14 +360,21 @@ def stop_websocket():
 # -------------------------
 # Subscription helpers
 # -------------------------
-def subscribe(tokens: List[int]):
+def subscribe(tokens: List[int], pin: bool = True):
+    """
+    Add tokens to the Kite subscription. pin=True (REST / scripts) keeps them subscribed when
+    frontend demand for them goes away; BroadcastHub's TokenDemand subscribes with pin=False.
+    """
     global _subscribed_tokens
     if not tokens:
         return
     with _lock:
         try:
-            new_set = set(_subscribed_tokens or []) | set(int(t) for t in tokens)
+            wanted = set(int(t) for t in tokens)
+            new_set = set(_subscribed_tokens or []) | wanted
             _subscribed_tokens = sorted(list(new_set))
+            if pin:
+                _pinned_tokens.update(wanted)
             logger.info("subscribe(): requested tokens -> %s", tokens)
         except Exception:
             logger.exception("subscribe(): token normalization failed")
@@ -407,31 +391,33 @@ def subscribe(tokens: List[int]):
             logger.exception("Failed to subscribe tokens on kite_ticker")
 
 def unsubscribe(tokens: List[int]):
+    """Remove tokens from the Kite subscription (and unpin them)."""
     global _subscribed_tokens
     if not tokens:
         return
     with _lock:
         try:
-            remaining = set(_subscribed_tokens or []) - set(int(t) for t in tokens)
-            _subscribed_tokens = sorted(list(remaining))
+            gone = set(int(t) for t in tokens)
+            removed = sorted(set(_subscribed_tokens or []) & gone)
+            _subscribed_tokens = sorted(set(_subscribed_tokens or []) - gone)
+            _pinned_tokens.difference_update(gone)
             logger.info("unsubscribe(): tokens requested -> %s; remaining -> %s", tokens, _subscribed_tokens)
         except Exception:
             logger.exception("unsubscribe(): token normalization failed")
             return
 
         try:
-            if kite_ticker and _connected:
-                if _subscribed_tokens:
-                    kite_ticker.subscribe(_subscribed_tokens)
-                    kite_ticker.set_mode(kite_ticker.MODE_FULL, _subscribed_tokens)
-                else:
-                    try:
-                        kite_ticker.unsubscribe(tokens)
-                    except Exception:
-                        logger.debug("kite_ticker.unsubscribe failed when clearing all (non-fatal)")
-                logger.info("Updated subscriptions on kite: %s", _subscribed_tokens)
+            if removed and kite_ticker and _connected:
+                # Kite keeps streaming a token until it is unsubscribed explicitly
+                kite_ticker.unsubscribe(removed)
+                logger.info("Unsubscribed on kite: %s; remaining: %s", removed, _subscribed_tokens)
         except Exception:
-            logger.exception("Failed to update subscription on kite_ticker")
+            logger.exception("Failed to unsubscribe tokens on kite_ticker")
+
+def pinned_tokens() -> Set[int]:
+    """Tokens subscribed outside frontend demand (subscribe(pin=True))."""
+    with _lock:
+        return set(_pinned_tokens)
 
 # -------------------------
 # Query helpers
@@ -440,18 +426,19 @@ def get_latest_ticks() -> List[Dict[str, Any]]:
     with _lock:
         return [dict(v) for v in _latest_ticks.values()]
 
-def get_candle_history(token: int, limit: int = 100) -> List[Dict[str, Any]]:
-    with _lock:
-        buf = _candle_buffers.get(token, [])[-limit:]
-        return [dict(c) for c in buf]
+def get_candle_history(token: int, limit: int = 100, interval=CANDLE_INTERVAL_SECONDS) -> List[Dict[str, Any]]:
+    """Finalized candles (oldest first) for any CandleEngine interval, e.g. 60, "5m", "15minute"."""
+    return CandleEngine.instance().history(token, interval, limit, include_current=False)
 
 # -------------------------
 # Frontend client management
 # -------------------------
-def add_frontend_client(ws: "WebSocket"):
+def add_frontend_client(ws: "WebSocket", fmt: str = DEFAULT_FORMAT):
     """
     Register a FastAPI WebSocket to receive broadcast messages.
     Caller must call await ws.accept() before registering.
+    The client is sent a candle snapshot first, then per-tick deltas.
+    fmt: wire format negotiated for this socket (wire.negotiate(ws.query_params)).
     """
     with frontend_lock:
         if ws not in frontend_clients:
@@ -459,6 +446,10 @@ def add_frontend_client(ws: "WebSocket"):
             logger.info("Frontend client added (count=%d)", len(frontend_clients))
         else:
             logger.debug("add_frontend_client: ws already registered (no-op)")
+            return
+    hub = BroadcastHub.instance()
+    hub.set_snapshot_provider(_snapshot_payload)
+    hub.add_client(ws, _snapshot_payload(), on_disconnect=remove_frontend_client, fmt=fmt)
 
 def remove_frontend_client(ws: "WebSocket"):
     with frontend_lock:
@@ -468,5 +459,13 @@ def remove_frontend_client(ws: "WebSocket"):
                 logger.info("Frontend client removed (count=%d)", len(frontend_clients))
         except Exception:
             logger.exception("remove_frontend_client failed")
+    BroadcastHub.instance().remove_client(ws)
+
+def handle_frontend_message(ws: "WebSocket", text: str) -> bool:
+    """
+    Apply a client control message ({"op": "subscribe"|"unsubscribe"|"snapshot", ...}).
+    Must be called on the FastAPI loop (i.e. from the websocket endpoint).
+    """
+    return BroadcastHub.instance().handle_message(ws, text)
 
 # END of file
@@ -0,0 +1,279 @@
+# app/tick_store.py
+"""
+Append-only tick capture (full-fidelity history without per-tick DB inserts).
+
+Layout under TICK_STORE_DIR:
+  <YYYY-MM-DD>/<token>/seg-000001.bin   fixed-width little-endian records (TICK_DTYPE, 40 bytes)
+  <YYYY-MM-DD>/index.json               {token: [{"file", "start_ns", "end_ns", "count"}, ...]}
+
+- TickRecorder.record() only appends a tuple to an in-memory batch (called from streamer.on_tick)
+- a background thread flushes every TICK_STORE_FLUSH_SEC: one write per (day, token) segment,
+  then the day's index is rewritten atomically (tmp file + os.replace)
+- segments roll over after TICK_STORE_SEGMENT_RECORDS records; files are never rewritten
+- read_ticks(token, start, end) picks the segments whose [start_ns, end_ns] overlaps the window
+  from the index and memory-maps only those (np.memmap), then masks to the window;
+  iter_ticks() does the same one segment at a time for bounded-memory consumers
+
+Config via .env:
+  TICK_STORE_ENABLED (default true), TICK_STORE_DIR (default app/storage/ticks),
+  TICK_STORE_FLUSH_SEC (default 5), TICK_STORE_SEGMENT_RECORDS (default 1000000)
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+STORE_ENABLED = os.getenv("TICK_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+STORE_DIR = os.getenv("TICK_STORE_DIR", "app/storage/ticks")
+FLUSH_SEC = float(os.getenv("TICK_STORE_FLUSH_SEC", "5"))
+SEGMENT_RECORDS = int(os.getenv("TICK_STORE_SEGMENT_RECORDS", "1000000"))
+
+# ts: exchange/tick time (epoch ns, UTC); volume: cumulative day volume (volume_traded)
+TICK_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("price", "<f8"),
+    ("qty", "<f8"),
+    ("volume", "<f8"),
+    ("oi", "<f8"),
+])
+
+_NS = 1_000_000_000
+
+
+def _day_of(ts_ns: int) -> str:
+    return datetime.fromtimestamp(ts_ns / _NS, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def to_ns(value) -> Optional[int]:
+    """datetime (naive = local time, like datetime.timestamp) / epoch s / ms / ns -> epoch ns."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp() * _NS)
+    v = int(value)
+    if v > 10 ** 17:
+        return v
+    if v > 10 ** 12:
+        return v * 1_000_000
+    return v * _NS
+
+
+def _index_path(root: str, day: str) -> str:
+    return os.path.join(root, day, "index.json")
+
+
+def _load_index(root: str, day: str) -> Dict[str, List[Dict]]:
+    try:
+        with open(_index_path(root, day), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        log.exception("tick_store: unreadable index for %s", day)
+        return {}
+
+
+def _write_index(root: str, day: str, index: Dict[str, List[Dict]]):
+    path = _index_path(root, day)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+
+class TickRecorder:
+    """Batches ticks in memory and appends them to per-day, per-token segment files."""
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, root: str = STORE_DIR, flush_sec: float = FLUSH_SEC,
+                 segment_records: int = SEGMENT_RECORDS, enabled: bool = STORE_ENABLED):
+        self.root = root
+        self.flush_sec = max(float(flush_sec), 0.1)
+        self.segment_records = max(int(segment_records), 1)
+        self.enabled = enabled
+        self.lock = threading.Lock()        # guards _pending
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._pending: List[Tuple] = []
+        self._indexes: Dict[str, Dict[str, List[Dict]]] = {}  # day -> index (cached)
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats = {"flushed": 0, "flushes": 0, "errors": 0, "last_flush_ms": 0.0}
+
+    # ---------------------------
+    # Producer (Kite thread)
+    # ---------------------------
+    def record(self, token, ts_ns: int, price: float, qty=None, volume=None, oi=None):
+        if not self.enabled:
+            return
+        with self.lock:
+            self._pending.append((str(token), int(ts_ns), float(price),
+                                  float(qty) if qty is not None else np.nan,
+                                  float(volume) if volume is not None else np.nan,
+                                  float(oi) if oi is not None else np.nan))
+        if self._thread is None:
+            self.start()
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+    def start(self):
+        with self._flush_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="tick-recorder", daemon=True)
+            self._thread.start()
+        log.info("TickRecorder started (dir=%s, flush=%.1fs)", self.root, self.flush_sec)
+
+    def stop(self):
+        self._stop.set()
+        t = self._thread
+        if t is not None:
+            t.join(timeout=10)
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_sec):
+            try:
+                self.flush()
+            except Exception:
+                self._stats["errors"] += 1
+                log.exception("TickRecorder flush failed")
+
+    # ---------------------------
+    # Flush
+    # ---------------------------
+    def flush(self) -> int:
+        with self.lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        t0 = time.perf_counter()
+        with self._flush_lock:
+            groups: Dict[Tuple[str, str], List[Tuple]] = {}
+            for rec in batch:
+                groups.setdefault((_day_of(rec[1]), rec[0]), []).append(rec[1:])
+            touched = set()
+            for (day, token), rows in groups.items():
+                arr = np.array(rows, dtype=[(n, TICK_DTYPE.fields[n][0]) for n in TICK_DTYPE.names])
+                self._append(day, token, arr)
+                touched.add(day)
+            for day in touched:
+                _write_index(self.root, day, self._indexes[day])
+        self._stats["flushed"] += len(batch)
+        self._stats["flushes"] += 1
+        self._stats["last_flush_ms"] = (time.perf_counter() - t0) * 1000.0
+        return len(batch)
+
+    def _append(self, day: str, token: str, arr: np.ndarray):
+        index = self._indexes.get(day)
+        if index is None:
+            index = self._indexes[day] = _load_index(self.root, day)
+        segs = index.setdefault(token, [])
+        tok_dir = os.path.join(self.root, day, token)
+        os.makedirs(tok_dir, exist_ok=True)
+
+        pos = 0
+        while pos < len(arr):
+            seg = segs[-1] if segs else None
+            if seg is None or seg["count"] >= self.segment_records:
+                seq = len(segs) + 1
+                seg = {"file": f"{token}/seg-{seq:06d}.bin", "start_ns": None, "end_ns": None, "count": 0}
+                segs.append(seg)
+            take = min(self.segment_records - seg["count"], len(arr) - pos)
+            chunk = arr[pos:pos + take]
+            path = os.path.join(self.root, day, seg["file"])
+            # bytes past the indexed count are from a flush that died before its index write
+            size = seg["count"] * TICK_DTYPE.itemsize
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+            with open(path, "ab") as f:
+                f.write(chunk.tobytes())
+            lo, hi = int(chunk["ts"].min()), int(chunk["ts"].max())
+            seg["start_ns"] = lo if seg["start_ns"] is None else min(seg["start_ns"], lo)
+            seg["end_ns"] = hi if seg["end_ns"] is None else max(seg["end_ns"], hi)
+            seg["count"] += take
+            pos += take
+
+    def stats(self):
+        out = dict(self._stats)
+        with self.lock:
+            out["pending"] = len(self._pending)
+        out["enabled"] = self.enabled
+        out["dir"] = self.root
+        return out
+
+
+# ---------------------------
+# Reads
+# ---------------------------
+def segments_for(token, start_ns: int, end_ns: int, root: str = STORE_DIR) -> List[Tuple[str, int]]:
+    """(path, record count) of segments overlapping [start_ns, end_ns], oldest first."""
+    out = []
+    day = datetime.fromtimestamp(start_ns / _NS, tz=timezone.utc).date()
+    last = datetime.fromtimestamp(end_ns / _NS, tz=timezone.utc).date()
+    key = str(token)
+    while day <= last:
+        d = day.strftime("%Y-%m-%d")
+        for seg in _load_index(root, d).get(key, []):
+            if seg["count"] and seg["start_ns"] <= end_ns and seg["end_ns"] >= start_ns:
+                out.append((os.path.join(root, d, seg["file"]), int(seg["count"])))
+        day += timedelta(days=1)
+    return out
+
+
+def iter_ticks(token, start, end, root: str = STORE_DIR, chunk_rows: Optional[int] = None):
+    """
+    Recorded ticks for token in [start, end] as TICK_DTYPE arrays, one segment at a time
+    (optionally split into chunk_rows pieces), so a long window never sits in memory at once.
+    """
+    start_ns, end_ns = to_ns(start), to_ns(end)
+    for path, count in segments_for(token, start_ns, end_ns, root):
+        try:
+            mm = np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(count,))
+        except Exception:
+            log.warning("tick_store: cannot map %s", path)
+            continue
+        ts = mm["ts"]
+        part = np.asarray(mm[(ts >= start_ns) & (ts <= end_ns)])
+        del mm
+        if len(part) > 1 and np.any(np.diff(part["ts"]) < 0):
+            part = part[np.argsort(part["ts"], kind="stable")]
+        if not chunk_rows:
+            yield part
+            continue
+        for i in range(0, len(part), chunk_rows):
+            yield part[i:i + chunk_rows]
+
+
+def read_ticks(token, start, end, root: str = STORE_DIR) -> np.ndarray:
+    """
+    Recorded ticks for token in [start, end] as a TICK_DTYPE array sorted by ts.
+    Only segments overlapping the window are memory-mapped.
+    """
+    parts = list(iter_ticks(token, start, end, root))
+    if not parts:
+        return np.empty(0, dtype=TICK_DTYPE)
+    out = np.concatenate(parts)
+    if len(out) > 1 and np.any(np.diff(out["ts"]) < 0):
+        out = out[np.argsort(out["ts"], kind="stable")]
+    return out
+
+
+def has_ticks(token, start, end, root: str = STORE_DIR) -> bool:
+    return bool(segments_for(token, to_ns(start), to_ns(end), root))
@@ -0,0 +1,114 @@
+# app/wire.py
+"""
+Wire formats for frontend WebSocket streams, negotiated per connection with ?format=...
+
+  json    (default) text frames, same payloads as before
+  struct  binary frames for tick / closed-candle messages, one fixed-layout little-endian
+          record each (other messages - snapshots, signals, orders - stay JSON text):
+            uint8  kind         1 = tick (live tick + building candle), 2 = closed candle
+            int32  token
+            int64  ts           tick timestamp, epoch seconds (candle time for kind 2)
+            int64  candle_time  candle bucket start, epoch seconds
+            float64 price       last price (close for kind 2)
+            float64 open, high, low, close, volume
+          = 69 bytes per record (vs ~200 bytes of JSON); parse with a DataView in the browser
+  msgpack binary msgpack of the same payloads as json (needs the optional `msgpack` package;
+          falls back to json when it is not installed)
+
+WireFrame wraps one payload and encodes it at most once per format; every client using that
+format shares the same bytes.
+"""
+
+import json
+import struct
+import logging
+from typing import Any, Dict, Iterable, Optional, Union
+
+log = logging.getLogger(__name__)
+
+try:
+    import msgpack  # type: ignore
+except Exception:
+    msgpack = None
+
+FORMATS = ("json", "struct", "msgpack")
+DEFAULT_FORMAT = "json"
+
+KIND_TICK = 1
+KIND_CANDLE = 2
+RECORD = struct.Struct("<Biqqdddddd")
+
+
+def negotiate(query_params) -> str:
+    """Pick the wire format from ?format= (alias ?wire=); unknown / unavailable -> json."""
+    try:
+        fmt = (query_params.get("format") or query_params.get("wire") or DEFAULT_FORMAT).lower()
+    except Exception:
+        return DEFAULT_FORMAT
+    if fmt not in FORMATS:
+        return DEFAULT_FORMAT
+    if fmt == "msgpack" and msgpack is None:
+        log.warning("msgpack wire format requested but msgpack is not installed; using json")
+        return DEFAULT_FORMAT
+    return fmt
+
+
+def _f(v) -> float:
+    try:
+        return float(v)
+    except Exception:
+        return 0.0
+
+
+def pack_record(payload: Dict[str, Any]) -> Optional[bytes]:
+    """Fixed-layout record for a streamer tick / candle payload; None for anything else."""
+    try:
+        token = int(payload.get("token"))
+        candle = payload.get("candle") or {}
+        ctime = int(candle.get("time") or 0)
+        tick = payload.get("tick")
+        if tick is not None:
+            kind = KIND_TICK
+            ts = int(tick.get("timestamp") or 0)
+            price = _f(tick.get("price"))
+        elif payload.get("type") == "candle":
+            kind = KIND_CANDLE
+            ts = ctime
+            price = _f(candle.get("close"))
+        else:
+            return None
+        return RECORD.pack(kind, token, ts, ctime, price, _f(candle.get("open")), _f(candle.get("high")),
+                           _f(candle.get("low")), _f(candle.get("close")), _f(candle.get("volume")))
+    except Exception:
+        return None
+
+
+class WireFrame:
+    """One outgoing message, lazily encoded once per wire format."""
+    __slots__ = ("payload", "_encoded")
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def encode(self, fmt: str = DEFAULT_FORMAT) -> Union[str, bytes]:
+        data = self._encoded.get(fmt)
+        if data is not None:
+            return data
+        payload = self.payload
+        if fmt == "struct":
+            data = pack_record(payload)
+            if data is None:
+                data = self.encode("json")
+        elif fmt == "msgpack" and msgpack is not None:
+            data = msgpack.packb(payload, default=str, use_bin_type=True)
+        else:
+            data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str)
+        self._encoded[fmt] = data
+        return data
+
+    def prepare(self, formats: Iterable[str]) -> "WireFrame":
+        """Encode up front for the given formats (called on the producer thread)."""
+        for fmt in formats:
+            self.encode(fmt)
+        return self
@@ -1,18 +1,42 @@
 
 # app/ws_broadcast.py
+"""
+Signal/order broadcast to frontend sockets (ws_handler).
+
+Clients may send {"op":"subscribe","tokens":[...],"channels":["signal"]} (same protocol as the
+streamer hub) to receive signals only for those tokens; messages without a token (orders,
+wallet updates) go to every client.
+
+Delivery goes through a BroadcastHub (see broadcast_hub): each payload is serialized once and
+put on per-client outboxes with their own sender task, so a slow socket no longer blocks the
+engine. Signals are conflated per token for lagging clients; orders and other events keep
+their order. Clients that fall too far behind are disconnected.
+?format=msgpack on the socket URL switches to binary msgpack frames (see wire.py).
+"""
 import asyncio
 import logging
-from typing import Any, Dict, Set
+from typing import Any, Dict, Optional
 from fastapi import WebSocket, WebSocketDisconnect
 
+from . import latency
+from .broadcast_hub import BroadcastHub, norm_token
+from .wire import WireFrame, negotiate
+
 log = logging.getLogger("app.ws_broadcast")
 
-_active_ws: Set[WebSocket] = set()
-_lock = asyncio.Lock()
+# per-client outboxes / subscriptions (loop thread only)
+_hub = BroadcastHub(latency_stage="ws_send", name="signals")
 
-# Queue for outgoing messages
+# Intake queue from publishers: (payload, enqueued monotonic ns); drained without awaiting sends
 _message_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
 
+# loop running the broadcast engine (set in start_ws_broadcast_loop) for thread-safe publishing
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def hub_stats() -> Dict[str, Any]:
+    return _hub.stats()
+
 
 # --------------------------------------------------------
 # 1) CLIENT HANDLER
@@ -20,25 +44,34 @@ _message_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
 async def ws_handler(websocket: WebSocket):
     await websocket.accept()
 
-    async with _lock:
-        _active_ws.add(websocket)
+    _hub.attach(websocket, fmt=negotiate(websocket.query_params))
 
-    log.info(f"✅ Frontend WebSocket connected (total={len(_active_ws)})")
+    log.info(f"✅ Frontend WebSocket connected (total={_hub.client_count()})")
 
     try:
         while True:
             try:
-                await websocket.receive_text()
+                text = await websocket.receive_text()
             except WebSocketDisconnect:
                 break
             except Exception:
+                if not _hub.is_connected(websocket):
+                    break  # dropped as a slow consumer
                 await asyncio.sleep(0.1)
+                continue
+            _hub.handle_message(websocket, text)
 
     finally:
-        async with _lock:
-            _active_ws.discard(websocket)
+        _hub.detach(websocket)
+
+        log.info(f"❌ WebSocket disconnected (total={_hub.client_count()})")
 
-        log.info(f"❌ WebSocket disconnected (total={len(_active_ws)})")
+
+def _frame(payload: Dict[str, Any]):
+    token = payload.get("token")
+    token = norm_token(token) if token is not None else None
+    channel = "signal" if payload.get("type") == "signal" else None
+    return token, channel, WireFrame(payload).prepare(_hub.formats_in_use())
 
 
 # --------------------------------------------------------
@@ -48,25 +81,17 @@ async def _broadcast_engine():
     log.info("🛰️ Broadcast engine started")
 
     while True:
-        payload = await _message_queue.get()
+        payload, enqueued_ns = await _message_queue.get()
 
         if not payload:
             _message_queue.task_done()
             continue
 
-        dead_clients = []
-
-        for ws in list(_active_ws):
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                dead_clients.append(ws)
-
-        # Clean dead clients
-        if dead_clients:
-            async with _lock:
-                for ws in dead_clients:
-                    _active_ws.discard(ws)
+        try:
+            if _hub.client_count():
+                _hub.publish_frames([_frame(payload)], enqueued_ns)
+        except Exception:
+            log.exception("Broadcast fan-out failed")
 
         _message_queue.task_done()
 
@@ -77,14 +102,37 @@ async def _broadcast_engine():
 async def publish_signal(payload: Dict[str, Any]):
     """ALWAYS ASYNC — must be awaited or create_task() used."""
     try:
-        await _message_queue.put(payload)
+        await _message_queue.put((payload, latency.now_ns()))
+    except asyncio.QueueFull:
+        log.warning("⚠️ Queue full — dropping message")
+
+
+def _enqueue_nowait(payload: Dict[str, Any], enqueued_ns: Optional[int] = None):
+    try:
+        _message_queue.put_nowait((payload, enqueued_ns or latency.now_ns()))
     except asyncio.QueueFull:
         log.warning("⚠️ Queue full — dropping message")
 
 
+def publish_signal_threadsafe(payload: Dict[str, Any]):
+    """
+    Sync, non-blocking publish for worker threads (Kite ticker, signal pipeline).
+    Hands the payload to the broadcast loop; dropped if the loop is not running yet.
+    """
+    loop = _loop
+    if loop is None or loop.is_closed():
+        log.debug("publish_signal_threadsafe: broadcast loop not started; dropping message")
+        return False
+    loop.call_soon_threadsafe(_enqueue_nowait, payload, latency.now_ns())
+    return True
+
+
 # --------------------------------------------------------
 # 4) START LOOP ON STARTUP
 # --------------------------------------------------------
 async def start_ws_broadcast_loop():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    _hub.set_loop(_loop)
     asyncio.create_task(_broadcast_engine())
     log.info("🚀 WebSocket broadcast loop started")
@@ -3,7 +3,7 @@
 Enhanced backtester for saved ML model.
 
 Features:
- - Aligns features to model.feature_names_in_ (best-effort)
+ - Features from the feature store (app/services/feature_store), aligned to model.feature_names_in_
  - Uses predict_proba thresholding if available (--prob-threshold)
  - Hold for H bars (--hold)
  - Cooldown between trades (--cooldown)
@@ -23,9 +23,11 @@ from datetime import datetime
 
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import matplotlib.pyplot as plt
 
+from app.historical_fetcher import fetch_ohlc
+from app.services import feature_store
+
 MODEL_PATH = os.path.join("app", "storage", "rf_model.pkl")
 OUT_DIR = Path("scripts")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -40,48 +42,21 @@ def load_model(path=MODEL_PATH):
     return mdl
 
 def fetch_yf(symbol, period="60d", interval="5m"):
-    t = yf.Ticker(symbol)
-    df = t.history(period=period, interval=interval, actions=False)
+    """Bars via historical_fetcher (on-disk OHLC cache), columns as yf.Ticker.history names them."""
+    df = fetch_ohlc(symbol, provider="yfinance", period=period, interval=interval)
     if df is None or df.empty:
         raise RuntimeError("yfinance returned no data for symbol=%s period=%s interval=%s" % (symbol, period, interval))
+    df = df.rename(columns={"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"})
     df.index = pd.to_datetime(df.index)
     return df
 
-def build_candidate_features(df):
-    """Create many common features that a model might expect."""
-    df2 = df.copy()
-    close = df2["Close"]
-    vol = df2["Volume"] if "Volume" in df2.columns else df2.get("volume", pd.Series(0, index=df2.index))
-
-    # returns
-    df2["r1"] = close.pct_change(1).fillna(0)
-    df2["r2"] = close.pct_change(2).fillna(0)
-    df2["ret1"] = df2["r1"]  # alias
-    df2["ret2"] = df2["r2"]
-
-    # moving averages
-    df2["ma5"] = close.rolling(5).mean()
-    df2["ma15"] = close.rolling(15).mean()
-    df2["ma20"] = close.rolling(20).mean()
-
-    # volatility / normalized volume
-    df2["vol_mean20"] = vol.rolling(20).mean()
-    df2["vol_norm"] = vol / (df2["vol_mean20"] + 1e-9)
-    df2["vol"] = vol
-
-    # simple momentum / price ratios
-    df2["close_ma5_diff"] = (close - df2["ma5"]) / (df2["ma5"] + 1e-9)
-    df2["close_ma15_diff"] = (close - df2["ma15"]) / (df2["ma15"] + 1e-9)
-
-    # RSI-ish
-    delta = close.diff()
-    up = delta.clip(lower=0).rolling(14).mean()
-    down = -delta.clip(upper=0).rolling(14).mean()
-    df2["rsi14"] = 100 - (100 / (1 + (up / (down + 1e-9))))
-
-    # basic lag features
-    df2["lag1_close"] = close.shift(1)
-    df2["lag1_ret"] = df2["r1"].shift(1)
+def build_candidate_features(df, symbol=None, interval=None):
+    """
+    Bars plus every feature store column (app/services/feature_store). With symbol / interval
+    the features are read from the materialized store (computed once per data update).
+    """
+    feats = feature_store.get_features(df, symbol, interval)
+    df2 = df.drop(columns=[c for c in feats.columns if c in df.columns]).join(feats, how="inner")
 
     # cleanup
     df2 = df2.replace([np.inf, -np.inf], np.nan).dropna()
@@ -119,52 +94,10 @@ def get_model_expected_features(model):
 
 def ensure_features_for_model(df_with_feats: pd.DataFrame, feature_names):
     """
-    Map / synthesize DataFrame columns to model.feature_names_in_.
-    If mapping not possible, return (X, missing_list).
+    Map DataFrame columns to model.feature_names_in_ (exact name, feature store aliases,
+    case-insensitive). If mapping not possible, return (X, missing_list).
     """
-    df = df_with_feats.copy()
-    available = set(df.columns)
-    missing = []
-    for f in feature_names:
-        if f in available:
-            continue
-        aliases = {
-            "r1": ["r1","ret1","r_1","return_1"],
-            "r2": ["r2","ret2","r_2","return_2"],
-            "vol_norm": ["vol_norm","volume_norm","vol/ma","volume/vol_mean20","vol_mean20","vol_norm"],
-            "ma5": ["ma5","sma5","ma_5"],
-            "ma15": ["ma15","sma15","ma_15"],
-            "rsi14": ["rsi14","rsi_14"],
-            "vol": ["vol","volume","Volume"],
-            "lag1_ret": ["lag1_ret","r1_lag","lag1_ret"],
-        }
-        done = False
-        if f in aliases:
-            for c in aliases[f]:
-                if c in available:
-                    df[f] = df[c]
-                    done = True
-                    break
-        if done:
-            continue
-        # case-insensitive direct match
-        for a in available:
-            if a.lower() == f.lower():
-                df[f] = df[a]
-                done = True
-                break
-        if done:
-            continue
-        # substring match
-        for a in available:
-            if f.lower() in a.lower() or a.lower() in f.lower():
-                df[f] = df[a]
-                done = True
-                break
-        if not done:
-            missing.append(f)
-    X = df[[c for c in feature_names if c in df.columns]]
-    return X, missing
+    return feature_store.align(df_with_feats, feature_names)
 
 # -------------------------
 # Backtest logic & metrics
@@ -273,7 +206,7 @@ def main(symbol, period, interval, prob_threshold, hold, cooldown, fee, slip):
 
     print("Fetching data:", symbol, period, interval)
     df_raw = fetch_yf(symbol, period=period, interval=interval)
-    df_feats = build_candidate_features(df_raw)
+    df_feats = build_candidate_features(df_raw, symbol, interval)
     print("Candidate features prepared, rows:", len(df_feats))
 
     X_full, missing = ensure_features_for_model(df_feats, exp_names)
@@ -0,0 +1,107 @@
+# scripts/check_broadcast_hub.py
+"""
+Check BroadcastHub slow-consumer eviction (app/broadcast_hub.py) with in-memory sockets:
+ - a fast firehose client survives full-universe frames (one closed candle + one tick frame per
+   token, the minute-boundary frame the streamer publishes) and receives every candle frame
+ - a client whose socket never completes a send is disconnected with 1013
+
+Exits non-zero if either check fails.
+
+Usage:
+  conda activate deep3d_py310
+  python scripts\\check_broadcast_hub.py
+  python scripts\\check_broadcast_hub.py --tokens 500 --frames 20
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from app.broadcast_hub import BroadcastHub
+from app.wire import WireFrame
+
+
+class FakeSocket:
+    """Fast socket: every send completes after one loop turn; stall=True never completes one."""
+
+    def __init__(self, stall: bool = False):
+        self.stall = stall
+        self.sent = 0
+        self.candles = 0
+        self.closed = None
+
+    async def send_text(self, data):
+        if self.stall:
+            await asyncio.Event().wait()
+        await asyncio.sleep(0)
+        self.sent += 1
+        if json.loads(data).get("type") == "candle":
+            self.candles += 1
+
+    async def send_bytes(self, data):
+        await self.send_text(data.decode("utf-8", "replace"))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+class FakeDemand:
+    def acquire(self, tokens):
+        pass
+
+    def release(self, tokens):
+        pass
+
+
+def universe_frame(tokens, minute):
+    frames = []
+    for t in tokens:
+        frames.append((t, "candle", WireFrame({"type": "candle", "token": t, "candle": {"minute": minute}})))
+        frames.append((t, "tick", WireFrame({"type": "tick", "token": t, "tick": {"price": 100.0 + minute}})))
+    return frames
+
+
+async def run(args) -> int:
+    hub = BroadcastHub(client_queue_max=args.queue_max, slow_client_secs=args.slow_secs,
+                       demand=FakeDemand(), name="check")
+    hub.set_loop(asyncio.get_running_loop())
+    fast, slow = FakeSocket(), FakeSocket(stall=True)
+    hub.attach(fast)
+    hub.attach(slow)
+
+    tokens = list(range(1, args.tokens + 1))
+    for minute in range(args.frames):
+        hub.publish_frames(universe_frame(tokens, minute))
+        await asyncio.sleep(args.gap)
+    deadline = asyncio.get_running_loop().time() + args.slow_secs * 2 + 2
+    while (hub.is_connected(slow) or fast.candles < args.tokens * args.frames) and \
+            asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+
+    result = {
+        "tokens": args.tokens,
+        "frames": args.frames,
+        "fast_connected": hub.is_connected(fast),
+        "fast_candles": fast.candles,
+        "fast_sent": fast.sent,
+        "slow_connected": hub.is_connected(slow),
+        "slow_close_code": slow.closed,
+        "stats": {k: v for k, v in hub.stats().items() if k in ("slow_disconnects", "conflated", "sends")},
+    }
+    print(json.dumps(result, indent=2))
+    ok = (result["fast_connected"] and fast.candles == args.tokens * args.frames
+          and not result["slow_connected"] and slow.closed == 1013)
+    for ws in (fast, slow):
+        hub.detach(ws)
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--tokens", type=int, default=500, help="tokens per frame (NIFTY-500 universe)")
+    p.add_argument("--frames", type=int, default=5, help="full-universe frames to publish")
+    p.add_argument("--gap", type=float, default=0.01, help="seconds between frames")
+    p.add_argument("--queue-max", type=int, default=256)
+    p.add_argument("--slow-secs", type=float, default=1.0)
+    sys.exit(asyncio.run(run(p.parse_args())))
@@ -0,0 +1,76 @@
+# scripts/check_forest_inference.py
+"""
+Check the flattened forest (app/forest_inference.py) against sklearn: identical probabilities
+and per-call latency for one row and for a tick-frame sized batch.
+
+Usage:
+  conda activate deep3d_py310
+  # the live model (app/storage/rf_model.pkl)
+  python scripts\\check_forest_inference.py
+  # another pickle, more rows
+  python scripts\\check_forest_inference.py --model app\\storage\\rf_model.pkl --rows 100000
+"""
+import argparse
+import json
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.forest_inference import FlatForest
+
+
+def _per_call_us(fn, min_secs=0.5):
+    fn()
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < min_secs:
+        fn()
+        n += 1
+    return round((time.perf_counter() - t0) / n * 1e6, 1)
+
+
+def run(args):
+    model = pickle.loads(Path(args.model).read_bytes())
+    if hasattr(model, "n_jobs"):
+        model.set_params(n_jobs=1)  # tree-order summation, see forest_inference
+    flat = FlatForest.from_sklearn(model)
+
+    rng = np.random.default_rng(args.seed)
+    n_features = flat.n_features_in_ or 3
+    X = rng.normal(0.0, 1.0, (args.rows, n_features)) * rng.choice([1e-3, 1e-2, 1e4], n_features)
+    # thresholds sit between training values: probe them exactly, and next to them
+    internal = flat.children[0::2] != np.arange(0, len(flat.children), 2)  # leaves point at themselves
+    thr, feat = flat.threshold[0::2][internal], flat.feature[0::2][internal]
+    k = min(len(thr), args.rows // 2)
+    pick = rng.choice(len(thr), k, replace=False)
+    X[np.arange(k), feat[pick]] = thr[pick]
+    X[k + np.arange(k // 2), feat[pick[: k // 2]]] = np.nextafter(thr[pick[: k // 2]], np.inf)
+
+    names = getattr(model, "feature_names_in_", None)
+    wrap = (lambda a: pd.DataFrame(a, columns=list(names))) if names is not None else (lambda a: a)
+    ref = model.predict_proba(wrap(X))
+    got = flat.predict_proba(X)
+    one, frame = X[:1], X[: args.frame]
+    print(json.dumps({
+        "trees": len(flat.roots),
+        "nodes": len(flat.proba),
+        "max_depth": flat.depth,
+        "rows": args.rows,
+        "identical": bool(np.array_equal(ref, got)),
+        "max_abs_diff": float(np.max(np.abs(ref - got))) if len(X) else 0.0,
+        "single_row_us": {"flat": _per_call_us(lambda: flat.predict_proba(one)),
+                          "sklearn": _per_call_us(lambda: model.predict_proba(wrap(one)))},
+        f"batch_{len(frame)}_us": {"flat": _per_call_us(lambda: flat.predict_proba(frame)),
+                                   "sklearn": _per_call_us(lambda: model.predict_proba(wrap(frame)))},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--model", default="app/storage/rf_model.pkl")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--frame", type=int, default=200, help="batch size for the frame timing")
+    p.add_argument("--seed", type=int, default=0)
+    run(p.parse_args())
@@ -0,0 +1,122 @@
+# scripts/check_indicator_engine.py
+"""
+Check the streaming IndicatorEngine (app/indicator_engine.py) against the pandas path: feed
+randomized tick streams through TickBuffer.push and compare every key of
+compute_signals_incremental(token) with compute_signals(token) at checkpoints along the stream.
+
+EMA-family keys (ema*, macd, macd_signal, ema_cross, score) are compared exactly until the tick
+window starts sliding; after that compute_signals re-seeds its EMAs at the first bar of the window
+while the engine carries the full history, so they are only compared once the window spans at
+least --ema-warmup bars (the difference decays as (1 - 2/(span+1)) ** bars).
+
+Streams stay inside the documented behaviour: ticks are in time order and gaps are shorter than
+the tick window.
+
+Exits non-zero on any mismatch.
+
+Usage:
+  conda activate deep3d_py310
+  python scripts\\check_indicator_engine.py
+  python scripts\\check_indicator_engine.py --tokens 10 --ticks 3000 --every 7 --seed 1
+"""
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+
+from app.indicator_engine import EMA_PERIODS, IndicatorEngine
+from app.indicators import TickBuffer, compute_signals, compute_signals_incremental
+
+EMA_KEYS = {f"ema{p}" for p in EMA_PERIODS} | {"macd", "macd_signal", "ema_cross", "score"}
+META_KEYS = {"token", "tradingsymbol"}
+
+
+def tick_stream(rng, token, n, t0):
+    """Random-walk prices, bursty arrivals (several ticks per second and multi-second gaps)."""
+    ts, price = t0, 100.0 + rng.random() * 1000.0
+    for _ in range(n):
+        ts += rng.uniform(0.0, 0.4) if rng.random() < 0.5 else rng.uniform(0.4, 4.0)
+        price = max(1.0, price * (1.0 + rng.normal(0.0, 0.002)))
+        vol = 0 if rng.random() < 0.1 else int(rng.integers(1, 500))
+        yield {"instrument_token": token, "tradingsymbol": f"SYM{token}",
+               "last_price": round(price, 2), "volume": vol, "timestamp": ts}
+
+
+def _close(a, b, rtol, atol):
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a == b
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return math.isclose(a, b, rel_tol=rtol, abs_tol=atol)
+
+
+def compare(token, ref, inc, bars, sliding, args):
+    """Mismatching keys for one checkpoint, plus the EMA keys skipped during warm-up."""
+    mismatches, skipped = [], 0
+    for key in sorted((set(ref) | set(inc)) - META_KEYS):
+        if key in EMA_KEYS and sliding and bars < args.ema_warmup:
+            skipped += 1
+            continue
+        if key not in ref or key not in inc:
+            mismatches.append({"token": token, "key": key, "missing_in": "incremental" if key in ref else "pandas"})
+            continue
+        if not _close(ref[key], inc[key], args.rtol, args.atol):
+            mismatches.append({"token": token, "key": key, "bars": bars, "sliding": sliding,
+                               "pandas": ref[key], "incremental": inc[key]})
+    return mismatches, skipped
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    tb = TickBuffer.instance()
+    IndicatorEngine.instance().reset()
+
+    checkpoints = compared = ema_skipped = 0
+    mismatches = []
+    for i in range(args.tokens):
+        token = 900000 + i
+        for n, tick in enumerate(tick_stream(rng, token, args.ticks, 1_700_000_000.0 + i * 86400), 1):
+            tb.push(tick)
+            if n % args.every and n != args.ticks:
+                continue
+            ref = compute_signals(token, window=args.window)
+            inc = compute_signals_incremental(token)
+            bars = len(tb.to_dataframe(token=token, window=args.window))
+            bad, skipped = compare(token, ref, inc, bars, n > args.window, args)
+            checkpoints += 1
+            compared += len((set(ref) | set(inc)) - META_KEYS) - skipped
+            ema_skipped += skipped
+            mismatches.extend(bad)
+
+    result = {
+        "tokens": args.tokens,
+        "ticks_per_token": args.ticks,
+        "window": args.window,
+        "ema_warmup_bars": args.ema_warmup,
+        "checkpoints": checkpoints,
+        "values_compared": compared,
+        "ema_values_skipped": ema_skipped,
+        "mismatches": len(mismatches),
+        "first_mismatches": mismatches[:10],
+    }
+    print(json.dumps(result, indent=2, default=str))
+    print("OK" if not mismatches else "FAILED")
+    return 0 if not mismatches else 1
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--tokens", type=int, default=5, help="independent tick streams")
+    p.add_argument("--ticks", type=int, default=2000, help="ticks per stream")
+    p.add_argument("--every", type=int, default=13, help="compare every N ticks")
+    p.add_argument("--window", type=int, default=500, help="tick window (IndicatorEngine default)")
+    p.add_argument("--ema-warmup", type=int, default=10 * max(EMA_PERIODS),
+                   help="bars in the window before EMA-family keys are compared once it slides")
+    p.add_argument("--rtol", type=float, default=1e-7)
+    p.add_argument("--atol", type=float, default=1e-6)
+    p.add_argument("--seed", type=int, default=0)
+    sys.exit(run(p.parse_args()))
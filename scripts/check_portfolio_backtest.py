@@ -0,0 +1,170 @@
+# scripts/check_portfolio_backtest.py
+"""
+Parity + speed check: the vectorized portfolio backtest (app/services/portfolio_backtest.py)
+against a bar-by-bar reference loop, on synthetic symbols with staggered first candles and
+missing bars, for "equal" / "fixed" allocation, max_weight caps, commission and periodic
+rebalancing.
+
+The reference aligns the series with a last-seen dict, runs the flat/long state machine per
+symbol, recomputes target weights every bar and keeps cash and quantities as plain floats.
+Equity, positions, orders and per-symbol PnL must match within float rounding.
+
+Usage:
+  python scripts/check_portfolio_backtest.py [--cases 30] [--symbols 200] [--bars 20000]
+
+Exits non-zero on the first mismatch.
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from app.services.portfolio_backtest import align, backtest_portfolio
+from app.services.vector_backtest import BUY, SELL, sma_crossover_codes
+
+
+def make_series(n_symbols, n_bars, seed):
+    """{symbol: (ts, close)} random walks; each symbol starts late and skips some bars."""
+    rnd = random.Random(seed)
+    series = {}
+    for j in range(n_symbols):
+        start = rnd.randint(0, n_bars // 3)
+        price = rnd.uniform(50, 3000)
+        ts, close = [], []
+        for t in range(start, n_bars):
+            price = max(1.0, price + rnd.gauss(0, price * 0.01))
+            if rnd.random() < 0.9:
+                ts.append(1_700_000_000 + 60 * t)
+                close.append(round(price, 2))
+        series[f"SYM{j}"] = (ts, close)
+    return series
+
+
+def reference_align(series):
+    ts_all = sorted({t for ts, _ in series.values() for t in ts})
+    last = {}
+    rows = []
+    by_ts = {}
+    for sym, (ts, close) in series.items():
+        for t, c in zip(ts, close):
+            by_ts.setdefault(t, {})[sym] = c
+    for t in ts_all:
+        last.update(by_ts[t])
+        rows.append([last.get(sym, math.nan) for sym in series])
+    return ts_all, rows
+
+
+def reference_loop(rows, symbols, rule, targets, max_weight, capital, slippage_pct, commission,
+                   rebalance_every, fast, slow):
+    """Bar-by-bar portfolio simulation with per-symbol scalars."""
+    N = len(symbols)
+    codes = [sma_crossover_codes(np.array([r[j] for r in rows]), fast, slow).tolist() for j in range(N)]
+    fixed = {t["symbol"]: float(t["weight"]) / 100.0 for t in targets or []}
+    slip = slippage_pct / 100
+    held = [False] * N
+    qty = [0.0] * N
+    cash = float(capital)
+    prev_w = None
+    orders = [0] * N
+    costs = [0.0] * N
+    gross = [0.0] * N
+    equity_curve = []
+    for t, row in enumerate(rows):
+        p = [0.0 if math.isnan(c) else c for c in row]
+        if t:
+            for j in range(N):
+                gross[j] += qty[j] * (p[j] - prev_p[j])
+        for j in range(N):
+            if codes[j][t] == BUY:
+                held[j] = True
+            elif codes[j][t] == SELL:
+                held[j] = False
+        n_held = sum(held)
+        w = []
+        for j in range(N):
+            if rule == "equal":
+                wj = 1.0 / n_held if held[j] else 0.0
+            else:
+                wj = fixed.get(symbols[j], 0.0) if held[j] else 0.0
+            if max_weight is not None:
+                wj = min(wj, max_weight)
+            w.append(wj if p[j] > 0 else 0.0)
+        if t == 0 or w != prev_w or (rebalance_every and t % rebalance_every == 0):
+            equity = cash + sum(q * c for q, c in zip(qty, p))
+            for j in range(N):
+                if p[j] <= 0:
+                    continue
+                target = math.floor(equity * w[j] / (p[j] * (1 + slip)))
+                diff = target - qty[j]
+                if diff:
+                    fill = p[j] * (1 + slip) if diff > 0 else p[j] * (1 - slip)
+                    cash -= diff * fill + commission
+                    orders[j] += 1
+                    costs[j] += abs(diff) * p[j] * slip + commission
+                qty[j] = target
+        prev_w = w
+        prev_p = p
+        equity_curve.append(cash + sum(q * c for q, c in zip(qty, p)))
+    return {
+        "equity": equity_curve,
+        "orders": orders,
+        "pnl_by_symbol": [g - c for g, c in zip(gross, costs)],
+        "final_qty": qty,
+    }
+
+
+def close_enough(a, b, rtol=1e-9, atol=1e-6):
+    return np.allclose(np.asarray(a, dtype=float), np.asarray(b, dtype=float), rtol=rtol, atol=atol)
+
+
+def run():
+    p = argparse.ArgumentParser()
+    p.add_argument("--cases", type=int, default=30)
+    p.add_argument("--symbols", type=int, default=200, help="symbols in the speed run")
+    p.add_argument("--bars", type=int, default=20_000, help="bars in the speed run")
+    args = p.parse_args()
+
+    checked = 0
+    for seed in range(args.cases):
+        rnd = random.Random(seed)
+        series = make_series(rnd.randint(1, 8), rnd.randint(0, 600), seed)
+        ts, symbols, close = align(series)
+        ref_ts, rows = reference_align(series)
+        if ts.tolist() != ref_ts or not np.array_equal(close, np.array(rows).reshape(close.shape), equal_nan=True):
+            sys.exit(f"align mismatch: seed={seed}")
+        for rule, max_weight, commission, every in (
+            ("equal", None, 0.0, None),
+            ("equal", 0.3, 20.0, None),
+            ("fixed", 0.25, 5.0, 50),
+        ):
+            if not rows:
+                continue
+            targets = [{"symbol": s, "weight": rnd.uniform(5, 40)} for s in symbols] if rule == "fixed" else None
+            kw = dict(capital=1_000_000.0, rule=rule, targets=targets, max_weight=max_weight,
+                      slippage_pct=0.05, commission=commission, rebalance_every=every)
+            got = backtest_portfolio(close, symbols, fast_period=5, slow_period=20, **kw)
+            want = reference_loop(rows, symbols, fast=5, slow=20, **kw)
+            if not close_enough(got["equity"], want["equity"]):
+                t = int(np.argmax(np.abs(got["equity"] - np.array(want["equity"]))))
+                sys.exit(f"equity mismatch: seed={seed} rule={rule} bar={t} "
+                         f"vector={got['equity'][t]} loop={want['equity'][t]}")
+            if got["orders_by_symbol"].tolist() != want["orders"] \
+                    or not close_enough(got["positions"][-1], want["final_qty"]):
+                sys.exit(f"orders/positions mismatch: seed={seed} rule={rule}")
+            if not close_enough(got["pnl_by_symbol"], want["pnl_by_symbol"]):
+                sys.exit(f"per-symbol pnl mismatch: seed={seed} rule={rule}")
+            checked += 1
+    print(f"parity ok ({checked} runs)")
+
+    ts, symbols, close = align(make_series(args.symbols, args.bars, 7))
+    t0 = time.perf_counter()
+    res = backtest_portfolio(close, symbols)
+    print(f"{args.symbols} symbols x {len(ts)} bars: {time.perf_counter() - t0:.2f}s, "
+          f"{res['rebalances']} rebalances, {res['orders']} orders")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,111 @@
+# scripts/check_vector_backtest.py
+"""
+Parity + speed check: vectorized candle backtests (app/services/vector_backtest.py) and the
+array / incremental SMA, MACD and RSI signal generators against the bar-by-bar reference loops,
+on synthetic series (integer steps with many ties, tiny steps, random walks) and several chunk
+sizes.
+
+Usage:
+  python scripts/check_vector_backtest.py [--bars 1000000] [--cases 40]
+
+Exits non-zero on the first mismatch.
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from app.services import macd_strategy, rsi_strategy
+from app.services.candle_backtest import backtest, backtest_loop
+from app.services.candle_backtest_engine import run_candle_backtest_loop
+from app.services.candle_strategy import SmaCrossover, generate_signals, iter_signal_chunks
+from app.services.vector_backtest import run_candle_backtest_arrays
+
+
+def series(n, kind, seed):
+    rnd = random.Random(seed)
+    price = 2400.0
+    out = []
+    for i in range(n):
+        if kind == "int":
+            price += (2 if i % 3 else -1) if rnd.random() < 0.9 else rnd.choice([-3, 3])
+        elif kind == "tiny":
+            price += rnd.choice([-0.1, -0.05, 0.0, 0.05, 0.1])
+        else:
+            price += rnd.gauss(0, 1)
+        out.append(price)
+    return out
+
+
+def chunks(values, size):
+    return [np.array(values[i:i + size]) for i in range(0, len(values), size)]
+
+
+def same(a, b):
+    return a == b and [type(v) for v in a.values()] == [type(v) for v in b.values()]
+
+
+def run():
+    p = argparse.ArgumentParser()
+    p.add_argument("--bars", type=int, default=1_000_000)
+    p.add_argument("--cases", type=int, default=40)
+    args = p.parse_args()
+
+    checked = 0
+    for seed in range(args.cases):
+        n = random.Random(seed).randint(0, 3000)
+        for kind in ("int", "tiny", "walk"):
+            closes = series(n, kind, seed)
+            candles = [{"close": c} for c in closes]
+            signals = generate_signals(candles)
+            streamed = [sig for _, part in iter_signal_chunks(chunks(closes, 64)) for sig in part]
+            sma = SmaCrossover()
+            if not (signals == streamed == [sma.update(c) for c in closes]):
+                sys.exit(f"SMA signal mismatch: seed={seed} kind={kind}")
+            macd = macd_strategy.MacdSignals()
+            if not (macd_strategy.generate_signals(candles) == [macd.update(c) for c in closes]
+                    == macd_strategy.generate_signals_loop(candles)):
+                sys.exit(f"MACD signal mismatch: seed={seed} kind={kind}")
+            rsi = rsi_strategy.RsiSignals()
+            if not (rsi_strategy.generate_signals(candles) == [rsi.update(c) for c in closes]
+                    == rsi_strategy.generate_signals_loop(candles)):
+                sys.exit(f"RSI signal mismatch: seed={seed} kind={kind}")
+            if not same(backtest(candles, signals, 0.0005, 1.0), backtest_loop(candles, signals, 0.0005, 1.0)):
+                sys.exit(f"backtest mismatch: seed={seed} kind={kind}")
+            for size in (1, 7, 64, 100_000):
+                want = run_candle_backtest_loop(chunks(closes, size), 0.05, 1.0)
+                got = run_candle_backtest_arrays(chunks(closes, size), 0.05, 1.0)
+                if not same(want, got):
+                    sys.exit(f"run_candle_backtest mismatch: seed={seed} kind={kind} chunk={size}\n{want}\n{got}")
+                checked += 1
+    print(f"parity ok ({checked} runs)")
+
+    closes = np.array(series(args.bars, "walk", 7))
+    t0 = time.perf_counter()
+    want = run_candle_backtest_loop([closes], 0.05, 1.0)
+    loop_s = time.perf_counter() - t0
+    best = float("inf")
+    for _ in range(5):
+        t0 = time.perf_counter()
+        got = run_candle_backtest_arrays([closes], 0.05, 1.0)
+        best = min(best, time.perf_counter() - t0)
+    print(f"{args.bars} bars: loop {loop_s:.2f}s, vector {best * 1000:.1f}ms ({loop_s / best:.0f}x), equal={same(want, got)}")
+
+    for name, codes_fn, state in (
+        ("MACD", macd_strategy.macd_codes, macd_strategy.MacdSignals()),
+        ("RSI", rsi_strategy.rsi_codes, rsi_strategy.RsiSignals()),
+    ):
+        t0 = time.perf_counter()
+        codes_fn(closes)
+        vec_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for c in closes.tolist():
+            state.update(c)
+        inc_s = time.perf_counter() - t0
+        print(f"{name} signals, {args.bars} bars: array {vec_s * 1000:.1f}ms, incremental {inc_s:.2f}s")
+
+
+if __name__ == "__main__":
+    run()
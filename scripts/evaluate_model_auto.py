@@ -2,8 +2,8 @@
 """
 Attempt to evaluate the saved model by auto-creating common features.
 This is a best-effort approach: it inspects model.feature_names_in_ (if available)
-and synthesizes common features (r1, r2, vol_norm, ma5, ma15, rsi14, etc.)
-so feature names match the model.
+and takes the features from the feature store (app/services/feature_store: r1, r2,
+vol_norm as in training, ma5, ma15, rsi14, etc.) so feature names match the model.
 
 Usage:
     conda activate deep3d_py310
@@ -15,7 +15,9 @@ import pandas as pd
 import numpy as np
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, roc_auc_score, confusion_matrix
 from sklearn.model_selection import TimeSeriesSplit, cross_val_score
-import yfinance as yf
+
+from app.historical_fetcher import fetch_ohlc
+from app.services import feature_store
 
 MODEL_PATH = os.path.join("app", "storage", "rf_model.pkl")
 
@@ -26,92 +28,25 @@ def load_model(path=MODEL_PATH):
     return mdl
 
 def fetch_yf(symbol, period="60d", interval="5m"):
-    t = yf.Ticker(symbol)
-    df = t.history(period=period, interval=interval, actions=False)
+    """Bars via historical_fetcher (on-disk OHLC cache), columns as yf.Ticker.history names them."""
+    df = fetch_ohlc(symbol, provider="yfinance", period=period, interval=interval)
+    df = df.rename(columns={"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"})
     df.index = pd.to_datetime(df.index)
     return df
 
-def build_candidate_features(df):
-    """create a wide set of common features used in trading models"""
-    df2 = df.copy()
-    close = df2["Close"]
-    vol = df2["Volume"] if "Volume" in df2.columns else df2.get("volume", pd.Series(0, index=df2.index))
-    # simple returns
-    df2["r1"] = close.pct_change(1).fillna(0)
-    df2["r2"] = close.pct_change(2).fillna(0)
-    df2["ret1"] = df2["r1"]  # alias
-    df2["ret2"] = df2["r2"]
-    # moving avgs
-    df2["ma5"] = close.rolling(5).mean()
-    df2["ma15"] = close.rolling(15).mean()
-    # RSI-like crude
-    delta = close.diff()
-    up = delta.clip(lower=0).rolling(14).mean()
-    down = -delta.clip(upper=0).rolling(14).mean()
-    df2["rsi14"] = 100 - (100 / (1 + (up / (down + 1e-9))))
-    # volume normalized
-    df2["vol_mean20"] = vol.rolling(20).mean()
-    df2["vol_norm"] = vol / (df2["vol_mean20"] + 1e-9)
-    # other aliases
-    df2["vol"] = vol
+def build_candidate_features(df, symbol=None, interval=None):
+    """bars plus the feature store columns (materialized per symbol / interval when given)"""
+    feats = feature_store.get_features(df, symbol, interval)
+    df2 = df.drop(columns=[c for c in feats.columns if c in df.columns]).join(feats, how="inner")
     df2 = df2.replace([np.inf, -np.inf], np.nan).dropna()
     return df2
 
 def ensure_features_for_model(df_with_feats, feature_names):
     """
-    Ensure df has columns matching feature_names.
-    If a feature is missing, try some common aliases.
+    Ensure df has columns matching feature_names (exact, feature store aliases, case-insensitive).
     Returns (X, missing) where X is DataFrame subset for model and missing is list of unresolved names.
     """
-    df = df_with_feats.copy()
-    available = set(df.columns)
-    missing = []
-    resolved = []
-    for f in feature_names:
-        if f in available:
-            resolved.append(f)
-            continue
-        # try common mappings
-        mapping_candidates = {
-            "r1": ["r1","ret1","r_1","return_1"],
-            "r2": ["r2","ret2","r_2","return_2"],
-            "vol_norm": ["vol_norm","volume_norm","vol/ma","volume/vol_mean20","vol_norm"],
-            "ma5": ["ma5","sma5","ma_5"],
-            "ma15": ["ma15","sma15","ma_15"],
-        }
-        done = False
-        # search candidates
-        for k,cands in mapping_candidates.items():
-            if f == k or f.lower() == k.lower():
-                for c in cands:
-                    if c in available:
-                        df[f] = df[c]
-                        resolved.append(f)
-                        done = True
-                        break
-                if done:
-                    break
-        # try direct alias: lower-case match
-        if not done:
-            for a in available:
-                if a.lower() == f.lower():
-                    df[f] = df[a]
-                    resolved.append(f)
-                    done = True
-                    break
-        if not done:
-            # try prefix/suffix matching
-            for a in available:
-                if f.lower() in a.lower() or a.lower() in f.lower():
-                    df[f] = df[a]
-                    resolved.append(f)
-                    done = True
-                    break
-        if not done:
-            missing.append(f)
-    # return X with columns in model order if available
-    X = df[[c for c in feature_names if c in df.columns]]
-    return X, missing
+    return feature_store.align(df_with_feats, feature_names)
 
 def print_classification(y_true, y_pred):
     acc = accuracy_score(y_true, y_pred)
@@ -155,7 +90,7 @@ def main(symbol, period="60d", interval="5m"):
 
     print("Fetching data:", symbol, period, interval)
     df_raw = fetch_yf(symbol, period=period, interval=interval)
-    df_feats = build_candidate_features(df_raw)
+    df_feats = build_candidate_features(df_raw, symbol, interval)
     print("Built candidate features; total rows:", len(df_feats))
 
     X_full, missing = ensure_features_for_model(df_feats, exp_names)
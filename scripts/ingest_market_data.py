@@ -0,0 +1,61 @@
+# scripts/ingest_market_data.py
+"""
+Bulk-load OHLCV bars into market_candles (see app/services/market_ingest.py).
+
+Usage:
+  python scripts/ingest_market_data.py --source kite --symbols RELIANCE,TCS --interval 1m --from 2024-01-01 --to 2024-12-31
+  python scripts/ingest_market_data.py --source fetcher --symbols RELIANCE.NS --interval 5m --period 60d
+  python scripts/ingest_market_data.py --source file --files data/*.csv --interval 1m [--symbol RELIANCE]
+
+Re-running the same command resumes from the last committed bar (pass --no-resume to reload).
+"""
+import argparse
+import glob
+import json
+import time
+
+from app.db import init_db
+from app.services import market_ingest
+
+
+def run():
+    p = argparse.ArgumentParser()
+    p.add_argument("--source", choices=("kite", "fetcher", "file"), required=True)
+    p.add_argument("--symbols", default="", help="comma separated (kite / fetcher)")
+    p.add_argument("--symbol", default=None, help="symbol for --files without a symbol column")
+    p.add_argument("--files", nargs="*", default=[], help="CSV / Parquet paths or globs")
+    p.add_argument("--interval", default="1m")
+    p.add_argument("--from", dest="start", default=None, help="ISO date/time (kite)")
+    p.add_argument("--to", dest="end", default=None, help="ISO date/time (kite)")
+    p.add_argument("--period", default="7d", help="lookback for --source fetcher")
+    p.add_argument("--no-resume", action="store_true")
+    args = p.parse_args()
+
+    init_db()
+    resume = not args.no_resume
+    results = {}
+    t0 = time.perf_counter()
+
+    if args.source == "file":
+        paths = [f for pattern in args.files for f in sorted(glob.glob(pattern))]
+        for path in paths:
+            results[path] = market_ingest.ingest_file(path, args.interval, symbol=args.symbol, resume=resume)
+    else:
+        for sym in [s.strip() for s in args.symbols.split(",") if s.strip()]:
+            try:
+                if args.source == "kite":
+                    results[sym] = market_ingest.ingest_kite(sym, args.start, args.end, interval=args.interval,
+                                                             resume=resume)
+                else:
+                    results[sym] = market_ingest.ingest_fetcher(sym, period=args.period, interval=args.interval,
+                                                                resume=resume)
+            except Exception as e:
+                results[sym] = {"error": str(e)}
+
+    total = sum(r.get("rows", 0) for r in results.values())
+    print(json.dumps(results, indent=2, default=str))
+    print(f"{total} rows in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+# scripts/replay_ticks.py
+"""
+Replay ticks through the live StrategyEngine pipeline with simulated fills
+(app/services/replay_engine.py). No Kite connection needed.
+
+Usage:
+  conda activate deep3d_py310
+  # recorded ticks (tick store), as fast as possible
+  python scripts\replay_ticks.py --tokens 738561,256265 --start 2026-10-16T03:45:00 --end 2026-10-16T10:00:00
+  # same at 10x real time
+  python scripts\replay_ticks.py --tokens 738561 --start ... --end ... --speed 10
+  # throughput benchmark on synthetic ticks
+  python scripts\replay_ticks.py --synthetic 500000 --synthetic-tokens 200
+
+Prints a JSON report: ticks/sec, signals / actions, the ML scoring path that ran (batch / serial,
+model, scored signals), simulated orders and PnL, stage latencies.
+"""
+import argparse
+import json
+from datetime import datetime
+
+from app.services.replay_engine import TickReplay, load_recorded, synthetic
+
+
+def _symbols(tokens):
+    """token -> tradingsymbol from the instruments table (best-effort)."""
+    try:
+        from app.db import SessionLocal
+        from app.models import Instrument
+    except Exception:
+        return {}
+    db = SessionLocal()
+    try:
+        rows = db.query(Instrument).filter(Instrument.instrument_token.in_([str(t) for t in tokens])).all()
+        return {int(r.instrument_token): r.tradingsymbol for r in rows}
+    except Exception:
+        return {}
+    finally:
+        db.close()
+
+
+def run(args):
+    if args.synthetic:
+        ticks = synthetic(n_tokens=args.synthetic_tokens, n_ticks=args.synthetic)
+        symbols = {}
+    else:
+        if not (args.tokens and args.start and args.end):
+            raise SystemExit("--tokens, --start and --end are required (or use --synthetic N)")
+        tokens = [int(t) for t in args.tokens.split(",") if t.strip()]
+        ticks = load_recorded(tokens, datetime.fromisoformat(args.start), datetime.fromisoformat(args.end))
+        symbols = _symbols(tokens)
+    print(f"Replaying {len(ticks['ts'])} ticks (speed={args.speed or 'max'}, frame={args.frame_ms}ms)")
+
+    rp = TickReplay(ticks, symbols=symbols, frame_ms=args.frame_ms, speed=args.speed, mode=args.mode,
+                    batch_mode=None if args.batch is None else args.batch == "on",
+                    trade_amount=args.qty, slippage_pct=args.slippage_pct, commission=args.commission)
+    res = rp.run(max_ticks=args.max_ticks)
+    if args.fills:
+        res["fills"] = rp.orders.fills
+    print(json.dumps(res, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--tokens", default=None, help="comma-separated instrument tokens")
+    p.add_argument("--start", default=None, help="ISO datetime (naive = local time, as tick_store.to_ns)")
+    p.add_argument("--end", default=None)
+    p.add_argument("--synthetic", type=int, default=0, help="replay N synthetic ticks instead")
+    p.add_argument("--synthetic-tokens", type=int, default=50)
+    p.add_argument("--speed", type=float, default=None, help="x real time; omit for as fast as possible")
+    p.add_argument("--frame-ms", type=int, default=1000, help="ticks per frame window (Kite sends ~1 frame/s)")
+    p.add_argument("--mode", choices=("auto", "manual"), default="auto")
+    p.add_argument("--batch", choices=("on", "off"), default=None, help="override STRAT_BATCH_MODE")
+    p.add_argument("--qty", type=float, default=None, help="order quantity (default STRAT_AUTO_AMOUNT)")
+    p.add_argument("--slippage-pct", type=float, default=0.05)
+    p.add_argument("--commission", type=float, default=20.0)
+    p.add_argument("--max-ticks", type=int, default=None)
+    p.add_argument("--fills", action="store_true", help="include every simulated fill in the report")
+    run(p.parse_args())
@@ -4,27 +4,43 @@ Parameter sweep runner for backtest_model.py.
 
 Usage:
   conda activate deep3d_py310
-  python scripts\sweep_backtest.py
+  python scripts\sweep_backtest.py [--workers 8] [--patience 20]
 
 It will run the backtester for combinations of:
  - prob_thresholds
  - holds
  - cooldowns
-and write scripts/sweep_results.csv with metrics for each run.
+ - fees / slips
+and write scripts/sweep_results.csv with metrics for each run (best Sharpe, then profit_factor,
+first).
 
-Note: this invokes the backtester as a subprocess and reuses its outputs (backtest_metrics.json).
+The data is fetched and the model loaded once; predict_proba runs once (each prob_threshold only
+re-thresholds the probabilities). Close, timestamps and probabilities go into shared memory and
+the combinations run backtest_model.backtest_from_preds over a process pool
+(app.services.optimizer), so the metrics are the same as one backtest_model.py run per combo.
+Rows are printed as they finish; --patience stops after that many rows without a better Sharpe.
 """
-import subprocess
-import json
-from itertools import product
-from pathlib import Path
-import time
+import argparse
 import csv
+import functools
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.services.optimizer import OPTIMIZER_WORKERS, expand_grid, grid_search
+from backtest_model import (
+    MODEL_PATH,
+    backtest_from_preds,
+    build_candidate_features,
+    ensure_features_for_model,
+    fetch_yf,
+    get_model_expected_features,
+    load_model,
+)
 
-BACKTEST_SCRIPT = "python"
-BACKTEST_MODULE = "scripts/backtest_model.py"  # relative path to script
 OUT_DIR = Path("scripts")
-METRICS_FILE = OUT_DIR / "backtest_metrics.json"
 RESULT_CSV = OUT_DIR / "sweep_results.csv"
 
 # Sweep configuration (edit as desired)
@@ -38,88 +54,116 @@ symbol = "RELIANCE.NS"
 period = "60d"
 interval = "5m"
 
-# build combos
-combos = list(product(prob_thresholds, holds, cooldowns, fees, slips))
-print(f"Running {len(combos)} backtest jobs...")
-
-results = []
-for idx, (pt, hold, cooldown, fee, slip) in enumerate(combos, start=1):
-    print(f"\n[{idx}/{len(combos)}] pt={pt} hold={hold} cooldown={cooldown} fee={fee} slip={slip}")
-    args = [
-        BACKTEST_SCRIPT, BACKTEST_MODULE,
-        "--symbol", symbol,
-        "--period", period,
-        "--interval", interval,
-        "--prob-threshold", str(pt),
-        "--hold", str(hold),
-        "--cooldown", str(cooldown),
-        "--fee", str(fee),
-        "--slip", str(slip),
-    ]
-    # run subprocess (block until done)
+PARAMS = ("prob_threshold", "hold", "cooldown", "fee", "slip")
+METRICS = ("cumulative_return", "total_return", "sharpe", "max_drawdown", "n_trades",
+           "win_rate", "avg_win", "avg_loss", "profit_factor")
+FIELDS = list(PARAMS) + ["success", "elapsed_s"] + list(METRICS) + ["error", "rank"]
+
+
+def prepare(symbol, period, interval):
+    """Same steps as backtest_model.main up to prediction; returns (arrays, tz)."""
+    print("Loading model:", MODEL_PATH)
+    mdl = load_model()
+    exp_names = get_model_expected_features(mdl)
+
+    print("Fetching data:", symbol, period, interval)
+    df_raw = fetch_yf(symbol, period=period, interval=interval)
+    df_feats = build_candidate_features(df_raw, symbol, interval)
+    X_full, missing = ensure_features_for_model(df_feats, exp_names)
+    if missing:
+        raise SystemExit(f"Could not synthesize these required features for the model: {missing}")
+
+    df_aligned = df_feats.loc[X_full.index].copy()
+    df_aligned["target"] = (df_aligned["Close"].shift(-1) > df_aligned["Close"]).astype(int)
+    df_aligned = df_aligned.dropna(subset=["target"])
+    X = X_full.loc[df_aligned.index]
+
+    index = pd.DatetimeIndex(df_aligned.index)
+    arrays = {
+        "ts": index.asi8.copy(),  # UTC nanoseconds
+        "close": df_aligned["Close"].to_numpy(dtype=np.float64),
+    }
+    print("Running model on", len(X), "rows")
+    if hasattr(mdl, "predict_proba"):
+        arrays["probs"] = np.asarray(mdl.predict_proba(X)[:, 1], dtype=np.float64)
+    else:
+        arrays["preds"] = np.asarray(mdl.predict(X))
+    return arrays, (str(index.tz) if index.tz is not None else None)
+
+
+def evaluate_combo(arrays, params, tz=None):
+    """backtest_from_preds for one combo on the shared arrays."""
+    index = pd.DatetimeIndex(arrays["ts"].astype("datetime64[ns]"))
+    if tz:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    df = pd.DataFrame({"Close": arrays["close"]}, index=index)
+    if "probs" in arrays:
+        preds = (arrays["probs"] >= params["prob_threshold"]).astype(int)
+    else:
+        preds = arrays["preds"]
+    res = backtest_from_preds(df, preds, hold_bars=params["hold"], fee_per_trade=params["fee"],
+                              slippage=params["slip"], cooldown=params["cooldown"])
+    return {k: res[k] for k in METRICS}
+
+
+def _num(v):
+    return -9999 if v is None or (isinstance(v, float) and np.isnan(v)) else v
+
+
+def sharpe_then_pf(row):
+    return (_num(row.get("sharpe")), _num(row.get("profit_factor")))
+
+
+def to_csv_row(row):
+    out = dict(row["params"])
+    out["success"] = row["ok"]
+    out["elapsed_s"] = row.get("elapsed_s")
+    for k in METRICS:
+        out[k] = row.get(k)
+    if not row["ok"]:
+        out["error"] = str(row.get("error", ""))[:1000]
+    out["rank"] = row.get("rank")
+    return out
+
+
+def run(args):
+    arrays, tz = prepare(args.symbol, args.period, args.interval)
+    combos = expand_grid(dict(zip(PARAMS, (prob_thresholds, holds, cooldowns, fees, slips))))
+    print(f"Running {len(combos)} backtest jobs on {args.workers} workers...")
+
+    done = []
+
+    def report(row):
+        done.append(row)
+        p = row["params"]
+        status = f"sharpe={row.get('sharpe')} pf={row.get('profit_factor')}" if row["ok"] else f"FAILED {row['error']}"
+        print(f"[{len(done)}/{len(combos)}] pt={p['prob_threshold']} hold={p['hold']} "
+              f"cooldown={p['cooldown']} fee={p['fee']} slip={p['slip']}: {status}")
+
     start = time.time()
-    proc = subprocess.run(args, capture_output=True, text=True)
+    table = grid_search(arrays, functools.partial(evaluate_combo, tz=tz), combos,
+                        workers=args.workers, score=sharpe_then_pf, patience=args.patience,
+                        on_result=report)
     elapsed = time.time() - start
-    if proc.returncode != 0:
-        print("Backtest script failed. stderr:")
-        print(proc.stderr)
-        # log failure row
-        results.append({
-            "prob_threshold": pt,
-            "hold": hold,
-            "cooldown": cooldown,
-            "fee": fee,
-            "slip": slip,
-            "success": False,
-            "error": proc.stderr[:1000],
-            "elapsed_s": elapsed
-        })
-        # continue to next combo
-        continue
-
-    # read metrics JSON produced by backtest_model.py
-    try:
-        with open(METRICS_FILE, "r") as f:
-            metrics = json.load(f)
-    except Exception as e:
-        print("Failed to read metrics JSON:", e)
-        results.append({
-            "prob_threshold": pt,
-            "hold": hold,
-            "cooldown": cooldown,
-            "fee": fee,
-            "slip": slip,
-            "success": False,
-            "error": f"metrics_read_err:{e}",
-            "elapsed_s": elapsed
-        })
-        continue
-
-    # flatten selected metrics for CSV
-    row = {
-        "prob_threshold": pt,
-        "hold": hold,
-        "cooldown": cooldown,
-        "fee": fee,
-        "slip": slip,
-        "success": True,
-        "elapsed_s": elapsed,
-    }
-    # copy relevant numeric metrics if present
-    for k in ("cumulative_return","total_return","sharpe","max_drawdown","n_trades","win_rate","avg_win","avg_loss","profit_factor"):
-        row[k] = metrics.get(k)
-    results.append(row)
-
-# write results CSV (sorted by sharpe desc then profit_factor)
-results_sorted = sorted([r for r in results if r.get("success")], key=lambda x: (x.get("sharpe") or -9999, x.get("profit_factor") or -9999), reverse=True)
-fieldnames = list(results[0].keys()) if results else ["prob_threshold","hold","cooldown","fee","slip","success"]
-with open(RESULT_CSV, "w", newline="") as csvf:
-    writer = csv.DictWriter(csvf, fieldnames=fieldnames)
-    writer.writeheader()
-    for r in results:
-        writer.writerow(r)
-
-print("\nSweep complete. Results saved to:", RESULT_CSV)
-print("Top successful combos (by Sharpe then profit_factor):")
-for r in results_sorted[:10]:
-    print(r)
+
+    with open(RESULT_CSV, "w", newline="") as csvf:
+        writer = csv.DictWriter(csvf, fieldnames=FIELDS)
+        writer.writeheader()
+        for r in table:
+            writer.writerow(to_csv_row(r))
+
+    print(f"\nSweep complete ({len(table)}/{len(combos)} runs, {elapsed:.1f}s). Results saved to:", RESULT_CSV)
+    print("Top successful combos (by Sharpe then profit_factor):")
+    for r in table[:10]:
+        if r["ok"]:
+            print(to_csv_row(r))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--symbol", default=symbol)
+    p.add_argument("--period", default=period)
+    p.add_argument("--interval", default=interval)
+    p.add_argument("--workers", type=int, default=OPTIMIZER_WORKERS)
+    p.add_argument("--patience", type=int, default=None, help="stop after N finished runs without a better Sharpe")
+    run(p.parse_args())
@@ -1,7 +1,7 @@
 # scripts/train_reliance.py
 """
 Robust training helper for RELIANCE (or other symbols).
-Tries AlphaVantage then multiple yfinance fallbacks:
+Tries AlphaVantage then multiple yfinance fallbacks (through the on-disk OHLC cache, app/ohlc_cache.py):
   1) 5m, period=60d
   2) 15m, period=6mo
   3) 1d, period=2y
@@ -15,38 +15,16 @@ from dotenv import load_dotenv
 
 import pandas as pd
 import requests
-import yfinance as yf
 
+# before the app imports: app.* modules read their settings from the environment
+load_dotenv()
+
+from app.historical_fetcher import fetch_ohlc
 from app.ml_model import ml_model
 from app import crud
 
-load_dotenv()
 ALPHAVANTAGE_KEY = os.getenv("ALPHAVANTAGE_KEY", "").strip()
 
-def av_intraday_to_df(av_json, interval="5min"):
-    key = f"Time Series ({interval})"
-    if key not in av_json:
-        for k in av_json.keys():
-            if "Time Series" in k and interval.replace("min","min") in k:
-                key = k
-                break
-    series = av_json.get(key)
-    if not series:
-        return None
-    rows = []
-    for ts_str, values in series.items():
-        ts = pd.to_datetime(ts_str)
-        rows.append({
-            "ts": ts,
-            "open": float(values.get("1. open")),
-            "high": float(values.get("2. high")),
-            "low": float(values.get("3. low")),
-            "close": float(values.get("4. close")),
-            "volume": float(values.get("5. volume", 0))
-        })
-    df = pd.DataFrame(rows).sort_values("ts").set_index("ts")
-    return df
-
 def av_daily_to_df(av_json):
     key = "Time Series (Daily)"
     if key not in av_json:
@@ -74,37 +52,27 @@ def av_daily_to_df(av_json):
 def fetch_from_alphavantage(symbol: str, interval: str = "5min"):
     if not ALPHAVANTAGE_KEY:
         return None, "no_key"
+    # intraday via historical_fetcher: cached on disk, so repeat runs do not spend API calls
+    df = fetch_ohlc(symbol, provider="alphavantage", period=None, interval=interval)
+    if df is not None and not df.empty:
+        return df, "alphavantage-intraday"
     base = "https://www.alphavantage.co/query"
-    params = {
-        "function": "TIME_SERIES_INTRADAY",
-        "symbol": symbol,
-        "interval": interval,
-        "apikey": ALPHAVANTAGE_KEY,
-        "outputsize": "compact"
-    }
     try:
-        r = requests.get(base, params=params, timeout=20)
-        j = r.json()
-        if "Note" in j or "Error Message" in j or not any("Time Series" in k for k in j.keys()):
-            # fallback to daily
-            r2 = requests.get(base, params={"function":"TIME_SERIES_DAILY_ADJUSTED","symbol":symbol,"apikey":ALPHAVANTAGE_KEY,"outputsize":"compact"}, timeout=20)
-            j2 = r2.json()
-            df2 = av_daily_to_df(j2)
-            if df2 is not None:
-                return df2, "alphavantage-daily"
-            return None, "av_error"
-        df = av_intraday_to_df(j, interval=interval)
-        return df, "alphavantage-intraday"
+        # fallback to daily
+        r2 = requests.get(base, params={"function":"TIME_SERIES_DAILY_ADJUSTED","symbol":symbol,"apikey":ALPHAVANTAGE_KEY,"outputsize":"compact"}, timeout=20)
+        j2 = r2.json()
+        df2 = av_daily_to_df(j2)
+        if df2 is not None:
+            return df2, "alphavantage-daily"
+        return None, "av_error"
     except Exception as e:
         return None, f"av_exception:{e}"
 
 def fetch_from_yfinance(symbol: str, period: str, interval: str):
     try:
-        t = yf.Ticker(symbol)
-        df = t.history(period=period, interval=interval, actions=False)
+        df = fetch_ohlc(symbol, provider="yfinance", period=period, interval=interval)
         if df is None or df.empty:
             return None
-        df = df.rename(columns={"Open":"open","High":"high","Low":"low","Close":"close","Volume":"volume"})
         df = df[["open","high","low","close","volume"]].copy()
         df.index = pd.to_datetime(df.index)
         return df
@@ -0,0 +1,80 @@
+# scripts/walk_forward_eval.py
+"""
+Nightly walk-forward evaluation of the RandomForest next-bar model for many symbols
+(app/services/walk_forward.py).
+
+Per symbol: fetch OHLC once (historical_fetcher), build / load the cached feature matrix, train
+and score the TimeSeriesSplit folds in parallel, and stitch the out-of-sample equity.
+
+Usage:
+  conda activate deep3d_py310
+  python scripts\walk_forward_eval.py --symbols RELIANCE.NS,TCS.NS --period 60d --interval 5m --folds 5
+
+Writes scripts/walk_forward_results.json (per-fold + aggregate metrics per symbol) and, with
+--equity, scripts/walk_forward_<symbol>_equity.csv.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from app.historical_fetcher import fetch_recent_ohlc
+from app.services.walk_forward import WALK_FORWARD_FOLDS, walk_forward
+
+OUT_DIR = Path("scripts")
+RESULT_JSON = OUT_DIR / "walk_forward_results.json"
+
+
+def main(args):
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
+    results = []
+    for sym in symbols:
+        start = time.time()
+        print(f"\n== {sym} ({args.period}, {args.interval})")
+        df = fetch_recent_ohlc(sym, provider_preference="yfinance", period=args.period, interval=args.interval)
+        if df is None or df.empty:
+            print("  no data")
+            results.append({"symbol": sym, "interval": args.interval, "success": False, "error": "no data"})
+            continue
+        res = walk_forward(df, sym, args.interval, n_folds=args.folds, threshold=args.prob_threshold,
+                           cost=args.fee + args.slip, n_estimators=args.n_estimators,
+                           max_train_size=args.max_train, gap=args.gap, workers=args.workers)
+        ts, equity = res.pop("ts", None), res.pop("equity", None)
+        res["elapsed_s"] = time.time() - start
+        results.append(res)
+
+        for f in res.get("folds", []):
+            print(f"  fold {f['fold']}: train {f['train_end'] - f['train_start']} test {f['test_end'] - f['test_start']} "
+                  f"auc={f['auc']} trades={f['n_trades']} ret={f['total_return']:.4f} sharpe={f['sharpe']}")
+        for e in res.get("errors", []):
+            print(f"  fold {e['fold']} FAILED: {e['error']}")
+        if "oos_bars" in res:
+            print(f"  OOS: bars={res['oos_bars']} trades={res['n_trades']} return={res['total_return']:.4f} "
+                  f"sharpe={res['sharpe']} max_dd={res['max_drawdown']:.4f} ({res['elapsed_s']:.1f}s)")
+
+        if args.equity and equity is not None and len(equity):
+            out = OUT_DIR / f"walk_forward_{sym.replace('/', '_')}_equity.csv"
+            pd.DataFrame({"equity": equity}, index=pd.to_datetime(ts, utc=True)).to_csv(out)
+
+    with open(RESULT_JSON, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print("\nSaved:", RESULT_JSON)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--symbols", default="RELIANCE.NS")
+    p.add_argument("--period", default="60d")
+    p.add_argument("--interval", default="5m")
+    p.add_argument("--folds", type=int, default=WALK_FORWARD_FOLDS)
+    p.add_argument("--prob-threshold", type=float, default=0.55)
+    p.add_argument("--fee", type=float, default=0.0005)
+    p.add_argument("--slip", type=float, default=0.0002)
+    p.add_argument("--n-estimators", type=int, default=100)
+    p.add_argument("--max-train", type=int, default=None, help="rolling window: cap on training bars per fold")
+    p.add_argument("--gap", type=int, default=0, help="bars skipped between train and test")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--equity", action="store_true", help="also write the stitched OOS equity per symbol")
+    main(p.parse_args())